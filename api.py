@@ -0,0 +1,300 @@
+import argparse
+import collections
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+import artifacts
+import cache
+import loader
+import queries
+import utils
+
+
+PORT = int(os.environ.get("AIRVIZ_API_PORT", "8502"))
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+# Latencies kept per endpoint for the percentiles in /metrics.
+LATENCY_WINDOW = 2048
+# Bounds of the `years` ahead a forecast may ask for.
+FORECAST_YEARS = (1, 30)
+
+logger = logging.getLogger("airviz.api")
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class NotFound(LookupError):
+    pass
+
+
+class EndpointMetrics:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self.counts = collections.defaultdict(collections.Counter)
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.counts[endpoint]["requests"] += 1
+            self.counts[endpoint][f"{status // 100}xx"] += 1
+
+    def summary(self):
+        with self.lock:
+            summary = {}
+            for endpoint, latencies in self.latencies.items():
+                p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+                summary[endpoint] = {**self.counts[endpoint], "p50 (ms)": p50, "p95 (ms)": p95, "p99 (ms)": p99}
+            return summary
+
+    def prometheus(self):
+        lines = [
+            "# HELP airviz_api_requests_total Requests served per endpoint and status class.",
+            "# TYPE airviz_api_requests_total counter",
+        ]
+        summary = self.summary()
+        for endpoint, stats in summary.items():
+            for status in ("2xx", "4xx", "5xx"):
+                lines.append(
+                    f'airviz_api_requests_total{{endpoint="{endpoint}",status="{status}"}} {stats.get(status, 0)}'
+                )
+        lines += [
+            f"# HELP airviz_api_latency_seconds Latency quantiles over the last {self.window} requests.",
+            "# TYPE airviz_api_latency_seconds summary",
+        ]
+        for endpoint, stats in summary.items():
+            for quantile in ("0.5", "0.95", "0.99"):
+                seconds = stats[f"p{round(float(quantile) * 100)} (ms)"] / 1000
+                lines.append(f'airviz_api_latency_seconds{{endpoint="{endpoint}",quantile="{quantile}"}} {seconds!r}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = EndpointMetrics()
+
+
+def _arg(query, name, default=None, cast=str):
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise BadRequest(f"missing query parameter {name!r}")
+        return default
+    try:
+        return cast(values[0])
+    except ValueError:
+        raise BadRequest(f"invalid value {values[0]!r} for {name!r}")
+
+
+def _data(name):
+    # The frames the pages use, loaded once per process and data version.
+    return loader.start().get(name)
+
+
+def _years(query, catalog):
+    return _arg(query, "start", catalog["years"][0], int), _arg(query, "end", catalog["years"][-1], int)
+
+
+def series(query):
+    df, version = _data("df"), utils.dataset_version(queries.CONC_PATH)
+    parameter = _arg(query, "parameter")
+    if "duration" in query:
+        duration = _arg(query, "duration")
+    else:
+        try:
+            duration = queries.sample_duration(df, parameter, version)
+        except ValueError as error:
+            raise BadRequest(str(error))
+    catalog = artifacts.get_artifact(df, queries.CONC_PATH, "catalog", version)
+    state, county = _arg(query, "state", "All"), _arg(query, "county", "All")
+    return queries.trend_series(df, parameter, duration, _years(query, catalog), state, county, version)
+
+
+def aqi_series(query):
+    df_aqi, version = _data("df_aqi"), utils.dataset_version(queries.AQI_PATH)
+    catalog = artifacts.get_artifact(df_aqi, queries.AQI_PATH, "catalog", version)
+    state, county = _arg(query, "state", "All"), _arg(query, "county", "All")
+    return queries.aqi_trend_series(df_aqi, _years(query, catalog), state, county, version)
+
+
+def _found(result):
+    if result.empty:
+        raise NotFound("no data for the given selection")
+    return result
+
+
+def choropleth(query):
+    df, version = _data("df"), utils.dataset_version(queries.CONC_PATH)
+    parameter = _arg(query, "parameter")
+    if parameter not in artifacts.get_artifact(df, queries.CONC_PATH, "catalog", version)["sample_durations"]:
+        raise BadRequest(f"unknown parameter {parameter!r}")
+    return _found(queries.concentration_by_state(df, parameter, _arg(query, "year", cast=int), version))
+
+
+def aqi_choropleth(query):
+    df_aqi, version = _data("df_aqi"), utils.dataset_version(queries.AQI_PATH)
+    column = _arg(query, "column", "Max AQI")
+    if column == "Year" or column not in df_aqi.select_dtypes(include=np.number).columns:
+        raise BadRequest(f"unknown column {column!r}")
+    return _found(queries.aqi_by_state(df_aqi, column, _arg(query, "year", cast=int), version))
+
+
+def _forecast(history, query, column):
+    # Like the Forecast page: fit on the years up to `end`, predict `years` ahead.
+    model = _arg(query, "model", "arima").lower()
+    if model not in ("arima", "prophet"):
+        raise BadRequest(f"unknown model {model!r}, expected arima or prophet")
+    pred_year = _arg(query, "years", 5, int)
+    if not FORECAST_YEARS[0] <= pred_year <= FORECAST_YEARS[1]:
+        raise BadRequest(f"years must be between {FORECAST_YEARS[0]} and {FORECAST_YEARS[1]}, got {pred_year}")
+    if history.empty:
+        raise NotFound("no data for the given selection")
+    end = _arg(query, "end", int(history["Year"].max()), int)
+    training_data = queries.forecast_frame(history[history["Year"] <= end], column)
+    if len(training_data) < 2:
+        raise BadRequest("fewer than 2 data points in the given range")
+    forecast = (queries.prophet_forecast if model == "prophet" else queries.arima_forecast)(training_data, pred_year)
+    return forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].reset_index(drop=True)
+
+
+def forecast(query):
+    return _forecast(series(query), query, "Arithmetic Mean")
+
+
+def aqi_forecast(query):
+    column = _arg(query, "column", "Median AQI")
+    if column not in artifacts.AQI_SERIES_AGGREGATION:
+        raise BadRequest(f"unknown column {column!r}, expected one of {list(artifacts.AQI_SERIES_AGGREGATION)}")
+    return _forecast(aqi_series(query), query, column)
+
+
+def catalog(query):
+    df, df_aqi = _data("df"), _data("df_aqi")
+    conc = artifacts.get_artifact(df, queries.CONC_PATH, "catalog", utils.dataset_version(queries.CONC_PATH))
+    aqi = artifacts.get_artifact(df_aqi, queries.AQI_PATH, "catalog", utils.dataset_version(queries.AQI_PATH))
+    return {
+        "parameters": {parameter: sorted(durations) for parameter, durations in conc["sample_durations"].items()},
+        "years": conc["years"],
+        "aqi_years": aqi["years"],
+        "states": {state: sorted(counties) for state, counties in conc["counties"].items()},
+        "aqi_states": {state: sorted(counties) for state, counties in aqi["counties"].items()},
+    }
+
+
+def metrics_report(query):
+    if _arg(query, "format", "json") == "prometheus":
+        return metrics.prometheus()
+    stats = cache.get_cache().stats()
+    return {"endpoints": metrics.summary(), "cache": json.loads(stats.to_json(orient="index"))}
+
+
+ENDPOINTS = {
+    "/series": series,
+    "/aqi/series": aqi_series,
+    "/choropleth": choropleth,
+    "/aqi/choropleth": aqi_choropleth,
+    "/forecast": forecast,
+    "/aqi/forecast": aqi_forecast,
+    "/catalog": catalog,
+    "/metrics": metrics_report,
+    "/health": lambda query: {"status": "ok"},
+}
+
+
+def encode(result, query, accept):
+    # Frames as JSON records, or as an Arrow IPC stream with ?format=arrow or an
+    # Accept header asking for one; other results as JSON, or text as is.
+    if isinstance(result, str):
+        return "text/plain; version=0.0.4", result.encode()
+    if isinstance(result, pd.DataFrame):
+        if _arg(query, "format", "json") == "arrow" or ARROW_TYPE in accept:
+            table = pa.Table.from_pandas(result, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return ARROW_TYPE, sink.getvalue().to_pybytes()
+        return "application/json", result.to_json(orient="records", date_format="iso").encode()
+    return "application/json", json.dumps(result, default=str).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "AirVizAPI/1.0"
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urllib.parse.urlsplit(self.path)
+        endpoint = url.path.rstrip("/") or "/"
+        query = urllib.parse.parse_qs(url.query)
+        status = 200
+        try:
+            if endpoint not in ENDPOINTS:
+                status, content_type, body = 404, "application/json", json.dumps({"error": "not found"}).encode()
+                endpoint = "unknown"
+            else:
+                content_type, body = encode(ENDPOINTS[endpoint](query), query, self.headers.get("Accept", ""))
+        except BadRequest as error:
+            status, content_type, body = 400, "application/json", json.dumps({"error": str(error)}).encode()
+        except NotFound as error:
+            status, content_type, body = 404, "application/json", json.dumps({"error": str(error)}).encode()
+        except Exception as error:
+            logger.exception("%s failed", self.path)
+            status, content_type = 500, "application/json"
+            body = json.dumps({"error": f"{type(error).__name__}: {error}"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if endpoint != "/metrics":
+            metrics.record(endpoint, time.perf_counter() - start, status)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def make_server(port=PORT, host="127.0.0.1"):
+    # One thread per request; the queries release the GIL in pandas/Arrow, and
+    # the query cache and the artifacts are shared by all of them.
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+@st.cache_resource
+def serve_in_background(port=PORT, host="127.0.0.1"):
+    # Embedded in the Streamlit server (see AIRVIZ_API_PORT in the Introduction
+    # page), the API shares its loaded data and caches with the pages.
+    server = make_server(port, host)
+    threading.Thread(target=server.serve_forever, name="api", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the AirViz series, choropleth and forecast queries over HTTP")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    logging.getLogger("streamlit.runtime.scriptrunner.script_run_context").setLevel(logging.ERROR)
+
+    loader.start()
+    server = make_server(args.port, args.host)
+    print(f"serving on http://{args.host}:{args.port} ({', '.join(ENDPOINTS)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+
+AQI_CATEGORIES = [
+    (0, 50, "Good"),
+    (51, 100, "Moderate"),
+    (101, 150, "Unhealthy for Sensitive Groups"),
+    (151, 200, "Unhealthy"),
+    (201, 300, "Very Unhealthy"),
+    (301, 500, "Hazardous"),
+]
+
+AQI_LOW = np.array([0, 51, 101, 151, 201, 301, 401], dtype=np.float64)
+AQI_HIGH = np.array([50, 100, 150, 200, 300, 400, 500], dtype=np.float64)
+
+# EPA breakpoints in the units of the annual_conc_by_monitor data (CO and Ozone
+# in ppm, SO2 and NO2 in ppb, particulates in µg/m³), together with the number
+# of decimals concentrations are truncated to before the lookup.
+BREAKPOINTS = {
+    "Carbon monoxide": {
+        "low": [0.0, 4.5, 9.5, 12.5, 15.5, 30.5, 40.5],
+        "high": [4.4, 9.4, 12.4, 15.4, 30.4, 40.4, 50.4],
+        "decimals": 1,
+    },
+    "Sulfur dioxide": {
+        "low": [0, 36, 76, 186, 305, 605, 805],
+        "high": [35, 75, 185, 304, 604, 804, 1004],
+        "decimals": 0,
+    },
+    "Nitrogen dioxide (NO2)": {
+        "low": [0, 54, 101, 361, 650, 1250, 1650],
+        "high": [53, 100, 360, 649, 1249, 1649, 2049],
+        "decimals": 0,
+    },
+    "Ozone": {
+        "low": [0.0, 0.055, 0.071, 0.086, 0.106, 0.201, 0.405],
+        "high": [0.054, 0.070, 0.085, 0.105, 0.200, 0.404, 0.604],
+        "decimals": 3,
+    },
+    "PM10 Total 0-10um STP": {
+        "low": [0, 55, 155, 255, 355, 425, 505],
+        "high": [54, 154, 254, 354, 424, 504, 604],
+        "decimals": 0,
+    },
+    "PM2.5 - Local Conditions": {
+        "low": [0.0, 12.1, 35.5, 55.5, 150.5, 250.5, 350.5],
+        "high": [12.0, 35.4, 55.4, 150.4, 250.4, 350.4, 500.4],
+        "decimals": 1,
+    },
+}
+BREAKPOINTS["Acceptable PM2.5 AQI & Speciation Mass"] = BREAKPOINTS["PM2.5 - Local Conditions"]
+
+AQI_PARAMETERS = list(BREAKPOINTS)
+
+
+def sub_index(parameter, concentrations):
+    table = BREAKPOINTS[parameter]
+    c_low = np.asarray(table["low"], dtype=np.float64)
+    c_high = np.asarray(table["high"], dtype=np.float64)
+    scale = 10.0 ** table["decimals"]
+
+    c = np.asarray(concentrations, dtype=np.float64)
+    # Truncate, don't round, as the EPA technical assistance document requires;
+    # the epsilon keeps 0.055 * 1000 from flooring to 54.
+    c = np.floor(np.clip(c, 0, None) * scale + 1e-9) / scale
+    # Beyond the top of the table the last segment is extrapolated.
+    bucket = np.minimum(np.searchsorted(c_high, c, side="left"), len(c_high) - 1)
+    slope = (AQI_HIGH[bucket] - AQI_LOW[bucket]) / (c_high[bucket] - c_low[bucket])
+    index = np.floor(slope * (c - c_low[bucket]) + AQI_LOW[bucket] + 0.5)
+    return np.where(np.isnan(c), np.nan, index)
+
+
+def compute_aqi(concentrations):
+    # `concentrations` maps parameter name -> array (a dict or a wide DataFrame);
+    # returns the overall AQI and the dominant parameter per row.
+    parameters = [p for p in concentrations if p in BREAKPOINTS]
+    if not parameters:
+        raise ValueError(f"no AQI parameters among {list(concentrations)}")
+    indices = np.column_stack([sub_index(p, concentrations[p]) for p in parameters])
+    available = ~np.isnan(indices).all(axis=1)
+    filled = np.where(np.isnan(indices), -np.inf, indices)
+    overall = np.where(available, filled.max(axis=1), np.nan)
+    dominant = np.where(available, np.array(parameters, dtype=object)[filled.argmax(axis=1)], None)
+    return overall, dominant
+
+
+def aqi_category(values):
+    values = np.asarray(values, dtype=np.float64)
+    labels = np.array([label for _, _, label in AQI_CATEGORIES] + ["Hazardous"], dtype=object)
+    bucket = np.searchsorted(np.array([high for _, high, _ in AQI_CATEGORIES]), values, side="left")
+    return np.where(np.isnan(values), None, labels[np.minimum(bucket, len(AQI_CATEGORIES) - 1)])
+
+
+def aqi_from_conc_by_monitor(df, value_column="Arithmetic Mean"):
+    # Adds an "AQI" column to long-format concentration rows (annual, daily or
+    # hourly layouts); rows for parameters without breakpoints get NaN.
+    result = np.full(len(df), np.nan)
+    parameter_names = df["Parameter Name"].to_numpy()
+    values = df[value_column].to_numpy(dtype=np.float64)
+    for parameter in np.intersect1d(pd.unique(parameter_names), AQI_PARAMETERS):
+        mask = parameter_names == parameter
+        result[mask] = sub_index(parameter, values[mask])
+    return df.assign(AQI=result)
@@ -0,0 +1,133 @@
+import functools
+import sys
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import correlation
+import snapshot
+import stats
+import store
+
+
+DATASET_COLUMNS = {
+    "annual_conc_by_monitor": {"state": "State Name", "county": "County Name", "group": "Parameter Name"},
+    "annual_aqi_by_county": {"state": "State", "county": "County", "group": "State"},
+}
+CONC_SERIES_AGGREGATION = {
+    "Arithmetic Mean": "mean",
+    "Arithmetic Standard Dev": "mean",
+    "1st Max Value": "max",
+}
+AQI_SERIES_AGGREGATION = {"Max AQI": "max", "Median AQI": "mean"}
+
+
+def build_summary(df, name):
+    return stats.summarize_frame(df)
+
+
+def build_correlation(df, name):
+    numerical_columns = list(df.select_dtypes(include=np.number).columns.values)
+    return correlation.GroupedCoMoments(numerical_columns, DATASET_COLUMNS[name]["group"]).update(df)
+
+
+def build_catalog(df, name):
+    columns = DATASET_COLUMNS[name]
+    catalog = {
+        "years": sorted(int(year) for year in df["Year"].unique()),
+        "counties": {state: set(counties) for state, counties in df.groupby(columns["state"])[columns["county"]]},
+    }
+    if "Parameter Name" in df.columns:
+        catalog["sample_durations"] = {
+            parameter: set(durations) for parameter, durations in df.groupby("Parameter Name")["Sample Duration"]
+        }
+    return catalog
+
+
+def merge_catalog(old, new):
+    merged = {"years": sorted(set(old["years"]) | set(new["years"]))}
+    for key in ("counties", "sample_durations"):
+        if key in new:
+            merged[key] = {k: set(v) for k, v in old.get(key, {}).items()}
+            for k, v in new[key].items():
+                merged[key].setdefault(k, set()).update(v)
+    return merged
+
+
+def build_state_year(df, name):
+    # State x Year maxima behind the choropleths on the Trends and AQI pages.
+    if name == "annual_conc_by_monitor":
+        return df.groupby(["Parameter Name", "State Name", "Year"])["Arithmetic Mean"].max().reset_index()
+    metrics = [column for column in df.select_dtypes(include=np.number).columns if column != "Year"]
+    return df.groupby(["State", "Year"])[metrics].max().reset_index()
+
+
+def build_yearly_series(df, name):
+    # Yearly aggregates at national, state and county level: the series the
+    # Trends and Forecast pages plot, so they only filter instead of grouping rows.
+    columns = DATASET_COLUMNS[name]
+    if name == "annual_conc_by_monitor":
+        keys, aggregation = ["Parameter Name", "Sample Duration"], CONC_SERIES_AGGREGATION
+    else:
+        keys, aggregation = [], AQI_SERIES_AGGREGATION
+    levels = {
+        "national": keys,
+        "state": keys + [columns["state"]],
+        "county": keys + [columns["state"], columns["county"]],
+    }
+    return {level: df.groupby(by + ["Year"], sort=False).agg(aggregation).reset_index() for level, by in levels.items()}
+
+
+def merge_by_year(old, new):
+    # Rows of different years never share a group, so the new year simply replaces its own rows.
+    if isinstance(old, dict):
+        return {key: merge_by_year(old[key], new[key]) for key in old}
+    return pd.concat([old[~old["Year"].isin(new["Year"].unique())], new], ignore_index=True)
+
+
+# Every artifact is mergeable, so appending a year only builds it over the new
+# rows and merges the result into what is already stored.
+ARTIFACTS = {
+    "summary": (build_summary, lambda old, new: old.merge(new)),
+    "correlation": (build_correlation, lambda old, new: old.merge(new)),
+    "catalog": (build_catalog, merge_catalog),
+    "state_year": (build_state_year, merge_by_year),
+    "yearly_series": (build_yearly_series, merge_by_year),
+}
+# The modules whose code builds the artifacts; stored artifacts are stamped with
+# their hash and rebuilt once any of them changes.
+CODE_MODULES = [sys.modules[__name__], stats, correlation]
+
+
+def artifact_name(name, kind):
+    return f"{name}_{kind}"
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    return store.modules_sha256(CODE_MODULES)
+
+
+@st.cache_data
+def get_artifact(_df, filepath, kind, version):
+    # The precomputed artifact when `python precompute.py` / `python ingest.py`
+    # built one for this dataset version, otherwise built from the loaded data.
+    name = store.dataset_name(filepath)
+    key = snapshot.artifact_key(artifact_name(name, kind), version)
+    artifact = snapshot.recall(key)
+    if artifact is None:
+        artifact = store.load_artifact(artifact_name(name, kind), version, code_version())
+    if artifact is None:
+        artifact = ARTIFACTS[kind][0](_df, name)
+    return snapshot.remember(key, artifact)
+
+
+def select_series(levels, state, county, state_column, county_column):
+    if state == "All":
+        return levels["national"]
+    if county == "All":
+        state_df = levels["state"]
+        return state_df[state_df[state_column] == state]
+    county_df = levels["county"]
+    return county_df[(county_df[state_column] == state) & (county_df[county_column] == county)]
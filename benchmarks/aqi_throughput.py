@@ -0,0 +1,48 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import aqi
+
+
+def random_concentrations(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    concentrations = {}
+    for parameter in aqi.AQI_PARAMETERS:
+        top = aqi.BREAKPOINTS[parameter]["high"][-1]
+        concentrations[parameter] = rng.gamma(2.0, top / 20, size=n_rows)
+    return pd.DataFrame(concentrations)
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure AQI calculator throughput in rows/second")
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    wide = random_concentrations(args.rows)
+    long = wide.melt(var_name="Parameter Name", value_name="Arithmetic Mean")
+
+    runs = {
+        "sub_index (Ozone)": (lambda: aqi.sub_index("Ozone", wide["Ozone"]), args.rows),
+        "compute_aqi (all parameters)": (lambda: aqi.compute_aqi(wide), args.rows),
+        "aqi_from_conc_by_monitor (long format)": (lambda: aqi.aqi_from_conc_by_monitor(long), len(long)),
+    }
+    for name, (fn, n_rows) in runs.items():
+        seconds = best_of(fn, args.repeat)
+        print(f"{name:<42} {n_rows:>12,} rows  {seconds:8.3f} s  {n_rows / seconds:>14,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
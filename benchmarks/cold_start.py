@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+CONC_PATH = "dataset/refined/annual_conc_by_monitor.parquet"
+AQI_PATH = "dataset/refined/annual_aqi_by_county.csv"
+
+
+def first_render():
+    # What a fresh server does before the Introduction page and the first map can
+    # render: import the app modules, load both datasets and the GeoJSON, and
+    # fetch the choropleth tables.
+    timings = {}
+    start = time.perf_counter()
+    import artifacts
+    import store
+    import utils
+
+    timings["import"] = time.perf_counter() - start
+    frames = {}
+    for name, step in {
+        CONC_PATH: lambda: utils.load_data(CONC_PATH),
+        AQI_PATH: lambda: utils.load_data(AQI_PATH),
+        store.GEOJSON_PATH: utils.load_geojson,
+    }.items():
+        step_start = time.perf_counter()
+        frames[name] = step()
+        timings[name] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
+    for path in (CONC_PATH, AQI_PATH):
+        artifacts.get_artifact(frames[path], path, "state_year", utils.dataset_version(path))
+    timings["choropleth tables"] = time.perf_counter() - step_start
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def run_child(use_snapshot):
+    env = dict(os.environ, AIRVIZ_SNAPSHOT="1" if use_snapshot else "0")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--child"], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure time-to-first-render of a fresh process, with and without the warm-start snapshot"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(first_render()))
+        return
+
+    import snapshot
+
+    if snapshot.load_snapshot() is None:
+        snapshot.save_snapshot()
+    results = {}
+    for mode, use_snapshot in (("files", False), ("snapshot", True)):
+        runs = [run_child(use_snapshot) for _ in range(args.repeat)]
+        results[mode] = {step: statistics.median(run[step] for run in runs) for step in runs[0]}
+
+    steps = list(results["files"])
+    width = max(len(step) for step in steps)
+    print(f"{'median seconds':<{width}} {'files':>10} {'snapshot':>10}")
+    for step in steps:
+        print(f"{step:<{width}} {results['files'][step]:10.3f} {results['snapshot'][step]:10.3f}")
+    print(f"time-to-first-render speedup: {results['files']['total'] / results['snapshot']['total']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
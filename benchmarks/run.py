@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import artifacts
+import queries
+import store
+
+
+CONC = "annual_conc_by_monitor"
+AQI = "annual_aqi_by_county"
+RESULTS_PATH = os.path.join(store.DERIVED_DIR, "benchmark_results.json")
+BASELINE_PATH = "benchmarks/baseline.json"
+MODELS = ["Linear Regressor", "Lasso Regressor", "Ridge Regressor"]
+FEATURES = ["Days CO", "Days NO2", "Days Ozone", "Days PM2.5", "Days PM10"]
+
+
+def scale_frame(df, name, factor, seed=0):
+    # `factor` copies of the data with jittered measurements. Copies of the
+    # monitor data become new monitors in the same counties, copies of the county
+    # data become new counties, so group cardinalities grow the way they would
+    # with more sites instead of only making each group longer.
+    if factor == 1:
+        return df
+    rng = np.random.default_rng(seed)
+    measurements = list(df.select_dtypes(include="floating").columns)
+    copies = []
+    for copy in range(factor):
+        scaled = df.copy()
+        if copy:
+            if name == CONC:
+                scaled["Site Num"] = scaled["Site Num"] + copy * 10_000
+            else:
+                scaled["County"] = scaled["County"].astype(str) + f" #{copy}"
+            scaled[measurements] = scaled[measurements] * rng.normal(1.0, 0.05, size=(len(df), len(measurements)))
+        copies.append(scaled)
+    return pd.concat(copies, ignore_index=True)
+
+
+def selection(df, state_column, county_column):
+    # The busiest state and its busiest county, so the filters select real rows.
+    state = df[state_column].value_counts().index[0]
+    county = df.loc[df[state_column] == state, county_column].value_counts().index[0]
+    return state, county
+
+
+def conc_cases(df):
+    # The Trends and Forecast pages filter the yearly series artifact, which is
+    # built from the rows on a cache miss; both are timed together, as a fresh
+    # dataset version pays for both.
+    parameter = df["Parameter Name"].value_counts().index[0]
+    state, county = selection(df, "State Name", "County Name")
+    years = (int(df["Year"].min()), int(df["Year"].max()))
+
+    def temporal_trends():
+        measurement_type = df.loc[df["Parameter Name"] == parameter, "Sample Duration"].iloc[0]
+        yearly_series = artifacts.build_yearly_series(df, CONC)
+        return queries.select_trend_series(yearly_series, parameter, measurement_type, years, state, county)
+
+    def forecast_series():
+        # extract_filtered_df on the Forecast page
+        measurement_types = df[df["Parameter Name"] == parameter]["Sample Duration"].unique()
+        measurement_type = "1 HOUR" if "1 HOUR" in measurement_types else measurement_types[0]
+        yearly_series = artifacts.build_yearly_series(df, CONC)
+        series = queries.select_trend_series(
+            yearly_series, parameter, measurement_type, (years[0], 2022), state, county
+        )
+        return series[["Year", "Arithmetic Mean"]]
+
+    def choropleth():
+        state_year = artifacts.build_state_year(df, CONC)
+        return queries.select_state_year(state_year, years[1], ["State Name", "Arithmetic Mean"], parameter)
+
+    return {
+        "conc.temporal_trends": temporal_trends,
+        "conc.forecast_series": forecast_series,
+        "conc.choropleth": choropleth,
+        "conc.eda_summary": lambda: artifacts.build_summary(df, CONC).describe(),
+        "conc.eda_correlation": lambda: artifacts.build_correlation(df, CONC).corr(parameter),
+    }
+
+
+def aqi_cases(df_aqi, models):
+    state, county = selection(df_aqi, "State", "County")
+    years = (int(df_aqi["Year"].min()), int(df_aqi["Year"].max()))
+
+    def forecast_series():
+        # extract_filtered_df_aqi on the Forecast page
+        yearly_series = artifacts.build_yearly_series(df_aqi, AQI)
+        return queries.select_aqi_trend_series(yearly_series, years, state, county)
+
+    def choropleth():
+        state_year = artifacts.build_state_year(df_aqi, AQI)
+        return queries.select_state_year(state_year, years[1], ["State", "Max AQI"])
+
+    cases = {
+        "aqi.forecast_series": forecast_series,
+        "aqi.choropleth": choropleth,
+        "aqi.eda_summary": lambda: artifacts.build_summary(df_aqi, AQI).describe(),
+        "aqi.eda_correlation": lambda: artifacts.build_correlation(df_aqi, AQI).corr(state),
+    }
+    for model_type in models:
+        cases[f"aqi.fit[{model_type}]"] = lambda model_type=model_type: queries.train_aqi_model(
+            df_aqi, model_type, FEATURES, 0.2
+        )
+    return cases
+
+
+def measure(fn, repeat):
+    # One traced call for the peak memory, which also warms up imports and
+    # caches, then `repeat` untraced calls for the latencies.
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median (s)": float(np.median(timings)),
+        "p95 (s)": float(np.percentile(timings, 95)),
+        "peak memory (MB)": peak / 2**20,
+        "repeat": repeat,
+    }
+
+
+def dataset_path(name, data_dir=None):
+    # The app's dataset, or `<name>.parquet`/`.csv` in `data_dir`, e.g. the output of synthetic.py.
+    if data_dir is None:
+        return store.DATASETS[name]
+    for extension in (".parquet", ".csv"):
+        path = os.path.join(data_dir, name + extension)
+        if os.path.exists(path):
+            return path
+    return os.path.join(data_dir, name + ".parquet")
+
+
+def run(scales, repeat, models, max_rows, data_dir=None):
+    datasets = {}
+    for name in (CONC, AQI):
+        path = dataset_path(name, data_dir)
+        if not os.path.exists(path):
+            print(f"skipping {name}: {path} not found")
+        elif data_dir is None:
+            datasets[name] = store.load_dataset(name)
+        else:
+            datasets[name] = store.read_file(path)
+    results = []
+    for factor in scales:
+        for name, df in datasets.items():
+            if len(df) * factor > max_rows:
+                print(f"skipping {name} at {factor}x: {len(df) * factor:,} rows is above --max-rows")
+                continue
+            scaled = scale_frame(df, name, factor)
+            cases = conc_cases(scaled) if name == CONC else aqi_cases(scaled, models)
+            for case, fn in cases.items():
+                result = {"case": case, "scale": factor, "rows": len(scaled), **measure(fn, repeat)}
+                print(
+                    f"{case:<36} {factor:>4}x {len(scaled):>12,} rows  median {result['median (s)']:8.3f} s"
+                    f"  p95 {result['p95 (s)']:8.3f} s  peak {result['peak memory (MB)']:9.1f} MB"
+                )
+                results.append(result)
+            del scaled, cases
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance, min_delta):
+    # A case regresses when its median latency or peak memory grew by more than
+    # `tolerance` (a fraction) over the baseline run at the same scale; latency
+    # changes under `min_delta` seconds are timer noise and never count.
+    previous = {(result["case"], result["scale"]): result for result in baseline["results"]}
+    regressions = []
+    print(f"\n{'compared to baseline':<36} {'scale':>5} {'median':>8} {'memory':>8}")
+    for result in report["results"]:
+        before = previous.get((result["case"], result["scale"]))
+        if before is None:
+            continue
+        ratios = {
+            metric: result[metric] / before[metric] if before[metric] else 1.0
+            for metric in ("median (s)", "peak memory (MB)")
+        }
+        regressed = [metric for metric, ratio in ratios.items() if ratio > 1 + tolerance]
+        if result["median (s)"] - before["median (s)"] < min_delta:
+            regressed = [metric for metric in regressed if metric != "median (s)"]
+        flag = "  REGRESSION" if regressed else ""
+        print(
+            f"{result['case']:<36} {result['scale']:>4}x {ratios['median (s)']:7.2f}x"
+            f" {ratios['peak memory (MB)']:7.2f}x{flag}"
+        )
+        regressions += [(result["case"], result["scale"], metric) for metric in regressed]
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the data path of every page outside Streamlit at scaled data sizes"
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--models", nargs="*", default=MODELS, help="Predict page models to fit")
+    parser.add_argument("--max-rows", type=int, default=50_000_000, help="skip scales above this many rows")
+    parser.add_argument("--data-dir", help="read the datasets from here instead, e.g. dataset/synthetic")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging, 0.25 = 25%%")
+    parser.add_argument("--min-delta", type=float, default=0.01, help="ignore slowdowns under this many seconds")
+    args = parser.parse_args()
+
+    report = run(args.scales, args.repeat, args.models, args.max_rows, args.data_dir)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.tolerance:.0%}")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import collections
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+
+MAX_BYTES = int(float(os.environ.get("AIRVIZ_CACHE_MB", "512")) * 2**20)
+COUNTERS = ["hits", "misses", "evictions", "expirations", "entries", "bytes"]
+# Trace attributes holding the per-point data, which is nearly all of a figure's size.
+FIGURE_ARRAYS = ["x", "y", "z", "lat", "lon", "locations", "text", "hovertext", "customdata", "ids"]
+
+
+def _figure_sizeof(fig):
+    # The data arrays of every trace and animation frame. Layout and a GeoJSON
+    # passed to choropleths are small or shared between figures, so left out.
+    # Frames are read as plain dicts: going through their trace objects costs
+    # more than the arrays they hold.
+    traces = [trace for frame in fig.frames for trace in frame.to_plotly_json().get("data", [])]
+    total = sum(sizeof(trace.get(attribute)) for trace in traces for attribute in FIGURE_ARRAYS)
+    for trace in fig.data:
+        total += sum(sizeof(trace[attribute]) for attribute in FIGURE_ARRAYS if attribute in trace)
+    return total
+
+
+def sizeof(value):
+    # Approximate in-memory size: exact for frames and arrays, estimated from the
+    # data arrays for figures and from the first item for long scalar sequences,
+    # pickled size otherwise.
+    if value is None:
+        return 0
+    if isinstance(value, (int, float, bool, np.generic)):
+        return 8
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, go.Figure):
+        return _figure_sizeof(value)
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        if value and isinstance(value[0], (int, float, str, np.generic)):
+            return len(value) * sizeof(value[0])
+        return sum(sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sum(sizeof(item) for item in value.values())
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def _token(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest = hashlib.sha256(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr(list(value.columns)).encode())
+        return ("frame", digest.hexdigest())
+    if isinstance(value, np.ndarray):
+        return ("array", value.dtype.str, value.shape, hashlib.sha256(value.tobytes()).hexdigest())
+    if isinstance(value, (list, tuple)):
+        return tuple(_token(item) for item in value)
+    if isinstance(value, dict):
+        return tuple((key, _token(item)) for key, item in sorted(value.items()))
+    return value
+
+
+class QueryCache:
+    # Thread-safe LRU over (namespace, key) with a global byte budget and optional
+    # per-entry TTL. Counters are kept per namespace so hosts can be sized from
+    # the hit rates and byte usage of each kind of result.
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.counters = collections.defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        self.bytes = 0
+        self.lock = threading.RLock()
+
+    def _drop(self, full_key, reason=None):
+        value, nbytes, expires = self.entries.pop(full_key)
+        counters = self.counters[full_key[0]]
+        if reason:
+            counters[reason] += 1
+        counters["entries"] -= 1
+        counters["bytes"] -= nbytes
+        self.bytes -= nbytes
+
+    def get(self, namespace, key):
+        # (True, value) on a hit, (False, None) on a miss or an expired entry.
+        full_key = (namespace, key)
+        with self.lock:
+            entry = self.entries.get(full_key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._drop(full_key, "expirations")
+                entry = None
+            if entry is None:
+                self.counters[namespace]["misses"] += 1
+                return False, None
+            self.entries.move_to_end(full_key)
+            self.counters[namespace]["hits"] += 1
+            return True, entry[0]
+
+    def put(self, namespace, key, value, ttl=None):
+        nbytes = sizeof(value)
+        full_key = (namespace, key)
+        with self.lock:
+            if full_key in self.entries:
+                self._drop(full_key)
+            if nbytes > self.max_bytes:
+                # Larger than the whole budget: serve it, but never keep it.
+                return value
+            while self.entries and self.bytes + nbytes > self.max_bytes:
+                self._drop(next(iter(self.entries)), "evictions")
+            expires = time.monotonic() + ttl if ttl is not None else None
+            self.entries[full_key] = (value, nbytes, expires)
+            self.counters[namespace]["entries"] += 1
+            self.counters[namespace]["bytes"] += nbytes
+            self.bytes += nbytes
+        return value
+
+    def get_or_compute(self, namespace, key, compute, ttl=None):
+        found, value = self.get(namespace, key)
+        if found:
+            return value
+        return self.put(namespace, key, compute(), ttl)
+
+    def clear(self, namespace=None):
+        with self.lock:
+            for full_key in [full_key for full_key in self.entries if namespace in (None, full_key[0])]:
+                self._drop(full_key)
+
+    def stats(self):
+        with self.lock:
+            stats = pd.DataFrame.from_dict(
+                {namespace: dict(c) for namespace, c in self.counters.items()}, orient="index"
+            )
+        if stats.empty:
+            return pd.DataFrame(columns=COUNTERS + ["hit rate"])
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit rate"] = (stats["hits"] / lookups.where(lookups > 0)).round(3)
+        return stats.sort_index()
+
+
+def resource(func=None, *, max_entries=None):
+    # st.cache_resource inside a running Streamlit server. Outside one (the API,
+    # benchmarks, command line tools) Streamlit does not keep cached values, so a
+    # plain per-process memo takes its place. Use as @resource or
+    # @resource(max_entries=n); `clear()` empties both.
+    if func is None:
+        return functools.partial(resource, max_entries=max_entries)
+    server_cached = st.cache_resource(max_entries=max_entries)(func)
+    process_cached = functools.lru_cache(maxsize=max_entries)(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if st.runtime.exists():
+            return server_cached(*args, **kwargs)
+        return process_cached(*args, **kwargs)
+
+    def clear():
+        server_cached.clear()
+        process_cached.cache_clear()
+
+    wrapper.clear = clear
+    return wrapper
+
+
+@resource
+def get_cache():
+    return QueryCache()
+
+
+def cached(namespace, ttl=None):
+    # Like st.cache_data: arguments whose name starts with an underscore are left
+    # out of the key, so callers pass large inputs as `_df` together with the
+    # dataset `version` they came from; results live in the shared QueryCache.
+    def decorator(func):
+        signature = inspect.signature(func)
+        origin = (func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = origin + tuple(
+                (name, _token(value)) for name, value in bound.arguments.items() if not name.startswith("_")
+            )
+            return get_cache().get_or_compute(namespace, key, lambda: func(*args, **kwargs), ttl)
+
+        return wrapper
+
+    return decorator
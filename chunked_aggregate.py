@@ -0,0 +1,226 @@
+import argparse
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import stats
+import utils
+
+
+# Column layouts of the EPA daily_* and hourly_* files. Hourly files have no
+# "Sample Duration" column (every row is one hour), so it is filled in. Daily
+# files repeat a day's row once per "Pollutant Standard" it is compared with,
+# so those are counted once per site, parameter, duration, POC and day.
+LAYOUTS = {
+    "daily": {"value": "Arithmetic Mean", "date": "Date Local", "constants": {}, "unique": ["POC", "Date Local"]},
+    "hourly": {
+        "value": "Sample Measurement",
+        "date": "Date Local",
+        "constants": {"Sample Duration": "1 HOUR"},
+        "unique": [],
+    },
+}
+GROUP_COLUMNS = utils.site_columns + ["Parameter Name", "Sample Duration"]
+ATTRIBUTE_COLUMNS = utils.site_attributes + ["Units of Measure"]
+PERCENTILES = [10, 50, 75, 90, 95, 98, 99]
+
+
+def detect_layout(path):
+    header = pd.read_csv(path, nrows=0).columns
+    for layout, columns in LAYOUTS.items():
+        if columns["value"] in header:
+            return layout
+    raise ValueError(f"{path} is neither a daily nor an hourly EPA file")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def read_columns(layout):
+    spec = LAYOUTS[layout]
+    columns = GROUP_COLUMNS + ATTRIBUTE_COLUMNS + [spec["value"], spec["date"]] + spec["unique"]
+    return [column for column in dict.fromkeys(columns) if column not in spec["constants"]]
+
+
+class StreamingAggregator:
+    # Keeps only per-(group, month) partial moments and sketch bucket counts, never
+    # raw rows. Partials from successive chunks are compacted whenever they grow
+    # past `compact_rows`, so memory is bounded by the number of groups, not rows.
+    def __init__(self, relative_accuracy=0.01, compact_rows=2_000_000):
+        self.sketch = stats.QuantileSketch(relative_accuracy)
+        self.compact_rows = compact_rows
+        self.keys = GROUP_COLUMNS + ["Year", "Month"]
+        self.moments = []
+        self.buckets = []
+        self.attributes = []
+        self.rows = 0
+        self.last_row = None
+
+    def _drop_repeats(self, chunk, keys):
+        repeated = chunk.duplicated(keys).to_numpy()
+        # The repeats of a day are on adjacent rows, which may straddle two chunks.
+        if self.last_row is not None:
+            repeated = repeated | (chunk[keys] == self.last_row).all(axis=1).to_numpy()
+        self.last_row = chunk[keys].iloc[-1]
+        return chunk[~repeated]
+
+    def update(self, chunk, layout):
+        spec = LAYOUTS[layout]
+        self.rows += len(chunk)
+        chunk = chunk.assign(**spec["constants"])
+        if spec["unique"]:
+            chunk = self._drop_repeats(chunk, GROUP_COLUMNS + spec["unique"])
+        dates = pd.to_datetime(chunk[spec["date"]], format="%Y-%m-%d")
+        values = chunk[spec["value"]].to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        frame = chunk.loc[present, GROUP_COLUMNS].assign(
+            Year=dates.dt.year[present], Month=dates.dt.month[present], value=values[present]
+        )
+
+        grouped = frame.groupby(self.keys, sort=False, dropna=False)["value"]
+        partial = grouped.agg(["count", "mean", "max"])
+        partial["m2"] = grouped.var(ddof=0).to_numpy() * partial["count"].to_numpy()
+        self.moments.append(partial.reset_index())
+
+        signs = np.sign(frame["value"].to_numpy()).astype(np.int8)
+        bucket_keys = np.zeros(len(frame), dtype=np.int64)
+        nonzero = signs != 0
+        bucket_keys[nonzero] = self.sketch.bucket_keys(np.abs(frame["value"].to_numpy()[nonzero]))
+        self.buckets.append(
+            frame[self.keys]
+            .assign(sign=signs, bucket=bucket_keys)
+            .groupby(self.keys + ["sign", "bucket"], sort=False, dropna=False)
+            .size()
+            .rename("n")
+            .reset_index()
+        )
+        self.attributes.append(chunk.groupby(GROUP_COLUMNS, sort=False, dropna=False)[ATTRIBUTE_COLUMNS].first())
+
+        if sum(len(part) for part in self.moments + self.buckets) > self.compact_rows:
+            self.compact()
+        return self
+
+    def _merge_moments(self, moments, keys):
+        # Chan et al. merge of (count, mean, M2, max) over all partials of each group.
+        moments = moments.assign(weighted=moments["mean"] * moments["count"])
+        totals = moments.groupby(keys, sort=False, dropna=False).agg(
+            count=("count", "sum"), weighted=("weighted", "sum"), max=("max", "max")
+        )
+        totals["mean"] = totals["weighted"] / totals["count"]
+        group_mean = moments.merge(totals["mean"].rename("group_mean").reset_index(), on=keys, how="left")
+        spread = moments["m2"] + moments["count"] * (moments["mean"] - group_mean["group_mean"].to_numpy()) ** 2
+        totals["m2"] = spread.groupby([moments[key] for key in keys], sort=False, dropna=False).sum()
+        return totals.drop(columns="weighted").reset_index()
+
+    def _merge_buckets(self, buckets, keys):
+        return buckets.groupby(keys + ["sign", "bucket"], sort=False, dropna=False)["n"].sum().reset_index()
+
+    def compact(self):
+        if len(self.moments) > 1:
+            self.moments = [self._merge_moments(pd.concat(self.moments, ignore_index=True), self.keys)]
+        if len(self.buckets) > 1:
+            self.buckets = [self._merge_buckets(pd.concat(self.buckets, ignore_index=True), self.keys)]
+        if len(self.attributes) > 1:
+            attributes = pd.concat(self.attributes)
+            self.attributes = [attributes[~attributes.index.duplicated()]]
+
+    def _percentiles(self, buckets, keys):
+        buckets = self._merge_buckets(buckets, keys)
+        signs = buckets["sign"].to_numpy()
+        buckets["value"] = np.where(signs == 0, 0.0, signs * self.sketch.bucket_value(buckets["bucket"].to_numpy()))
+        buckets = buckets.sort_values(keys + ["value"], kind="stable").reset_index(drop=True)
+        grouped = buckets.groupby(keys, sort=False, dropna=False)["n"]
+        cumulative = grouped.cumsum().to_numpy()
+        total = grouped.transform("sum").to_numpy()
+        columns = []
+        for percentile in PERCENTILES:
+            # First bucket whose cumulative count passes the target rank, as in stats.QuantileSketch.
+            selected = buckets.loc[cumulative > percentile / 100 * (total - 1), keys + ["value"]]
+            first = selected.groupby(keys, sort=False, dropna=False)["value"].first()
+            columns.append(first.rename(f"{percentile}th Percentile"))
+        return pd.concat(columns, axis=1).reset_index()
+
+    def result(self, by_month=True):
+        # Annual results come from merging the monthly partials, which is exact
+        # for the moments and for the sketch bucket counts alike.
+        self.compact()
+        keys = self.keys if by_month else GROUP_COLUMNS + ["Year"]
+        if not self.moments:
+            return pd.DataFrame(columns=keys)
+        moments = self._merge_moments(self.moments[0], keys)
+        count = moments["count"].to_numpy()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.where(count > 1, np.sqrt(moments["m2"].to_numpy() / (count - 1)), np.nan)
+        summary = moments[keys].assign(
+            **{
+                "Observation Count": count.astype(np.int64),
+                "Arithmetic Mean": moments["mean"].to_numpy(),
+                "Arithmetic Standard Dev": std,
+                "1st Max Value": moments["max"].to_numpy(),
+            }
+        )
+        summary = summary.merge(self._percentiles(self.buckets[0], keys), on=keys, how="left")
+        summary = summary.merge(self.attributes[0].reset_index(), on=GROUP_COLUMNS, how="left")
+        return summary.sort_values(keys).reset_index(drop=True)
+
+
+def aggregate_files(paths, chunksize=500_000, relative_accuracy=0.01):
+    aggregator = StreamingAggregator(relative_accuracy)
+    report = []
+    for path in paths:
+        layout = detect_layout(path)
+        # Repeats only straddle chunks of the same file.
+        aggregator.last_row = None
+        start = time.perf_counter()
+        rows_before = aggregator.rows
+        for chunk in pd.read_csv(path, usecols=read_columns(layout), chunksize=chunksize, low_memory=False):
+            aggregator.update(chunk, layout)
+        seconds = time.perf_counter() - start
+        rows = aggregator.rows - rows_before
+        report.append(
+            {
+                "file": path,
+                "layout": layout,
+                "rows": rows,
+                "seconds": seconds,
+                "rows_per_second": rows / seconds if seconds else float("nan"),
+                "peak_rss_mb": peak_rss_mb(),
+            }
+        )
+    return aggregator.result(by_month=False), aggregator.result(by_month=True), pd.DataFrame(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Aggregate EPA daily/hourly CSVs into annual and monthly tables in bounded memory"
+    )
+    parser.add_argument("paths", nargs="+", help="daily_*.csv / hourly_*.csv files (or their .zip archives)")
+    parser.add_argument("--output-dir", default="dataset/refined")
+    parser.add_argument("--prefix", default="aggregated_conc_by_monitor")
+    parser.add_argument("--chunksize", type=int, default=500_000)
+    parser.add_argument("--relative-accuracy", type=float, default=0.01, help="percentile sketch accuracy")
+    args = parser.parse_args()
+
+    annual, monthly, report = aggregate_files(args.paths, args.chunksize, args.relative_accuracy)
+    os.makedirs(args.output_dir, exist_ok=True)
+    annual.to_parquet(os.path.join(args.output_dir, f"{args.prefix}_annual.parquet"), index=False)
+    monthly.to_parquet(os.path.join(args.output_dir, f"{args.prefix}_monthly.parquet"), index=False)
+
+    print(report.to_string(index=False))
+    total_rows = report["rows"].sum()
+    total_seconds = report["seconds"].sum()
+    print(
+        f"{total_rows:,} rows in {total_seconds:.1f} s ({total_rows / total_seconds:,.0f} rows/s), "
+        f"peak RSS {peak_rss_mb():.0f} MB -> {len(annual):,} annual / {len(monthly):,} monthly rows"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+class CoMoments:
+    # Pairwise-complete co-moment accumulator, matching DataFrame.corr(): every
+    # (i, j) cell only sees rows where both columns are present. Sums are kept
+    # relative to a per-column shift for numerical stability, and two
+    # accumulators merge by rebasing onto the same shift and adding.
+    def __init__(self, columns):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.shift = None
+        self.n = np.zeros((k, k))
+        self.sx = np.zeros((k, k))
+        self.sxx = np.zeros((k, k))
+        self.sxy = np.zeros((k, k))
+
+    def update(self, df):
+        values = df[self.columns].to_numpy(dtype=np.float64)
+        if values.shape[0] == 0:
+            return self
+        if self.shift is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                self.shift = np.nan_to_num(np.nanmean(values, axis=0))
+        values = values - self.shift
+        present = ~np.isnan(values)
+        mask = present.astype(np.float64)
+        filled = np.where(present, values, 0.0)
+        self.n += mask.T @ mask
+        self.sx += filled.T @ mask
+        self.sxx += (filled**2).T @ mask
+        self.sxy += filled.T @ filled
+        return self
+
+    def _rebased(self, shift):
+        d = self.shift - shift
+        sx = self.sx + d[:, None] * self.n
+        sxx = self.sxx + 2 * d[:, None] * self.sx + d[:, None] ** 2 * self.n
+        sxy = self.sxy + d[None, :] * self.sx + d[:, None] * self.sx.T + np.outer(d, d) * self.n
+        return sx, sxx, sxy
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError("cannot merge co-moments over different columns")
+        if other.shift is None:
+            return self
+        if self.shift is None:
+            self.shift = other.shift.copy()
+        sx, sxx, sxy = other._rebased(self.shift)
+        self.n += other.n
+        self.sx += sx
+        self.sxx += sxx
+        self.sxy += sxy
+        return self
+
+    def corr(self, min_periods=1):
+        with np.errstate(all="ignore"):
+            cov = self.sxy - self.sx * self.sx.T / self.n
+            var = self.sxx - self.sx**2 / self.n
+            result = np.clip(cov / np.sqrt(var * var.T), -1, 1)
+        valid = (self.n >= max(min_periods, 2)) & (var > 0) & (var.T > 0)
+        result = np.where(valid, result, np.nan)
+        np.fill_diagonal(result, np.where(np.diag(valid), 1.0, np.nan))
+        return pd.DataFrame(result, index=self.columns, columns=self.columns)
+
+
+class GroupedCoMoments:
+    # One accumulator per group (e.g. per "Parameter Name" or per "State Name")
+    # plus the overall one, all fed by the same pass over each chunk.
+    def __init__(self, columns, by=None):
+        self.columns = list(columns)
+        self.by = by
+        self.total = CoMoments(self.columns)
+        self.groups = {}
+
+    def update(self, df):
+        self.total.update(df)
+        if self.by is not None:
+            for key, group in df.groupby(self.by, sort=False):
+                if key not in self.groups:
+                    self.groups[key] = CoMoments(self.columns)
+                self.groups[key].update(group)
+        return self
+
+    def merge(self, other):
+        self.total.merge(other.total)
+        for key, moments in other.groups.items():
+            if key not in self.groups:
+                self.groups[key] = CoMoments(self.columns)
+            self.groups[key].merge(moments)
+        return self
+
+    def corr(self, group=None):
+        if group is None:
+            return self.total.corr()
+        if group not in self.groups:
+            return CoMoments(self.columns).corr()
+        return self.groups[group].corr()
+
+
+def correlation_from_chunks(chunks, columns, by=None):
+    # Works with pd.read_csv(..., chunksize=...), parquet row groups, or one frame per year.
+    moments = GroupedCoMoments(columns, by)
+    for chunk in chunks:
+        moments.update(chunk)
+    return moments
@@ -0,0 +1,83 @@
+import argparse
+import os
+import time
+
+import artifacts
+import store
+
+
+def load_artifacts(name):
+    version = store.dataset_version(store.DATASETS[name])
+    loaded = {
+        kind: store.load_artifact(artifacts.artifact_name(name, kind), version, artifacts.code_version())
+        for kind in artifacts.ARTIFACTS
+    }
+    missing = [kind for kind, artifact in loaded.items() if artifact is None]
+    if missing:
+        # First run (or the base file was replaced): one full build, after which
+        # every ingest is incremental again.
+        full_df = store.load_dataset(name)
+        for kind in missing:
+            loaded[kind] = artifacts.ARTIFACTS[kind][0](full_df, name)
+    return loaded
+
+
+def ingest(name, source_path, year=None):
+    timings = {}
+    start = time.perf_counter()
+    base_path = store.DATASETS[name]
+    new_df = store.read_file(source_path)
+    if year is not None:
+        new_df = new_df[new_df["Year"] == year]
+    years = new_df["Year"].unique()
+    if len(years) != 1:
+        raise ValueError(f"expected exactly one year in {source_path}, found {sorted(years)}")
+    year = int(years[0])
+    expected_columns = store.file_columns(base_path)
+    if list(new_df.columns) != expected_columns:
+        raise ValueError(f"{source_path} does not match the columns of {base_path}")
+    timings["read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    derived = load_artifacts(name)
+    if year in derived["catalog"]["years"]:
+        raise ValueError(f"{year} is already part of {name}; ingest only appends new years")
+    timings["load artifacts"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for kind, (build, merge) in artifacts.ARTIFACTS.items():
+        derived[kind] = merge(derived[kind], build(new_df, name))
+    timings["update artifacts"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    os.makedirs(store.partition_dir(name), exist_ok=True)
+    path = store.partition_path(name, year)
+    store.write_file(new_df, path)
+    manifest = store.read_manifest()
+    entry = manifest["datasets"].setdefault(name, {"revision": 0, "partitions": {}})
+    entry["partitions"][str(year)] = {"path": path, "rows": len(new_df), "sha256": store.file_sha256(path)}
+    entry["revision"] += 1
+    store.write_manifest(manifest)
+    # Stamp the updated artifacts with the new version; the pages' caches and any
+    # forecasts keyed on it are recomputed lazily on the next visit.
+    version = store.dataset_version(base_path)
+    for kind, artifact in derived.items():
+        store.save_artifact(artifacts.artifact_name(name, kind), artifact, version, artifacts.code_version())
+    timings["write"] = time.perf_counter() - start
+    return year, len(new_df), version, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append one year of EPA data to a refined dataset")
+    parser.add_argument("dataset", choices=list(store.DATASETS))
+    parser.add_argument("path", help="CSV or parquet file with the refined schema for a single year")
+    parser.add_argument("--year", type=int, help="only ingest this year from the file")
+    args = parser.parse_args()
+    year, rows, version, timings = ingest(args.dataset, args.path, args.year)
+    print(f"Appended {rows:,} rows for {year} to {args.dataset} (dataset version {version})")
+    for step, seconds in timings.items():
+        print(f"  {step:<18} {seconds:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
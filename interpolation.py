@@ -0,0 +1,175 @@
+import argparse
+import base64
+import io
+import json
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import streamlit as st
+
+import spatial_index
+import tensor_store
+import utils
+
+
+DEFAULT_PATH = "dataset/derived/idw_surfaces"
+# Contiguous US, (min_lon, min_lat, max_lon, max_lat).
+DEFAULT_BOUNDS = (-125.0, 24.0, -66.0, 50.0)
+
+
+def grid_coordinates(bounds=DEFAULT_BOUNDS, resolution=0.25):
+    min_lon, min_lat, max_lon, max_lat = bounds
+    lons = np.arange(min_lon + resolution / 2, max_lon, resolution)
+    lats = np.arange(min_lat + resolution / 2, max_lat, resolution)
+    return lats, lons
+
+
+def idw_surface(site_index, values, bounds=DEFAULT_BOUNDS, resolution=0.25, k=8, power=2, max_distance_km=250):
+    # Inverse-distance weighting of per-site `values` (aligned with site_index.sites)
+    # onto a lat/lon grid; cells with no monitor within max_distance_km stay NaN.
+    lats, lons = grid_coordinates(bounds, resolution)
+    grid_lat, grid_lon = np.meshgrid(lats, lons, indexing="ij")
+    distances, positions = site_index.nearest_batch(grid_lat.ravel(), grid_lon.ravel(), k)
+    neighbour_values = np.asarray(values, dtype=np.float64)[positions]
+    weights = 1.0 / np.maximum(distances, 1e-6) ** power
+    weights[(distances > max_distance_km) | np.isnan(neighbour_values)] = 0.0
+    with np.errstate(invalid="ignore"):
+        surface = (weights * np.nan_to_num(neighbour_values)).sum(axis=1) / weights.sum(axis=1)
+    return surface.reshape(grid_lat.shape).astype(np.float32)
+
+
+def site_values(filtered_df, column="Arithmetic Mean"):
+    # Per-site mean in the same (sorted) order SiteIndex uses for its sites.
+    return filtered_df.groupby(utils.site_columns, sort=True)[column].mean().to_numpy()
+
+
+def build_surfaces(df, path=DEFAULT_PATH, bounds=DEFAULT_BOUNDS, resolution=0.25, k=8, power=2, max_distance_km=250):
+    df = df[df["Parameter Name"].isin(utils.params)]
+    durations = tensor_store.preferred_sample_durations(df)
+    df = df[df["Sample Duration"].to_numpy() == df["Parameter Name"].map(durations).to_numpy()]
+    groups = [(key, group) for key, group in df.groupby(["Parameter Name", "Year"], sort=True)]
+
+    lats, lons = grid_coordinates(bounds, resolution)
+    os.makedirs(path, exist_ok=True)
+    surfaces = np.lib.format.open_memmap(
+        os.path.join(path, "surfaces.npy"), mode="w+", dtype=np.float32, shape=(len(groups), len(lats), len(lons))
+    )
+    keys = []
+    for i, ((parameter, year), group) in enumerate(groups):
+        surfaces[i] = idw_surface(
+            spatial_index.SiteIndex(group), site_values(group), bounds, resolution, k, power, max_distance_km
+        )
+        keys.append([parameter, int(year)])
+    surfaces.flush()
+    del surfaces
+
+    index = {
+        "keys": keys,
+        "bounds": list(bounds),
+        "resolution": resolution,
+        "k": k,
+        "power": power,
+        "max_distance_km": max_distance_km,
+    }
+    with open(os.path.join(path, "index.json"), "w") as index_file:
+        json.dump(index, index_file)
+    return SurfaceStore(path)
+
+
+class SurfaceStore:
+    def __init__(self, path=DEFAULT_PATH):
+        with open(os.path.join(path, "index.json")) as index_file:
+            index = json.load(index_file)
+        self.bounds = tuple(index["bounds"])
+        self.resolution = index["resolution"]
+        self.positions = {(parameter, year): i for i, (parameter, year) in enumerate(index["keys"])}
+        self.surfaces = np.load(os.path.join(path, "surfaces.npy"), mmap_mode="r")
+
+    def get(self, parameter, year):
+        position = self.positions.get((parameter, int(year)))
+        return None if position is None else self.surfaces[position]
+
+
+@st.cache_resource
+def get_surface_store(path, version):
+    return SurfaceStore(path)
+
+
+def mercator_y(lats):
+    return np.log(np.tan(np.pi / 4 + np.radians(lats) / 2))
+
+
+def mercator_rows(surface, bounds):
+    # The grid rows are uniform in latitude, but mapbox stretches an image
+    # source linearly in Web Mercator: resample the rows (nearest row, so empty
+    # cells stay empty) onto rows uniform in Mercator y, south to north.
+    min_lon, min_lat, max_lon, max_lat = bounds
+    rows = surface.shape[0]
+    y = np.linspace(mercator_y(min_lat), mercator_y(max_lat), rows + 1)
+    y = (y[:-1] + y[1:]) / 2
+    lats = np.degrees(2 * np.arctan(np.exp(y)) - np.pi / 2)
+    source = np.floor((lats - min_lat) / (max_lat - min_lat) * rows).astype(int)
+    return surface[np.clip(source, 0, rows - 1)]
+
+
+def surface_image_layer(surface, bounds, cmap="Reds", opacity=0.6):
+    # Mapbox raster layer: the grid is rendered to a PNG and shipped as an
+    # image source, so the browser never receives per-cell data.
+    min_lon, min_lat, max_lon, max_lat = bounds
+    colormap = plt.get_cmap(cmap).copy()
+    colormap.set_bad(alpha=0.0)
+    masked = np.ma.masked_invalid(np.flipud(mercator_rows(surface, bounds)))
+    buffer = io.BytesIO()
+    if masked.count():
+        vmin, vmax = np.percentile(masked.compressed(), [2, 98])
+    else:
+        vmin, vmax = 0.0, 1.0
+    plt.imsave(buffer, masked, cmap=colormap, vmin=vmin, vmax=vmax, format="png")
+    return {
+        "sourcetype": "image",
+        "source": "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii"),
+        "coordinates": [[min_lon, max_lat], [max_lon, max_lat], [max_lon, min_lat], [min_lon, min_lat]],
+        "opacity": opacity,
+        "below": "",
+    }
+
+
+@st.cache_data
+def get_surface_layer(path, version, parameter, year):
+    # Rendered once per (parameter, year, surface version) rather than per rerun.
+    surface_store = get_surface_store(path, version)
+    surface = surface_store.get(parameter, year)
+    return None if surface is None else surface_image_layer(surface, surface_store.bounds)
+
+
+def load_surface_layer(parameter, year, path=DEFAULT_PATH):
+    # None when the surfaces are not built yet or have no entry for the selection.
+    index_path = os.path.join(path, "index.json")
+    if not os.path.exists(index_path):
+        return None
+    return get_surface_layer(path, utils.dataset_version(index_path), parameter, int(year))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute IDW concentration surfaces per (parameter, year)")
+    parser.add_argument("--input", default="dataset/refined/annual_conc_by_monitor.parquet")
+    parser.add_argument("--output", default=DEFAULT_PATH)
+    parser.add_argument("--resolution", type=float, default=0.25, help="grid cell size in degrees")
+    parser.add_argument("--k", type=int, default=8, help="neighbouring monitors per cell")
+    parser.add_argument("--power", type=float, default=2)
+    parser.add_argument("--max-distance-km", type=float, default=250)
+    args = parser.parse_args()
+    store = build_surfaces(
+        utils.load_data(args.input),
+        args.output,
+        resolution=args.resolution,
+        k=args.k,
+        power=args.power,
+        max_distance_km=args.max_distance_km,
+    )
+    print(f"{len(store.positions)} surfaces of {store.surfaces.shape[1]}x{store.surfaces.shape[2]} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
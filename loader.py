@@ -0,0 +1,93 @@
+import concurrent.futures
+import time
+
+import pandas as pd
+import streamlit as st
+
+import cache
+import profiling
+import utils
+
+
+CONC_PATH = "dataset/refined/annual_conc_by_monitor.parquet"
+AQI_PATH = "dataset/refined/annual_aqi_by_county.csv"
+
+# Session-state name -> loader of every resource the pages need at startup.
+RESOURCES = {
+    "df": lambda: utils.load_data(CONC_PATH),
+    "df_aqi": lambda: utils.load_data(AQI_PATH),
+    "geojson_data": utils.load_geojson,
+}
+
+
+class Loader:
+    # Starts every resource on its own worker thread as soon as it is created;
+    # Parquet/Arrow decoding and file reads release the GIL, so the loads overlap
+    # each other and the rendering of the page that started them.
+    def __init__(self, resources=RESOURCES):
+        self.created = time.perf_counter()
+        self.records = {name: {"resource": name} for name in resources}
+        # Profiled calls made while loading, handed to the first session that takes each resource.
+        self.calls = {}
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(resources), thread_name_prefix="loader")
+        self.futures = {name: executor.submit(self._timed, name, load) for name, load in resources.items()}
+        executor.shutdown(wait=False)
+
+    def _timed(self, name, load):
+        record = self.records[name]
+        start = time.perf_counter()
+        record["started (s)"] = start - self.created
+        try:
+            with profiling.collecting() as calls:
+                result = load()
+            self.calls[name] = calls
+            return result
+        finally:
+            record["finished (s)"] = time.perf_counter() - self.created
+            record["load (s)"] = time.perf_counter() - start
+
+    def done(self, name):
+        return self.futures[name].done()
+
+    def get(self, name):
+        start = time.perf_counter()
+        result = self.futures[name].result()
+        record = self.records[name]
+        record["waited (s)"] = record.get("waited (s)", 0.0) + time.perf_counter() - start
+        return result
+
+    def failed(self):
+        return any(future.done() and future.exception() is not None for future in self.futures.values())
+
+    def take_calls(self, name):
+        return self.calls.pop(name, [])
+
+    def timings(self):
+        return pd.DataFrame(list(self.records.values())).set_index("resource")
+
+
+# Only the loader of the current data version is kept: the one it replaces,
+# with its datasets, is released.
+@cache.resource(max_entries=1)
+def get_loader(versions):
+    return Loader()
+
+
+def start():
+    # One loader per server and data version: later sessions reuse its results,
+    # and an ingested year or replaced file starts a fresh one. A load that
+    # failed is retried by the next session rather than failing all of them.
+    versions = (utils.dataset_version(CONC_PATH), utils.dataset_version(AQI_PATH))
+    loader = get_loader(versions)
+    if loader.failed():
+        get_loader.clear()
+        loader = get_loader(versions)
+    return loader
+
+
+def session_resource(name):
+    if name not in st.session_state:
+        loader = start()
+        st.session_state[name] = loader.get(name)
+        profiling.extend(loader.take_calls(name))
+    return st.session_state[name]
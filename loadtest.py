@@ -0,0 +1,252 @@
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import random
+import resource
+import threading
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.testing.v1 import AppTest
+
+
+# Scripted interactions per page: (widget type, key or label, new value, which
+# of the widgets matching the key/label). Every session opens the page and then
+# applies the steps in order, one rerun each, the way a user explores it.
+SCENARIOS = {
+    "🌍_Introduction.py": [
+        ("selectbox", "**Select a parameter to learn more about**", "Ozone", 0),
+    ],
+    "pages/1_📊_EDA.py": [
+        ("selectbox", "tab_conc1_param", "Ozone", 0),
+        ("selectbox", "tab_conc4_col4", "Arithmetic Standard Dev", 0),
+        ("selectbox", "tab_aqi1_state", "California", 0),
+    ],
+    "pages/2_📈_Trends.py": [
+        ("selectbox", "Select the Parameter to visualize", "PM2.5 - Local Conditions", 0),
+        ("slider", "Select a year", 2010, 0),
+        ("selectbox", "Select State", "California", 0),
+        ("checkbox", "idw_overlay", True, 0),
+    ],
+    "pages/3_🏭_AQI.py": [
+        ("selectbox", "state2", "California", 0),
+        ("slider", "year2", 2015, 0),
+        ("selectbox", "Choose attibute to plot", "Median AQI", 1),
+        ("checkbox", "hiplot_downsample", True, 0),
+    ],
+    "pages/4_🔎_Forecast.py": [
+        ("selectbox", "Choose model", "Arima", 0),
+        ("selectbox", "Select State", "California", 0),
+        ("slider", "pred_year", 10, 0),
+        ("selectbox", "state_aqi", "California", 0),
+    ],
+    "pages/5_🎯_Predict AQI.py": [
+        ("selectbox", "model_aqi", "Ridge Regressor", 0),
+        ("slider", "Select test set size", 0.3, 0),
+        ("multiselect", "Select features to model:", ["Days CO", "Days Ozone", "Days PM2.5"], 0),
+    ],
+}
+
+
+def find_widget(app, kind, name, nth=0):
+    widgets = [widget for widget in getattr(app, kind) if name in (widget.key, widget.label)]
+    if len(widgets) <= nth:
+        raise LookupError(f"no {kind} {name!r} on the page")
+    return widgets[nth]
+
+
+def rss_bytes():
+    # Current resident set size; falls back to the peak where /proc is missing.
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Monitor(threading.Thread):
+    # Samples the RSS and CPU time of the process while the sessions run.
+    def __init__(self, interval=0.5):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def sample(self):
+        times = os.times()
+        self.samples.append((time.perf_counter(), times.user + times.system, rss_bytes()))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+    def summary(self):
+        wall, cpu, rss = np.array(self.samples).T
+        return {
+            "duration (s)": wall[-1] - wall[0],
+            "cpu (s)": cpu[-1] - cpu[0],
+            "cpu utilisation (cores)": (cpu[-1] - cpu[0]) / max(wall[-1] - wall[0], 1e-9),
+            "rss start (MB)": rss[0] / 2**20,
+            "rss mean (MB)": rss.mean() / 2**20,
+            "rss peak (MB)": rss.max() / 2**20,
+        }
+
+
+@contextlib.contextmanager
+def shared_runtime():
+    # AppTest installs a mock Runtime for each run and removes it when the run
+    # ends, under the feet of the runs still going on other threads. Pin one for
+    # all of them instead, so the sessions share the caches of one process the
+    # way the sessions of one server do.
+    runtime = mock.MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    with mock.patch.object(Runtime, "instance", return_value=runtime), mock.patch.object(
+        Runtime, "exists", return_value=True
+    ):
+        yield runtime
+
+
+def cache_stats_script():
+    import streamlit as st
+
+    import cache
+
+    st.session_state["cache_stats"] = cache.get_cache().stats()
+
+
+def cache_stats():
+    # The query cache is a cache_resource, which is only shared with the sessions
+    # from inside a script run, so the counters are read by running one.
+    return AppTest.from_function(cache_stats_script).run().session_state["cache_stats"]
+
+
+def run_session(session, pages, iterations, think, timeout, seed):
+    # One user walking through the pages. The first session to open a page pays
+    # for loading the data; the others find it in the shared caches.
+    rng = random.Random(seed + session)
+    records = []
+    for iteration in range(iterations):
+        for page in pages:
+            app = AppTest.from_file(page, default_timeout=timeout)
+            steps = [("open", None, None, 0)] + SCENARIOS[page]
+            for step, (kind, name, value, nth) in enumerate(steps):
+                record = {"session": session, "iteration": iteration, "page": page, "step": step}
+                record["interaction"] = "open" if kind == "open" else f"{kind} {name} = {value}"
+                start = time.perf_counter()
+                try:
+                    if kind != "open":
+                        find_widget(app, kind, name, nth).set_value(value)
+                    app.run()
+                    record["error"] = "; ".join(str(exception.message) for exception in app.exception) or None
+                except Exception as error:
+                    record["error"] = f"{type(error).__name__}: {error}"
+                record["latency (s)"] = time.perf_counter() - start
+                records.append(record)
+                if record["error"] and kind == "open":
+                    break
+                time.sleep(rng.uniform(0, 2 * think))
+    return records
+
+
+def load_test(sessions, pages, iterations=1, think=0.5, timeout=120, seed=0):
+    # All sessions run as threads of this process, like the sessions of one
+    # server: they contend for the GIL and hit (or miss) the same caches.
+    logging.getLogger("streamlit.runtime.scriptrunner.script_run_context").setLevel(logging.ERROR)
+    monitor = Monitor()
+    with shared_runtime():
+        hits_before = cache_stats()
+        monitor.start()
+        with concurrent.futures.ThreadPoolExecutor(sessions, thread_name_prefix="session") as executor:
+            futures = [
+                executor.submit(run_session, session, pages, iterations, think, timeout, seed)
+                for session in range(sessions)
+            ]
+            results = [future.result() for future in futures]
+        monitor.stop()
+        caches = cache_table(hits_before, cache_stats())
+    records = pd.DataFrame([record for session_records in results for record in session_records])
+    return records, monitor.summary(), caches
+
+
+def cache_table(before, after):
+    # Query cache lookups made during the run, per namespace.
+    counters = ["hits", "misses", "evictions"]
+    table = after[counters].subtract(before[counters].reindex(after.index).fillna(0)).astype(int)
+    lookups = table["hits"] + table["misses"]
+    table["hit rate"] = (table["hits"] / lookups.where(lookups > 0)).round(3)
+    table["entries"], table["bytes"] = after["entries"], after["bytes"]
+    return table
+
+
+def latency_table(records):
+    grouped = records.groupby(["page", "step", "interaction"], sort=True)
+    table = grouped["latency (s)"].describe(percentiles=[0.5, 0.95, 0.99])[["count", "50%", "95%", "99%", "max"]]
+    table["errors"] = grouped["error"].count()
+    return table.rename(columns={"50%": "p50 (s)", "95%": "p95 (s)", "99%": "p99 (s)", "max": "max (s)"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent app sessions through scripted interactions")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions")
+    parser.add_argument("--pages", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=1, help="times each session walks through the pages")
+    parser.add_argument("--think", type=float, default=0.5, help="mean pause between interactions, in seconds")
+    parser.add_argument("--timeout", type=float, default=120, help="per-rerun timeout, in seconds")
+    parser.add_argument("--output", help="write the per-interaction records and summary as JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    records, process, caches = load_test(
+        args.sessions, args.pages, args.iterations, args.think, args.timeout, args.seed
+    )
+    table = latency_table(records)
+    with pd.option_context(
+        "display.max_rows", None, "display.max_columns", None, "display.width", 250, "display.max_colwidth", 60
+    ):
+        print(table.round(3))
+        print()
+        print(caches)
+    overall = records["latency (s)"]
+    print(
+        f"\n{len(records)} reruns by {args.sessions} sessions: p50 {overall.quantile(0.5):.3f} s,"
+        f" p95 {overall.quantile(0.95):.3f} s, p99 {overall.quantile(0.99):.3f} s, {records['error'].count()} errors"
+    )
+    lookups = caches["hits"].sum() + caches["misses"].sum()
+    print(
+        f"process: {process['cpu (s)']:.1f} CPU seconds ({process['cpu utilisation (cores)']:.2f} cores),"
+        f" {process['rss peak (MB)']:.0f} MB peak RSS; query cache hit rate"
+        f" {caches['hits'].sum() / lookups if lookups else float('nan'):.1%}"
+    )
+    for error in records["error"].dropna().unique()[:5]:
+        print(f"error: {error}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            report = {
+                "sessions": args.sessions,
+                "interactions": table.reset_index().to_dict(orient="records"),
+                "process": process,
+                "caches": caches.reset_index(names="namespace").to_dict(orient="records"),
+                "records": records.to_dict(orient="records"),
+            }
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,12 @@ import json
 import plotly.graph_objects as go
 import hiplot as hip
 import utils
+import profiling
+import loader
+import artifacts
+import stats
+import correlation
+import store
 import numpy as np
 from streamlit_extras.app_logo import add_logo
 import warnings
@@ -68,9 +74,26 @@ def conc_dataset_description():
             st.write(column_explanations[selected_column])
 
 
+@st.cache_data
+def get_correlation_moments(_df, numerical_columns, by, filepath, version):
+    # Reuse the accumulators maintained by `python ingest.py` when they match this version.
+    moments = store.load_artifact(f"{store.dataset_name(filepath)}_correlation", version, artifacts.code_version())
+    if moments is None or moments.columns != list(numerical_columns) or moments.by != by:
+        moments = correlation.GroupedCoMoments(numerical_columns, by).update(_df)
+    return moments
+
+
+@profiling.profiled()
 def conc_dataset_plot_corr_heatmap(df, numerical_columns):
+    selected_param = st.selectbox("Compute correlations for", ["All Parameters"] + params, key="tab_conc1_param")
+    conc_path = "dataset/refined/annual_conc_by_monitor.parquet"
+    moments = get_correlation_moments(
+        df, numerical_columns, "Parameter Name", conc_path, utils.dataset_version(conc_path)
+    )
     fig, ax = plt.subplots()
-    ax = sns.heatmap(df[numerical_columns].corr(), cmap="RdBu", vmin=-1, vmax=1)
+    ax = sns.heatmap(
+        moments.corr(None if selected_param == "All Parameters" else selected_param), cmap="RdBu", vmin=-1, vmax=1
+    )
     ax.set_title("Correlation Heatmap")
     st.pyplot(fig, use_container_width=True)
 
@@ -82,6 +105,7 @@ def conc_dataset_plot_corr_heatmap(df, numerical_columns):
     )
 
 
+@profiling.profiled()
 def conc_dataset_plot_missing_values(df, params):
     col1, col2 = st.columns(2)
     with col1:
@@ -120,6 +144,7 @@ def conc_dataset_plot_missing_values(df, params):
     )
 
 
+@profiling.profiled()
 def conc_dataset_plot_yearly_coverage(df, params):
     col3, col4 = st.columns(2)
     with col3:
@@ -170,6 +195,7 @@ def conc_dataset_plot_yearly_coverage(df, params):
     )
 
 
+@profiling.profiled()
 def conc_dataset_plot_statewise_coverage(df, params):
     col5, col6 = st.columns(2)
     with col5:
@@ -230,6 +256,15 @@ def conc_dataset_plot_statewise_coverage(df, params):
     sns.set(style="whitegrid")
 
 
+@st.cache_data
+def get_summary_statistics(_df, filepath, version):
+    summary = store.load_artifact(f"{store.dataset_name(filepath)}_summary", version, artifacts.code_version())
+    if summary is None:
+        summary = stats.summarize_frame(_df)
+    return summary.describe()
+
+
+@profiling.profiled()
 def perform_eda_of_conc_dataset():
     conc_dataset_description()
     st.write(
@@ -255,7 +290,8 @@ def perform_eda_of_conc_dataset():
         conc_dataset_plot_statewise_coverage(df, params)
 
     with tab_conc5:
-        st.table(df.describe())
+        conc_path = "dataset/refined/annual_conc_by_monitor.parquet"
+        st.table(get_summary_statistics(df, conc_path, utils.dataset_version(conc_path)))
 
 
 def aqi_dataset_description():
@@ -298,13 +334,21 @@ def aqi_dataset_description():
             st.write(column_explanations[selected_column])
 
 
+@profiling.profiled()
 def aqi_dataset_plot_corr_heatmap(df_aqi, numerical_columns_aqi):
+    state_list = ["All States"] + df_aqi["State"].unique().tolist()
+    selected_state = st.selectbox("Compute correlations for", state_list, key="tab_aqi1_state")
+    aqi_path = "dataset/refined/annual_aqi_by_county.csv"
+    moments = get_correlation_moments(df_aqi, numerical_columns_aqi, "State", aqi_path, utils.dataset_version(aqi_path))
     fig, ax = plt.subplots()
-    ax = sns.heatmap(df_aqi[numerical_columns_aqi].corr(), cmap="RdBu", vmin=-1, vmax=1)
+    ax = sns.heatmap(
+        moments.corr(None if selected_state == "All States" else selected_state), cmap="RdBu", vmin=-1, vmax=1
+    )
     ax.set_title("Correlation Heatmap")
     st.pyplot(fig, use_container_width=True)
 
 
+@profiling.profiled()
 def aqi_dataset_plot_missing_values(df_aqi):
     fig, ax = plt.subplots()
     ax = sns.heatmap(df_aqi.isnull().T, cbar=True, cmap="Purples", vmin=0, vmax=1, xticklabels=False, yticklabels=True)
@@ -324,6 +368,7 @@ def aqi_dataset_plot_missing_values(df_aqi):
     )
 
 
+@profiling.profiled()
 def aqi_dataset_plot_yearly_coverage(df_aqi):
     columns = [
         "Days with AQI",
@@ -362,6 +407,7 @@ def aqi_dataset_plot_yearly_coverage(df_aqi):
     )
 
 
+@profiling.profiled()
 def aqi_dataset_plot_statewise_coverage(df_aqi):
     columns = [
         "Days with AQI",
@@ -401,6 +447,7 @@ def aqi_dataset_plot_statewise_coverage(df_aqi):
     plt.clf()
 
 
+@profiling.profiled()
 def perform_eda_of_aqi_dataset():
     aqi_dataset_description()
     st.write(
@@ -426,27 +473,13 @@ def perform_eda_of_aqi_dataset():
         aqi_dataset_plot_statewise_coverage(df_aqi)
 
     with tab_aqi5:
-        st.table(df_aqi.describe())
-
-
-if "df" in st.session_state:
-    df = st.session_state.df
-else:
-    df = utils.load_data("dataset/refined/annual_conc_by_monitor.parquet")
-    st.session_state.df = df
+        aqi_path = "dataset/refined/annual_aqi_by_county.csv"
+        st.table(get_summary_statistics(df_aqi, aqi_path, utils.dataset_version(aqi_path)))
 
-if "df_aqi" in st.session_state:
-    df_aqi = st.session_state.df_aqi
-else:
-    df_aqi = utils.load_data("dataset/refined/annual_aqi_by_county.csv")
-    st.session_state.df_aqi = df_aqi
 
-if "geojson_data" in st.session_state:
-    geojson_data = st.session_state.geojson_data
-else:
-    with open("geojson/USA_state.geojson", "r") as geojson_file:
-        geojson_data = json.load(geojson_file)
-        st.session_state.geojson_data = geojson_data
+df = loader.session_resource("df")
+df_aqi = loader.session_resource("df_aqi")
+geojson_data = loader.session_resource("geojson_data")
 
 # df.replace([np.inf, -np.inf], np.nan, inplace=True)
 # df_aqi.replace([np.inf, -np.inf], np.nan, inplace=True)
@@ -473,3 +506,4 @@ with tab_conc:
     perform_eda_of_conc_dataset()
 with tab_aqi:
     perform_eda_of_aqi_dataset()
+profiling.debug_panel()
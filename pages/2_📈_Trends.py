@@ -7,31 +7,41 @@ import json
 import plotly.graph_objects as go
 import hiplot as hip
 import utils
+import profiling
+import loader
+import artifacts
+import queries
+import store
+import plotting
+import regions
+import spatial_index
+import interpolation
 from streamlit_extras.app_logo import add_logo
 
 add_logo("airviz_image.png", height=30)
 utils.add_navigation()
 
 
-def plot_geospacial_trend_concentration(filtered_df, year, parameter, config):
-    col = "Arithmetic Mean"
-    custom_agg = lambda x: x.max()
-    fig = px.choropleth_mapbox(
-        filtered_df.groupby("State Name")[col].agg(**{col: custom_agg}).reset_index(),
-        geojson=config["geojson_data"],
-        locations="State Name",
-        featureidkey="properties.shapeName",
-        color=col,
-        color_continuous_scale="reds",
-    )
-
-    fig.update_layout(
-        title=f"Concentration of {parameter} - {year}",
-        title_font=dict(size=20),
-        margin=dict(b=10),
-        mapbox=config["mapbox_layout"],
+def plot_geospacial_trend_concentration(df, year, parameter, config):
+    # Animated, every year is sent once and scrubbing years needs no reruns.
+    if st.checkbox("Scrub all years in the map", value=False, key="animate_years"):
+        fig = queries.concentration_choropleth_animation(
+            df, config["geojson_data"], parameter, year, config["mapbox_layout"], utils.dataset_version(CONC_PATH)
+        )
+        plotting.plotly_chart(fig)
+        return
+    fig = queries.concentration_choropleth(
+        df, config["geojson_data"], parameter, year, config["mapbox_layout"], utils.dataset_version(CONC_PATH)
     )
-    st.plotly_chart(fig, use_container_width=True)
+    if st.checkbox("Overlay interpolated surface (IDW)", value=False, key="idw_overlay"):
+        layer = interpolation.load_surface_layer(parameter, year)
+        if layer is None:
+            st.caption("No precomputed surface for this selection. Run `python interpolation.py` to build them.")
+        else:
+            # Copy before adding the layer: the cached figure is shared between sessions.
+            fig = go.Figure(fig)
+            fig.update_layout(mapbox_layers=[dict(layer)])
+    plotting.plotly_chart(fig)
     st.write(
         """
     A pronounced trend is evident in the case of several pollutants, including Ozone and NO2, with consistently higher levels observed along the western coast, particularly in California's southern regions.
@@ -41,10 +51,20 @@ def plot_geospacial_trend_concentration(filtered_df, year, parameter, config):
     )
 
 
-def plot_geospacial_trend_coverage(filtered_df, year, parameter, config):
-    fig = px.scatter_mapbox(
-        filtered_df, lat="Latitude", lon="Longitude", opacity=0.4, color_discrete_sequence=["purple"]
-    )
+def plot_geospacial_trend_coverage(df, filtered_df, year, parameter, config):
+    # Monitors are matched to regions geometrically, by the polygons they lie in.
+    rcol1, rcol2 = st.columns(2)
+    with rcol1:
+        region_set = st.selectbox("Regions", list(regions.REGION_FILES), key="region_set")
+    geojson_path, name_key = regions.REGION_FILES[region_set]
+    sites = regions.assign_monitors_to_regions(df, geojson_path, name_key, utils.dataset_version(CONC_PATH))
+    with rcol2:
+        region = st.selectbox("Region", ["All"] + sorted(sites["Region"].dropna().unique()), key="region")
+    region_df = filtered_df
+    if region != "All":
+        region_df = regions.attach_regions(filtered_df, sites)
+        region_df = region_df[region_df["Region"] == region]
+    fig = px.scatter_mapbox(region_df, lat="Latitude", lon="Longitude", opacity=0.4, color_discrete_sequence=["purple"])
     fig.update_layout(
         title=f"Coverage of {parameter} measurement centers - {year}",
         title_font=dict(size=20),
@@ -52,7 +72,9 @@ def plot_geospacial_trend_coverage(filtered_df, year, parameter, config):
         mapbox=config["mapbox_layout"],
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    plotting.plotly_chart(fig)
+    # The nearest monitors are searched among all of them, whatever the region.
+    plot_nearest_monitors(filtered_df, year, parameter)
     st.write(
         """
     Adequate coverage of Air Quality measurement centers is of paramount importance as it provides the data needed to monitor and address regional variations in air quality, safeguard public health, protect the environment, inform policy and regulation and establish early warning systems. It also helps in raising public awareness, and facilitates international cooperation in addressing the global challenge of air pollution. Coverage patterns mirror population trends, with a notable concentration along the eastern and western coasts and sparse availability elsewhere, apart from a few isolated hotspots.
@@ -62,16 +84,61 @@ def plot_geospacial_trend_coverage(filtered_df, year, parameter, config):
     )
 
 
+def plot_nearest_monitors(filtered_df, year, parameter):
+    with st.expander("Find nearest monitors"):
+        ncol1, ncol2, ncol3, ncol4 = st.columns(4)
+        with ncol1:
+            lat = st.number_input("Latitude", min_value=-90.0, max_value=90.0, value=34.05, format="%.4f")
+        with ncol2:
+            lon = st.number_input("Longitude", min_value=-180.0, max_value=180.0, value=-118.24, format="%.4f")
+        with ncol3:
+            k = st.number_input("Monitors", min_value=1, max_value=50, value=5)
+        with ncol4:
+            radius_km = st.number_input("Within (km, 0 = any)", min_value=0.0, value=0.0, step=10.0)
+        site_index = spatial_index.get_site_index(filtered_df, parameter, year, utils.dataset_version(CONC_PATH))
+        if site_index is None:
+            st.write("*There are no monitors for this selection.*")
+        elif radius_km > 0:
+            st.dataframe(site_index.within(lat, lon, radius_km).head(int(k)), hide_index=True)
+        else:
+            st.dataframe(site_index.nearest(lat, lon, int(k)), hide_index=True)
+
+
+def plot_geospacial_trend_change(df, parameter, config):
+    version = utils.dataset_version(CONC_PATH)
+    years = artifacts.get_artifact(df, CONC_PATH, "catalog", version)["years"]
+    chcol1, chcol2 = st.columns([6, 4])
+    with chcol1:
+        year_a, year_b = st.slider(
+            "Change between",
+            min_value=years[0],
+            max_value=years[-1],
+            value=(max(years[0], 2000), years[-1]),
+            key="change_years",
+        )
+    with chcol2:
+        measure = st.radio("Map", ["Change", "Change (%)", "Slope (per year)"], horizontal=True, key="change_measure")
+    table = queries.concentration_change(df, parameter, year_a, year_b, version)
+    fig = queries.change_choropleth(
+        table, config["geojson_data"], measure, f"{parameter}: {measure} {year_a}-{year_b}", config["mapbox_layout"]
+    )
+    plotting.plotly_chart(fig)
+    st.dataframe(table.sort_values(measure, ascending=False), hide_index=True, use_container_width=True)
+
+
+@profiling.profiled()
 def plot_geospacial_trends(df, parameter, config):
     st.header("Pollutant Trends")
     st.subheader("Geospacial Trends")
     year = st.slider("Select a year", min_value=int(df["Year"].min()), max_value=int(df["Year"].max()), value=2020)
     filtered_df = df.loc[(df["Year"] == year) & (df["Parameter Name"] == parameter)]
-    tab1, tab2 = st.tabs(["Concentration", "Coverage"])
+    tab1, tab2, tab3 = st.tabs(["Concentration", "Coverage", "Change"])
     with tab1:
-        plot_geospacial_trend_concentration(filtered_df, year, parameter, config)
+        plot_geospacial_trend_concentration(df, year, parameter, config)
     with tab2:
-        plot_geospacial_trend_coverage(filtered_df, year, parameter, config)
+        plot_geospacial_trend_coverage(df, filtered_df, year, parameter, config)
+    with tab3:
+        plot_geospacial_trend_change(df, parameter, config)
 
 
 def get_temporal_trends_inputs(df):
@@ -100,39 +167,13 @@ def get_temporal_trends_inputs(df):
     return show_lines, year_range, measurement_type, selected_state, selected_county
 
 
-def get_temporal_trends_filtered_df(df, year_range, measurement_type, selected_state, selected_county):
-    aggregation = {
-        f"Arithmetic Mean": "mean",
-        f"Arithmetic Standard Dev": "mean",
-        f"1st Max Value": "max",
-    }
-    p_df = df[df["Parameter Name"] == parameter]
-    year_df = p_df[(p_df["Year"] >= year_range[0]) & (p_df["Year"] <= year_range[1])]
-    if selected_state == "All":
-        filtered_df = (
-            year_df[(year_df["Sample Duration"] == measurement_type)].groupby(["Year"]).agg(aggregation).reset_index()
-        )
-    elif selected_county == "All":
-        state_df = year_df[year_df["State Name"] == selected_state]
-        filtered_df = (
-            state_df[(state_df["Sample Duration"] == measurement_type)].groupby(["Year"]).agg(aggregation).reset_index()
-        )
-    else:
-        state_df = year_df[year_df["State Name"] == selected_state]
-        county_df = state_df[state_df["County Name"] == selected_county]
-        filtered_df = (
-            county_df[(county_df["Sample Duration"] == measurement_type)]
-            .groupby(["Year"])
-            .agg(aggregation)
-            .reset_index()
-        )
-    return filtered_df
-
-
+@profiling.profiled()
 def plot_temporal_trends(df, parameter):
     st.subheader("Temporal Trends")
     show_lines, year_range, measurement_type, selected_state, selected_county = get_temporal_trends_inputs(df)
-    filtered_df = get_temporal_trends_filtered_df(df, year_range, measurement_type, selected_state, selected_county)
+    filtered_df = queries.trend_series(
+        df, parameter, measurement_type, year_range, selected_state, selected_county, utils.dataset_version(CONC_PATH)
+    )
 
     fig = go.Figure()
     if show_lines["Std"]:
@@ -187,7 +228,7 @@ def plot_temporal_trends(df, parameter):
         yaxis_title="Concentration",
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    plotting.plotly_chart(fig)
     st.write(
         """
         A conspicuous trend is discernible in the case of several pollutants: a consistent reduction over the years. This decrease can be attributed to a combination of factors, including stricter environmental regulations, technological advancements in emission controls, and heightened public awareness regarding the detrimental effects of pollution.
@@ -196,18 +237,62 @@ def plot_temporal_trends(df, parameter):
     )
 
 
-if "df" in st.session_state:
-    df = st.session_state.df
-else:
-    df = utils.load_data("dataset/refined/annual_conc_by_monitor.parquet")
-    st.session_state.df = df
+@profiling.profiled()
+def plot_comparison(df, parameter):
+    with st.expander("Compare states, counties and parameters"):
+        version = utils.dataset_version(CONC_PATH)
+        catalog = artifacts.get_artifact(df, CONC_PATH, "catalog", version)
+        county_options = {
+            f"{county}, {state}": (state, county)
+            for state, counties in sorted(catalog["counties"].items())
+            for county in sorted(counties)
+        }
+        ccol1, ccol2 = st.columns(2)
+        with ccol1:
+            parameters = st.multiselect("Parameters", params, default=[parameter], key="compare_parameters")
+            states = st.multiselect("States", sorted(catalog["counties"]), key="compare_states")
+            counties = st.multiselect("Counties", list(county_options), key="compare_counties")
+        with ccol2:
+            year_range = st.slider(
+                "Years",
+                min_value=catalog["years"][0],
+                max_value=catalog["years"][-1],
+                value=(catalog["years"][0], catalog["years"][-1]),
+                key="compare_years",
+            )
+            layout = st.radio("Show as", ["Overlay", "Small multiples"], horizontal=True, key="compare_layout")
+        parameters = [name for name in parameters if name in catalog["sample_durations"]]
+        if not parameters:
+            st.write("*Select a parameter with data to compare.*")
+            return
+        # All selections come out of one cached query, not one query each.
+        series = queries.comparison_series(
+            df, parameters, states, [county_options[label] for label in counties], year_range, version
+        )
+        if layout == "Overlay":
+            fig = px.line(series, x="Year", y="Arithmetic Mean", color="Geography", line_dash="Parameter Name")
+        else:
+            # One panel per parameter, as their units differ.
+            fig = px.line(
+                series,
+                x="Year",
+                y="Arithmetic Mean",
+                color="Geography",
+                facet_row="Parameter Name",
+                height=max(300, 250 * len(parameters)),
+            )
+            fig.update_yaxes(matches=None, title_text="")
+            fig.for_each_annotation(lambda annotation: annotation.update(text=annotation.text.split("=")[-1]))
+        fig.update_traces(mode="lines+markers")
+        fig.update_layout(title=f"Yearly mean concentration ({year_range[0]}-{year_range[1]})", margin=dict(b=10))
+        plotting.plotly_chart(fig)
+
+
+CONC_PATH = "dataset/refined/annual_conc_by_monitor.parquet"
 
-if "geojson_data" in st.session_state:
-    geojson_data = st.session_state.geojson_data
-else:
-    with open("geojson/USA_state.geojson", "r") as geojson_file:
-        geojson_data = json.load(geojson_file)
-        st.session_state.geojson_data = geojson_data
+df = loader.session_resource("df")
+# A URL when Streamlit serves static files: browsers then fetch the geometry once, not with every map.
+geojson_data = plotting.static_url(store.GEOJSON_PATH) or loader.session_resource("geojson_data")
 
 mapbox_layout = utils.mapbox_layout
 params = utils.params
@@ -233,3 +318,5 @@ config = {"params": params, "geojson_data": geojson_data, "mapbox_layout": mapbo
 plot_geospacial_trends(df, parameter, config)
 
 plot_temporal_trends(df, parameter)
+plot_comparison(df, parameter)
+profiling.debug_panel()
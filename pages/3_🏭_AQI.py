@@ -7,6 +7,14 @@ import json
 import plotly.graph_objects as go
 import hiplot as hip
 import utils
+import profiling
+import loader
+import artifacts
+import queries
+import store
+import plotting
+import sampling
+import similarity
 from streamlit_extras.app_logo import add_logo
 
 add_logo("airviz_image.png", height=30)
@@ -86,7 +94,7 @@ def plot_airquality_lineplot(df_aqi):
         xaxis_title="Years",
         yaxis_title=aqi_measurement_type,
     )
-    st.plotly_chart(fig, use_container_width=True)
+    plotting.plotly_chart(fig)
 
 
 def plot_airquality_radioplot(df_aqi):
@@ -145,7 +153,7 @@ def plot_airquality_radioplot(df_aqi):
         fig.update_layout(legend=dict(x=0, y=1))
         fig.update_layout(showlegend=True)
 
-        st.plotly_chart(fig, use_container_width=True)
+        plotting.plotly_chart(fig)
 
 
 def plot_airquality_heatmap(df_aqi, config):
@@ -182,27 +190,72 @@ def plot_airquality_heatmap(df_aqi, config):
             key="aqi_mes2",
         )
 
-    custom_agg2 = lambda x: x.max()
-    fig = px.choropleth_mapbox(
-        df_aqi[df_aqi["Year"] == year]
-        .groupby("State")[aqi_measurement_type2]
-        .agg(**{aqi_measurement_type2: custom_agg2})
-        .reset_index(),
-        geojson=config["geojson_data"],
-        locations="State",
-        featureidkey="properties.shapeName",
-        color=aqi_measurement_type2,
-        color_continuous_scale="Reds",
+    # Animated, every year is sent once and scrubbing years needs no reruns.
+    if st.checkbox("Scrub all years in the map", value=False, key="animate_years2"):
+        choropleth = queries.aqi_choropleth_animation
+    else:
+        choropleth = queries.aqi_choropleth
+    fig = choropleth(
+        df_aqi,
+        config["geojson_data"],
+        aqi_measurement_type2,
+        year,
+        config["mapbox_layout"],
+        utils.dataset_version(AQI_PATH),
     )
-    fig.update_layout(
-        title=f"{aqi_measurement_type2} - {year}", title_font=dict(size=20), mapbox=config["mapbox_layout"]
+    plotting.plotly_chart(fig)
+
+
+def plot_airquality_change(df_aqi, config):
+    version = utils.dataset_version(AQI_PATH)
+    years = artifacts.get_artifact(df_aqi, AQI_PATH, "catalog", version)["years"]
+    chcol1, chcol2 = st.columns([6, 4])
+    with chcol1:
+        year_a, year_b = st.slider(
+            "Change between",
+            min_value=years[0],
+            max_value=years[-1],
+            value=(max(years[0], 2000), years[-1]),
+            key="aqi_change_years",
+        )
+        measure = st.radio(
+            "Map", ["Change", "Change (%)", "Slope (per year)"], horizontal=True, key="aqi_change_measure"
+        )
+    with chcol2:
+        column = st.selectbox(
+            "Choose attibute to compare",
+            [
+                "Days with AQI",
+                "Good Days",
+                "Moderate Days",
+                "Unhealthy for Sensitive Groups Days",
+                "Unhealthy Days",
+                "Very Unhealthy Days",
+                "Hazardous Days",
+                "Max AQI",
+                "90th Percentile AQI",
+                "Median AQI",
+                "Days CO",
+                "Days NO2",
+                "Days Ozone",
+                "Days PM2.5",
+                "Days PM10",
+            ],
+            index=9,
+            key="aqi_change_column",
+        )
+    table = queries.aqi_change(df_aqi, column, year_a, year_b, version)
+    fig = queries.change_choropleth(
+        table, config["geojson_data"], measure, f"{column}: {measure} {year_a}-{year_b}", config["mapbox_layout"]
     )
-    st.plotly_chart(fig, use_container_width=True)
+    plotting.plotly_chart(fig)
+    st.dataframe(table.sort_values(measure, ascending=False), hide_index=True, use_container_width=True)
 
 
+@profiling.profiled()
 def plot_airquality_metrics(df_aqi, config):
     st.subheader("Air Quality Metric plots")
-    aqi_tab1, aqi_tab2, aqi_tab3 = st.tabs(["Radio", "Heatmap", "Line Plot"])
+    aqi_tab1, aqi_tab2, aqi_tab3, aqi_tab4 = st.tabs(["Radio", "Heatmap", "Line Plot", "Change"])
 
     with aqi_tab1:
         plot_airquality_radioplot(df_aqi)
@@ -210,36 +263,78 @@ def plot_airquality_metrics(df_aqi, config):
         plot_airquality_heatmap(df_aqi, config)
     with aqi_tab3:
         plot_airquality_lineplot(df_aqi)
+    with aqi_tab4:
+        plot_airquality_change(df_aqi, config)
 
 
+@st.cache_data
+def get_parallel_coords_html(_df_aqi, version, max_rows):
+    columns = ["State", "Year", "Days CO", "Days NO2", "Days Ozone", "Days PM2.5", "Days PM10"]
+    sample_df = sampling.stratified_sample(_df_aqi[columns], ["State", "Year"], max_rows)
+    # Rendered in memory: no shared file on disk for concurrent sessions to overwrite.
+    return hip.Experiment.from_dataframe(sample_df).to_html(), len(sample_df)
+
+
+@profiling.profiled()
 def plot_parallel_coords(df_aqi):
     with st.expander("**Expore data using parallel coords**"):
         st.header("Parallel coords")
-        exp = hip.Experiment.from_dataframe(
-            df_aqi[["State", "Year", "Days CO", "Days NO2", "Days Ozone", "Days PM2.5", "Days PM10"]]
+        # Frames smaller than the slider's minimum are always plotted whole.
+        downsample = len(df_aqi) > MIN_PLOT_ROWS and st.checkbox(
+            "Downsample (stratified by State and Year)", value=False, key="hiplot_downsample"
         )
-
-        def save_hiplot_to_html(exp):
-            output_file = "hiplot_plot_1.html"
-            exp.to_html(output_file)
-            return output_file
-
-        hiplot_html_file = save_hiplot_to_html(exp)
-        st.components.v1.html(open(hiplot_html_file, "r").read(), height=1500, scrolling=True)
-
-
-if "df_aqi" in st.session_state:
-    df_aqi = st.session_state.df_aqi
-else:
-    df_aqi = utils.load_data("dataset/refined/annual_aqi_by_county.csv")
-    st.session_state.df_aqi = df_aqi
-
-if "geojson_data" in st.session_state:
-    geojson_data = st.session_state.geojson_data
-else:
-    with open("geojson/USA_state.geojson", "r") as geojson_file:
-        geojson_data = json.load(geojson_file)
-        st.session_state.geojson_data = geojson_data
+        max_rows = None
+        if downsample:
+            max_rows = st.slider(
+                "Rows to plot", min_value=MIN_PLOT_ROWS, max_value=len(df_aqi), value=min(10000, len(df_aqi))
+            )
+        hiplot_html, n_rows = get_parallel_coords_html(df_aqi, utils.dataset_version(AQI_PATH), max_rows)
+        if downsample:
+            st.caption(f"Showing {n_rows} of {len(df_aqi)} rows")
+        st.components.v1.html(hiplot_html, height=1500, scrolling=True)
+
+
+@profiling.profiled()
+def plot_similar_counties(df_aqi):
+    with st.expander("Find counties with similar air quality histories"):
+        county_index = similarity.get_county_index(df_aqi, utils.dataset_version(AQI_PATH))
+        counties = county_index.counties
+        scol1, scol2, scol3, scol4 = st.columns([3, 3, 2, 2])
+        with scol1:
+            states = counties["State"].unique().tolist()
+            state = st.selectbox(
+                "State",
+                states,
+                index=states.index("California") if "California" in states else 0,
+                key="similar_state",
+            )
+        with scol2:
+            county = st.selectbox(
+                "County", counties.loc[counties["State"] == state, "County"].tolist(), key="similar_county"
+            )
+        with scol3:
+            k = st.number_input("Matches", min_value=1, max_value=50, value=10, key="similar_k")
+        with scol4:
+            method = st.radio("Match by", ["Cosine", "DTW"], key="similar_method")
+        matches = county_index.similar(state, county, k=int(k), method=method.lower())
+        st.dataframe(matches, hide_index=True, use_container_width=True)
+
+        # The query county's Median AQI against its five closest matches.
+        selected = [(state, county)] + list(matches[["State", "County"]].head(5).itertuples(index=False, name=None))
+        history = df_aqi.set_index(["State", "County"]).loc[selected].reset_index()
+        history["County"] = history["County"].astype(str) + ", " + history["State"].astype(str)
+        fig = px.line(history.sort_values("Year"), x="Year", y="Median AQI", color="County")
+        fig.update_layout(title=f"Median AQI of {county}, {state} and its closest matches", margin=dict(b=10))
+        plotting.plotly_chart(fig)
+
+
+AQI_PATH = "dataset/refined/annual_aqi_by_county.csv"
+# Smallest sample the parallel coordinates can be downsampled to.
+MIN_PLOT_ROWS = 1000
+
+df_aqi = loader.session_resource("df_aqi")
+# A URL when Streamlit serves static files: browsers then fetch the geometry once, not with every map.
+geojson_data = plotting.static_url(store.GEOJSON_PATH) or loader.session_resource("geojson_data")
 
 mapbox_layout = utils.mapbox_layout
 params = utils.params
@@ -249,3 +344,5 @@ config = {"params": params, "geojson_data": geojson_data, "mapbox_layout": mapbo
 aqi_intro()
 plot_parallel_coords(df_aqi)
 plot_airquality_metrics(df_aqi, config)
+plot_similar_counties(df_aqi)
+profiling.debug_panel()
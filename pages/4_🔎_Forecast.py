@@ -7,9 +7,11 @@ import json
 import plotly.graph_objects as go
 import hiplot as hip
 import utils
+import profiling
+import loader
+import queries
+import plotting
 from streamlit_extras.app_logo import add_logo
-from prophet import Prophet
-from statsmodels.tsa.arima.model import ARIMA
 import numpy as np
 import warnings
 from sklearn.metrics import mean_squared_error, mean_absolute_error
@@ -176,30 +178,16 @@ def extract_filtered_df(df, parameter, year_range, selected_state, selected_coun
         measurement_type = "1 HOUR"
     else:
         measurement_type = available_measurement_types[0]
-    aggregation = {
-        f"Arithmetic Mean": "mean",
-    }
-    p_df = df[df["Parameter Name"] == parameter]
-    year_df = p_df[(p_df["Year"] >= year_range[0]) & (p_df["Year"] <= 2022)]
-    if selected_state == "All":
-        filtered_df = (
-            year_df[(year_df["Sample Duration"] == measurement_type)].groupby(["Year"]).agg(aggregation).reset_index()
-        )
-    elif selected_county == "All":
-        state_df = year_df[year_df["State Name"] == selected_state]
-        filtered_df = (
-            state_df[(state_df["Sample Duration"] == measurement_type)].groupby(["Year"]).agg(aggregation).reset_index()
-        )
-    else:
-        state_df = year_df[year_df["State Name"] == selected_state]
-        county_df = state_df[state_df["County Name"] == selected_county]
-        filtered_df = (
-            county_df[(county_df["Sample Duration"] == measurement_type)]
-            .groupby(["Year"])
-            .agg(aggregation)
-            .reset_index()
-        )
-    return filtered_df
+    filtered_df = queries.trend_series(
+        df,
+        parameter,
+        measurement_type,
+        (year_range[0], 2022),
+        selected_state,
+        selected_county,
+        utils.dataset_version(CONC_PATH),
+    )
+    return filtered_df[["Year", "Arithmetic Mean"]]
 
 
 def estimate_and_print_metrics(actual_values, predicted_values):
@@ -227,19 +215,9 @@ def estimate_and_print_metrics(actual_values, predicted_values):
 
 
 def forecast_and_plot_using_prophet(temp_df, model_type, parameter, year_range, pred_year):
-    model = Prophet(changepoint_prior_scale=0.1)
     training_data = temp_df[temp_df["ds"].dt.year <= year_range[1]]
     testing_data = temp_df[temp_df["ds"].dt.year > year_range[1]]
-    model.fit(training_data)
-
-    # Create a DataFrame with future dates for prediction
-    future = model.make_future_dataframe(periods=pred_year, freq="Y")  # Forecast for the next 5 years
-    forecast = model.predict(future).tail(pred_year)
-
-    # Ensure predicted values do not go below zero
-    forecast["yhat"] = forecast["yhat"].clip(lower=0)
-    forecast["yhat_lower"] = forecast["yhat_lower"].clip(lower=0)
-    forecast["yhat_upper"] = forecast["yhat_upper"].clip(lower=0)
+    forecast = queries.prophet_forecast(training_data, pred_year)
 
     # Create a Plotly figure
     fig = go.Figure()
@@ -289,7 +267,7 @@ def forecast_and_plot_using_prophet(temp_df, model_type, parameter, year_range,
         legend=dict(x=1, y=1, traceorder="normal", orientation="v"),
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    plotting.plotly_chart(fig)
     actual_values = testing_data["y"].values
     predicted_values = forecast["yhat"].values
     estimate_and_print_metrics(actual_values, predicted_values)
@@ -298,26 +276,7 @@ def forecast_and_plot_using_prophet(temp_df, model_type, parameter, year_range,
 def forecast_and_plot_using_arima(temp_df, model_type, parameter, year_range, pred_year):
     training_data = temp_df[temp_df["ds"].dt.year <= year_range[1]]
     testing_data = temp_df[temp_df["ds"].dt.year > year_range[1]]
-    order = (1, 1, 1)  # You may need to choose appropriate values for the order parameter
-    model_arima = ARIMA(training_data["y"], order=order)
-    results = model_arima.fit()
-
-    # Forecast for the next 5 years with a smaller uncertainty band
-    forecast_steps = pred_year
-    forecast_arima = results.get_forecast(steps=forecast_steps)
-    forecast_mean = forecast_arima.predicted_mean.values
-    forecast_std = forecast_arima.se_mean.values  # Standard error
-
-    # Ensure predicted values do not go below zero
-    forecast_mean = np.maximum(forecast_mean, 0)
-    confidence_interval_multiplier = 1.0  # Adjust this multiplier for the desired uncertainty band size
-    forecast_upper = np.maximum(forecast_mean + confidence_interval_multiplier * forecast_std, 0)
-    forecast_lower = np.maximum(forecast_mean - confidence_interval_multiplier * forecast_std, 0)
-
-    future_dates = pd.date_range(start=training_data["ds"].max(), periods=forecast_steps + 1, freq="Y")[1:]
-    forecast_df_arima = pd.DataFrame(
-        {"ds": future_dates, "yhat": forecast_mean, "yhat_upper": forecast_upper, "yhat_lower": forecast_lower}
-    )
+    forecast_df_arima = queries.arima_forecast(training_data, pred_year)
 
     fig = go.Figure()
 
@@ -367,22 +326,19 @@ def forecast_and_plot_using_arima(temp_df, model_type, parameter, year_range, pr
     )
 
     # Show the plot
-    st.plotly_chart(fig, use_container_width=True)
+    plotting.plotly_chart(fig)
     actual_values = testing_data["y"].values
     predicted_values = forecast_df_arima["yhat"].values
     estimate_and_print_metrics(actual_values, predicted_values)
 
 
+@profiling.profiled()
 def forecast_pollutant_trends(df, params):
     model_type, parameter, year_range, pred_year, selected_state, selected_county = get_options_for_forecasting(
         df, params
     )
     filtered_df = extract_filtered_df(df, parameter, year_range, selected_state, selected_county)
-    original_df = pd.DataFrame(filtered_df)
-
-    # Rename columns to 'ds' and 'y' as required by Prophet
-    temp_df = original_df.rename(columns={"Year": "ds", "Arithmetic Mean": "y"})
-    temp_df["ds"] = pd.to_datetime(temp_df["ds"].astype(str) + "-12-31")
+    temp_df = queries.forecast_frame(filtered_df, "Arithmetic Mean")
 
     if temp_df["ds"] is None or len(temp_df["ds"]) < 2:
         st.write(
@@ -448,34 +404,15 @@ def get_options_for_forecasting_aqi(df_aqi):
 
 
 def extract_filtered_df_aqi(df_aqi, year_range, selected_state, selected_county):
-    aggregation = {f"Max AQI": "max", f"Median AQI": "mean"}
-    year_df = df_aqi[(df_aqi["Year"] >= year_range[0]) & (df_aqi["Year"] <= 2022)]
-    if selected_state == "All":
-        filtered_df = year_df.groupby(["Year"]).agg(aggregation).reset_index()
-    elif selected_county == "All":
-        state_df = year_df[year_df["State"] == selected_state]
-        filtered_df = state_df.groupby(["Year"]).agg(aggregation).reset_index()
-    else:
-        state_df = year_df[year_df["State"] == selected_state]
-        county_df = state_df[state_df["County"] == selected_county]
-        filtered_df = county_df.groupby(["Year"]).agg(aggregation).reset_index()
-    return filtered_df
+    return queries.aqi_trend_series(
+        df_aqi, (year_range[0], 2022), selected_state, selected_county, utils.dataset_version(AQI_PATH)
+    )
 
 
 def forecast_and_plot_aqi_using_prophet(temp_df_aqi, model_type, parameter, year_range, pred_year):
     training_data = temp_df_aqi[temp_df_aqi["ds"].dt.year <= year_range[1]]
     testing_data = temp_df_aqi[temp_df_aqi["ds"].dt.year > year_range[1]]
-    model = Prophet(changepoint_prior_scale=0.1)
-    model.fit(training_data)
-
-    # Create a DataFrame with future dates for prediction
-    future = model.make_future_dataframe(periods=pred_year, freq="Y")  # Forecast for the next 5 years
-    forecast = model.predict(future).tail(pred_year)
-
-    # Ensure predicted values do not go below zero
-    forecast["yhat"] = forecast["yhat"].clip(lower=0)
-    forecast["yhat_lower"] = forecast["yhat_lower"].clip(lower=0)
-    forecast["yhat_upper"] = forecast["yhat_upper"].clip(lower=0)
+    forecast = queries.prophet_forecast(training_data, pred_year)
 
     # Create a Plotly figure
     fig = go.Figure()
@@ -522,7 +459,7 @@ def forecast_and_plot_aqi_using_prophet(temp_df_aqi, model_type, parameter, year
         legend=dict(x=1, y=1, traceorder="normal", orientation="v"),
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    plotting.plotly_chart(fig)
 
     actual_values = testing_data["y"].values
     predicted_values = forecast["yhat"].values
@@ -532,26 +469,7 @@ def forecast_and_plot_aqi_using_prophet(temp_df_aqi, model_type, parameter, year
 def forecast_and_plot_aqi_using_arima(temp_df_aqi, model_type, parameter, year_range, pred_year):
     training_data = temp_df_aqi[temp_df_aqi["ds"].dt.year <= year_range[1]]
     testing_data = temp_df_aqi[temp_df_aqi["ds"].dt.year > year_range[1]]
-    order = (1, 1, 1)  # You may need to choose appropriate values for the order parameter
-    model_arima = ARIMA(training_data["y"], order=order)
-    results = model_arima.fit()
-
-    # Forecast for the next 5 years with a smaller uncertainty band
-    forecast_steps = pred_year
-    forecast_arima = results.get_forecast(steps=forecast_steps)
-    forecast_mean = forecast_arima.predicted_mean.values
-    forecast_std = forecast_arima.se_mean.values  # Standard error
-
-    # Ensure predicted values do not go below zero
-    forecast_mean = np.maximum(forecast_mean, 0)
-    confidence_interval_multiplier = 1.0  # Adjust this multiplier for the desired uncertainty band size
-    forecast_upper = np.maximum(forecast_mean + confidence_interval_multiplier * forecast_std, 0)
-    forecast_lower = np.maximum(forecast_mean - confidence_interval_multiplier * forecast_std, 0)
-
-    future_dates = pd.date_range(start=training_data["ds"].max(), periods=forecast_steps + 1, freq="Y")[1:]
-    forecast_df_arima = pd.DataFrame(
-        {"ds": future_dates, "yhat": forecast_mean, "yhat_upper": forecast_upper, "yhat_lower": forecast_lower}
-    )
+    forecast_df_arima = queries.arima_forecast(training_data, pred_year)
 
     fig = go.Figure()
 
@@ -597,23 +515,20 @@ def forecast_and_plot_aqi_using_arima(temp_df_aqi, model_type, parameter, year_r
     )
 
     # Show the plot
-    st.plotly_chart(fig, use_container_width=True)
+    plotting.plotly_chart(fig)
 
     actual_values = testing_data["y"].values
     predicted_values = forecast_df_arima["yhat"].values
     estimate_and_print_metrics(actual_values, predicted_values)
 
 
+@profiling.profiled()
 def forecast_aqi_trends(df_aqi):
     model_type, parameter, year_range, pred_year, selected_state, selected_county = get_options_for_forecasting_aqi(
         df_aqi
     )
     filtered_df = extract_filtered_df_aqi(df_aqi, year_range, selected_state, selected_county)
-    original_df = pd.DataFrame(filtered_df)
-
-    # Rename columns to 'ds' and 'y' as required by Prophet
-    temp_df_aqi = original_df.rename(columns={"Year": "ds", f"{parameter}": "y"})
-    temp_df_aqi["ds"] = pd.to_datetime(temp_df_aqi["ds"].astype(str) + "-12-31")
+    temp_df_aqi = queries.forecast_frame(filtered_df, parameter)
 
     if temp_df_aqi["ds"] is None or len(temp_df_aqi[temp_df_aqi["ds"].dt.year <= year_range[1]]["ds"]) < 2:
         st.write(
@@ -657,19 +572,14 @@ def forcast_trends(df, df_aqi, params):
         forecast_aqi_trends(df_aqi)
 
 
-if "df" in st.session_state:
-    df = st.session_state.df
-else:
-    df = utils.load_data("dataset/refined/annual_conc_by_monitor.parquet")
-    st.session_state.df = df
+CONC_PATH = "dataset/refined/annual_conc_by_monitor.parquet"
+AQI_PATH = "dataset/refined/annual_aqi_by_county.csv"
 
-if "df_aqi" in st.session_state:
-    df_aqi = st.session_state.df_aqi
-else:
-    df_aqi = utils.load_data("dataset/refined/annual_aqi_by_county.csv")
-    st.session_state.df_aqi = df_aqi
+df = loader.session_resource("df")
+df_aqi = loader.session_resource("df_aqi")
 
 params = utils.params
 
 write_intro()
 forcast_trends(df, df_aqi, params)
+profiling.debug_panel()
@@ -7,14 +7,11 @@ import json
 import plotly.graph_objects as go
 import hiplot as hip
 import utils
+import profiling
+import loader
+import queries
 from streamlit_extras.app_logo import add_logo
-from prophet import Prophet
-from statsmodels.tsa.arima.model import ARIMA
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression, Lasso, Ridge
-from xgboost import XGBRegressor
-from sklearn.svm import SVR
 from sklearn.metrics import mean_squared_error, r2_score
 
 
@@ -32,6 +29,7 @@ def write_intro():
     )
 
 
+@profiling.profiled()
 def train_and_evaluate_model(df_aqi):
     st.subheader("Model Builder")
     st.write(
@@ -55,39 +53,9 @@ def train_and_evaluate_model(df_aqi):
             default=["Days CO", "Days NO2", "Days Ozone", "Days PM2.5", "Days PM10"],
         )
 
-    col_to_pred = "Median AQI"
-    df_temp_aqi = df_aqi.copy()  # [df_aqi["Year"]==year]
-    df_temp_aqi = df_temp_aqi[feature_names + ["Year"] + [col_to_pred]]
-
-    feature_columns = df_temp_aqi.drop(col_to_pred, axis=1)
-    target_column = df_temp_aqi[col_to_pred]
-    X_train, X_test, y_train, y_test = train_test_split(
-        feature_columns, target_column, test_size=test_size, random_state=42
+    model, predictions, y_test = queries.fit_aqi_model(
+        df_aqi, model_type, feature_names, test_size, utils.dataset_version(AQI_PATH)
     )
-
-    if model_type == "Linear Regressor":
-        model = LinearRegression()
-
-    elif model_type == "Lasso Regressor":
-        # You can specify the alpha parameter for L1 regularization
-        alpha = 1.0  # You may adjust the value
-        model = Lasso(alpha=alpha)
-
-    elif model_type == "XGBoost Regressor":
-        # You can specify hyperparameters based on your requirements
-        model = XGBRegressor()
-
-    elif model_type == "Ridge Regressor":
-        # You can specify the alpha parameter for L2 regularization
-        alpha = 1.0  # You may adjust the value
-        model = Ridge(alpha=alpha)
-
-    elif model_type == "Support Vector Regressor":
-        # You can specify hyperparameters based on your requirements
-        model = SVR()
-
-    model.fit(X_train, y_train)
-    predictions = model.predict(X_test)
     rmse = np.sqrt(mean_squared_error(y_test, predictions))
     r2 = r2_score(y_test, predictions)
     norm_rmse = rmse / (np.max(y_test) - np.min(y_test))
@@ -119,6 +87,7 @@ def train_and_evaluate_model(df_aqi):
     return model, feature_names
 
 
+@profiling.profiled()
 def predict_on_new_data(model, df_aqi, feature_names):
     st.subheader("Predict AQI on custom data")
     st.write(
@@ -198,13 +167,12 @@ def train_and_predict_model_for_aqi(df_aqi):
     predict_on_new_data(model, df_aqi, feature_names)
 
 
-if "df_aqi" in st.session_state:
-    df_aqi = st.session_state.df_aqi
-else:
-    df_aqi = utils.load_data("dataset/refined/annual_aqi_by_county.csv")
-    st.session_state.df_aqi = df_aqi
+AQI_PATH = "dataset/refined/annual_aqi_by_county.csv"
+
+df_aqi = loader.session_resource("df_aqi")
 
 params = utils.params
 
 write_intro()
 train_and_predict_model_for_aqi(df_aqi)
+profiling.debug_panel()
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.utils
+import streamlit as st
+
+import sampling
+
+
+# Points sent per line: about the pixel width of a chart in the page column,
+# beyond which extra points cannot be seen anyway.
+MAX_POINTS = int(os.environ.get("AIRVIZ_MAX_POINTS", "800"))
+# Above this many points in a figure its lines are drawn with WebGL instead of SVG.
+WEBGL_THRESHOLD = int(os.environ.get("AIRVIZ_WEBGL_THRESHOLD", "2000"))
+# Significant digits kept of plotted values, and decimals of coordinates (about 10 m).
+DIGITS = int(os.environ.get("AIRVIZ_PLOT_DIGITS", "4"))
+COORDINATE_DECIMALS = 4
+VALUE_ATTRIBUTES = ["x", "y", "z", "r", "zmin", "zmax"]
+COORDINATE_ATTRIBUTES = ["lat", "lon"]
+# Folder Streamlit serves at app/static/ with server.enableStaticServing.
+STATIC_DIR = "static"
+
+logger = logging.getLogger("airviz.plotting")
+
+
+def _line_x(trace):
+    # x as numbers or datetimes when the trace is a line over increasing x, else
+    # None: bands drawn as closed shapes (fill="toself") are left as they are.
+    if trace.fill == "toself" or trace.x is None or len(trace.x) != len(trace.y):
+        return None
+    x = np.asarray(trace.x)
+    if x.dtype == object:
+        # Plotly keeps datetimes as datetime objects.
+        try:
+            x = pd.to_datetime(x).to_numpy()
+        except (TypeError, ValueError):
+            return None
+    if x.dtype.kind not in "iufM" or not np.all(x[1:] >= x[:-1]):
+        return None
+    return x
+
+
+def downsample(fig, max_points=MAX_POINTS, webgl_threshold=WEBGL_THRESHOLD):
+    # A copy of `fig` with every line over `max_points` reduced with LTTB, and
+    # all line traces switched to Scattergl when the figure still has more than
+    # `webgl_threshold` points. Returns it with the points sent and available.
+    fig = go.Figure(fig)
+    sent = available = 0
+    for trace in fig.data:
+        if trace.type not in ("scatter", "scattergl") or trace.y is None:
+            continue
+        available += len(trace.y)
+        x = _line_x(trace) if len(trace.y) > max_points else None
+        if x is not None:
+            kept = sampling.lttb(x, trace.y, max_points)
+            trace.update(x=np.asarray(trace.x)[kept], y=np.asarray(trace.y)[kept])
+        sent += len(trace.y)
+    if sent > webgl_threshold:
+        traces = [
+            go.Scattergl(
+                {key: value for key, value in trace.to_plotly_json().items() if key != "type"}, skip_invalid=True
+            )
+            if trace.type == "scatter"
+            else trace
+            for trace in fig.data
+        ]
+        fig = go.Figure(traces, layout=fig.layout, frames=fig.frames)
+    return fig, sent, available
+
+
+def plotly_chart(fig, max_points=MAX_POINTS, **kwargs):
+    # st.plotly_chart with long lines downsampled and values rounded to display
+    # precision. The size of what is sent is logged per figure, when INFO is on:
+    # measuring it serializes the whole figure once more.
+    fig, sent, available = downsample(fig, max_points)
+    compact(fig)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("figure %r: %d bytes, %d of %d points", fig.layout.title.text, payload_bytes(fig), sent, available)
+    st.plotly_chart(fig, use_container_width=True, **kwargs)
+    if sent < available:
+        st.caption(f"Showing {sent:,} of {available:,} points, downsampled with LTTB.")
+    return sent, available
+
+
+def round_significant(values, digits=DIGITS):
+    # Values rounded to `digits` significant digits, so they serialize as short decimals.
+    values = np.asarray(values, dtype=float)
+    finite = np.isfinite(values) & (values != 0)
+    exponent = np.zeros(values.shape, dtype=int)
+    exponent[finite] = np.clip(digits - 1 - np.floor(np.log10(np.abs(values[finite]))), -300, 300)
+    # Dividing by an exact power of ten (rather than multiplying by an inexact
+    # one) gives the float closest to the rounded decimal.
+    return np.where(
+        exponent >= 0,
+        np.round(values * 10.0 ** np.maximum(exponent, 0)) / 10.0 ** np.maximum(exponent, 0),
+        np.round(values / 10.0 ** np.maximum(-exponent, 0)) * 10.0 ** np.maximum(-exponent, 0),
+    )
+
+
+def _round_trace(trace, digits):
+    for attribute in VALUE_ATTRIBUTES + COORDINATE_ATTRIBUTES:
+        values = getattr(trace, attribute, None)
+        if values is None or np.asarray(values).dtype.kind != "f":
+            continue
+        if attribute in COORDINATE_ATTRIBUTES:
+            rounded = np.round(np.asarray(values), COORDINATE_DECIMALS)
+        else:
+            rounded = round_significant(values, digits)
+        trace[attribute] = rounded.item() if rounded.ndim == 0 else rounded
+
+
+def compact(fig, digits=DIGITS):
+    # Rounds the float data of every trace and animation frame in place to what
+    # the chart can show: plotly 5 serializes arrays as JSON lists of full
+    # precision floats, so shorter decimals are most of the figure's bytes.
+    for trace in fig.data:
+        _round_trace(trace, digits)
+    for frame in fig.frames:
+        for trace in frame.data:
+            _round_trace(trace, digits)
+    return fig
+
+
+def payload_bytes(fig):
+    # Size of the figure as st.plotly_chart serializes it.
+    return len(json.dumps(fig.to_plotly_json(), cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def static_url(path):
+    # URL of `path` as a static file when Streamlit serves the static folder, so
+    # browsers fetch it once and cache it instead of receiving it inside every
+    # figure; None otherwise. The copy is refreshed when the file changes.
+    if not st.get_option("server.enableStaticServing"):
+        return None
+    target = os.path.join(STATIC_DIR, os.path.basename(path))
+    source = os.stat(path)
+    if not os.path.exists(target) or os.stat(target).st_mtime_ns != source.st_mtime_ns:
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        shutil.copy2(path, target)
+    # Relative, so it also resolves under a server.baseUrlPath.
+    return f"app/static/{os.path.basename(path)}"
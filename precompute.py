@@ -0,0 +1,220 @@
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import time
+
+import artifacts
+import interpolation
+import spatial_index
+import store
+import tensor_store
+import utils
+
+
+STATE_PATH = os.path.join(store.DERIVED_DIR, "precompute_state.json")
+
+
+class Step:
+    # One node of the precompute graph. `run` receives the results of `deps` by
+    # name; `code` lists the modules whose source is part of the step's hash and
+    # `done` tells whether the step's output is still on disk.
+    def __init__(self, name, run, deps=(), code=(), params=None, done=None, source=None):
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.code = list(code)
+        self.params = params or {}
+        self.done = done or (lambda: True)
+        self.source = source
+
+
+def dataset_sha256(name):
+    # Base file plus every ingested partition, using the checksums ingest recorded.
+    partitions = store.read_manifest()["datasets"].get(name, {}).get("partitions", {})
+    digest = hashlib.sha256(store.file_sha256(store.DATASETS[name]).encode())
+    for year in sorted(partitions):
+        digest.update(partitions[year]["sha256"].encode())
+    return digest.hexdigest()
+
+
+def _artifact_step(name, kind):
+    artifact = artifacts.artifact_name(name, kind)
+
+    def run(inputs):
+        version = store.dataset_version(store.DATASETS[name])
+        value = artifacts.ARTIFACTS[kind][0](inputs[f"load:{name}"], name)
+        store.save_artifact(artifact, value, version, artifacts.code_version())
+
+    def done():
+        version = store.dataset_version(store.DATASETS[name])
+        return store.load_artifact(artifact, version, artifacts.code_version()) is not None
+
+    return Step(artifact, run, deps=[f"load:{name}"], code=artifacts.CODE_MODULES, done=done)
+
+
+def _index_exists(path):
+    return lambda: os.path.exists(os.path.join(path, "index.json"))
+
+
+def build_steps():
+    steps = []
+    for name in store.DATASETS:
+        steps.append(
+            Step(
+                f"load:{name}",
+                lambda inputs, name=name: store.load_dataset(name),
+                source=lambda name=name: dataset_sha256(name),
+            )
+        )
+        steps.extend(_artifact_step(name, kind) for kind in artifacts.ARTIFACTS)
+    steps.append(
+        Step(
+            "tensor_store",
+            lambda inputs: tensor_store.build_tensor_store(
+                inputs["load:annual_conc_by_monitor"], tensor_store.DEFAULT_PATH
+            ),
+            deps=["load:annual_conc_by_monitor"],
+            code=[tensor_store, utils],
+            params={"path": tensor_store.DEFAULT_PATH},
+            done=_index_exists(tensor_store.DEFAULT_PATH),
+        )
+    )
+    steps.append(
+        Step(
+            "idw_surfaces",
+            lambda inputs: interpolation.build_surfaces(
+                inputs["load:annual_conc_by_monitor"], interpolation.DEFAULT_PATH
+            ),
+            deps=["load:annual_conc_by_monitor"],
+            code=[interpolation, spatial_index, tensor_store, utils],
+            params={"path": interpolation.DEFAULT_PATH},
+            done=_index_exists(interpolation.DEFAULT_PATH),
+        )
+    )
+    return {step.name: step for step in steps}
+
+
+def read_state():
+    if not os.path.exists(STATE_PATH):
+        return {}
+    with open(STATE_PATH, "r") as state_file:
+        return json.load(state_file)
+
+
+def write_state(state):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    temp_path = STATE_PATH + ".tmp"
+    with open(temp_path, "w") as state_file:
+        json.dump(state, state_file, indent=2, sort_keys=True)
+    os.replace(temp_path, STATE_PATH)
+
+
+def step_hashes(steps):
+    # A step's hash covers its inputs' hashes, its code and its parameters, so a
+    # change anywhere upstream invalidates everything downstream of it.
+    hashes = {}
+
+    def visit(name):
+        if name not in hashes:
+            step = steps[name]
+            payload = {
+                "name": name,
+                "params": step.params,
+                "code": [store.module_sha256(module) for module in step.code],
+                "source": step.source() if step.source else None,
+                "deps": [visit(dep) for dep in step.deps],
+            }
+            hashes[name] = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        return hashes[name]
+
+    for name in steps:
+        visit(name)
+    return hashes
+
+
+def plan(steps, hashes, state, targets=None, force=False):
+    # Steps to run: stale targets plus whatever they need; a dataset is only loaded
+    # when something downstream of it actually has to be rebuilt.
+    targets = [name for name in (targets or steps) if steps[name].deps or not steps[name].source]
+    stale = {
+        name for name in targets if force or state.get(name, {}).get("hash") != hashes[name] or not steps[name].done()
+    }
+    pending = list(stale)
+    while pending:
+        for dep in steps[pending.pop()].deps:
+            if dep not in stale:
+                stale.add(dep)
+                pending.append(dep)
+    return stale
+
+
+def run(steps, to_run, hashes, state, workers=None):
+    report = {name: {"status": "skipped", "seconds": state.get(name, {}).get("seconds", 0.0)} for name in steps}
+    results = {}
+    remaining = set(to_run)
+    running = {}
+    start = time.perf_counter()
+
+    def execute(step):
+        step_start = time.perf_counter()
+        result = step.run({dep: results[dep] for dep in step.deps})
+        return result, time.perf_counter() - step_start
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        while remaining or running:
+            ready = [name for name in remaining if all(dep in results for dep in steps[name].deps)]
+            for name in ready:
+                remaining.discard(name)
+                running[executor.submit(execute, steps[name])] = name
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                results[name], seconds = future.result()
+                report[name] = {"status": "ran", "seconds": seconds}
+                if steps[name].deps or not steps[name].source:
+                    state[name] = {"hash": hashes[name], "seconds": seconds}
+                    write_state(state)
+            # Drop loaded datasets once every step that reads them has finished.
+            for name in list(results):
+                if not any(name in steps[other].deps for other in remaining | set(running.values())):
+                    results[name] = None
+    return report, time.perf_counter() - start
+
+
+def print_report(report, wall_seconds):
+    width = max(len(name) for name in report)
+    for name, entry in report.items():
+        print(f"  {name:<{width}}  {entry['status']:<7} {entry['seconds']:8.2f} s")
+    ran = [entry["seconds"] for entry in report.values() if entry["status"] == "ran"]
+    print(f"{len(ran)} steps ran ({sum(ran):.2f} s of work) in {wall_seconds:.2f} s wall time")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build every derived artifact the pages serve, skipping unchanged steps"
+    )
+    parser.add_argument("steps", nargs="*", help="only build these steps (and what they depend on)")
+    parser.add_argument("--force", action="store_true", help="rebuild even when nothing changed")
+    parser.add_argument("--workers", type=int, default=None, help="parallel steps (default: one per CPU)")
+    parser.add_argument("--list", action="store_true", help="list the steps and whether they are up to date")
+    args = parser.parse_args()
+
+    steps = build_steps()
+    unknown = [name for name in args.steps if name not in steps]
+    if unknown:
+        parser.error(f"unknown steps: {', '.join(unknown)} (choose from {', '.join(steps)})")
+    hashes = step_hashes(steps)
+    state = read_state()
+    to_run = plan(steps, hashes, state, args.steps, args.force)
+    if args.list:
+        for name, step in steps.items():
+            print(f"  {name:<40} {'stale' if name in to_run else 'up to date':<10} <- {', '.join(step.deps) or '-'}")
+        return
+    report, wall_seconds = run(steps, to_run, hashes, state, args.workers)
+    print_report(report, wall_seconds)
+
+
+if __name__ == "__main__":
+    main()
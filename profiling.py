@@ -0,0 +1,196 @@
+import contextlib
+import functools
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+import streamlit as st
+
+
+ENABLED = os.environ.get("AIRVIZ_PROFILE", "1") != "0"
+# tracemalloc slows allocation-heavy code down noticeably, so memory is opt-in.
+TRACE_MEMORY = os.environ.get("AIRVIZ_PROFILE_MEMORY", "0") == "1"
+# Opt-in Prometheus text file of the running totals per function, rewritten at
+# most every METRICS_INTERVAL seconds (for node_exporter's textfile collector).
+METRICS_PATH = os.environ.get("AIRVIZ_METRICS_PATH", "")
+METRICS_INTERVAL = float(os.environ.get("AIRVIZ_METRICS_INTERVAL", "15"))
+
+METRICS = {
+    "airviz_call_wall_seconds": "Wall-clock time of instrumented calls.",
+    "airviz_call_cpu_seconds": "Process CPU time spent during instrumented calls.",
+    "airviz_call_peak_memory_bytes": "Peak memory allocated by Python during instrumented calls.",
+}
+
+_local = threading.local()
+_fallback_calls = []
+_metrics_lock = threading.Lock()
+# (metric, function) -> [sum, count] since the process started.
+_totals = {}
+_last_write = 0.0
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _calls():
+    # Calls of the current rerun: per session inside Streamlit, per process outside
+    # it, or those of a `collecting()` block on threads without a session.
+    if getattr(_local, "calls", None) is not None:
+        return _local.calls
+    try:
+        return st.session_state.setdefault("_profiling_calls", [])
+    except Exception:
+        return _fallback_calls
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@contextlib.contextmanager
+def collecting():
+    # Collects the calls made on this thread into a list of its own, for worker
+    # threads whose calls are handed back to a session with `extend`.
+    _local.calls = []
+    try:
+        yield _local.calls
+    finally:
+        _local.calls = None
+
+
+def extend(records):
+    _calls().extend(records)
+
+
+def record_metrics(record, path=None):
+    global _last_write
+    path = METRICS_PATH if path is None else path
+    values = {
+        "airviz_call_wall_seconds": record["wall (s)"],
+        "airviz_call_cpu_seconds": record["cpu (s)"],
+        "airviz_call_peak_memory_bytes": record["peak memory (MB)"] * 2**20,
+    }
+    with _metrics_lock:
+        for name, value in values.items():
+            if value == value:
+                total = _totals.setdefault((name, record["function"]), [0.0, 0])
+                total[0] += value
+                total[1] += 1
+        due = bool(path) and time.monotonic() - _last_write >= METRICS_INTERVAL
+        if due:
+            _last_write = time.monotonic()
+    if due:
+        write_metrics(path)
+
+
+def metrics_text():
+    with _metrics_lock:
+        totals = sorted((name, function, total[0], total[1]) for (name, function), total in _totals.items())
+    lines = []
+    for name, help_text in METRICS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+        for metric, function, total, count in totals:
+            if metric == name:
+                labels = f'function="{_escape(function)}"'
+                lines += [f"{name}_sum{{{labels}}} {total!r}", f"{name}_count{{{labels}}} {count}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path=None):
+    # Written to a temporary file and renamed over the old one, so scrapers
+    # never read a half-written file.
+    path = METRICS_PATH if path is None else path
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".prom")
+    try:
+        with os.fdopen(descriptor, "w") as metrics_file:
+            metrics_file.write(metrics_text())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+@contextlib.contextmanager
+def profile(name):
+    # Records wall time, CPU time and (with AIRVIZ_PROFILE_MEMORY=1) the peak of
+    # Python allocations made inside the block, including nested blocks.
+    if not ENABLED:
+        yield
+        return
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    stack = _stack()
+    frame = {"memory": tracemalloc.is_tracing()}
+    if frame["memory"]:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            # Keep the peak the enclosing block reached so far before resetting it for this one.
+            stack[-1]["peak"] = max(stack[-1].get("peak", 0), peak)
+        tracemalloc.reset_peak()
+        frame["start_memory"] = frame["peak"] = current
+    stack.append(frame)
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+        stack.pop()
+        peak_mb = float("nan")
+        if frame["memory"]:
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            peak_mb = (peak - frame["start_memory"]) / 2**20
+            if stack:
+                stack[-1]["peak"] = max(stack[-1].get("peak", 0), peak)
+        record = {
+            "function": name,
+            "depth": len(stack),
+            "wall (s)": wall,
+            "cpu (s)": cpu,
+            "peak memory (MB)": peak_mb,
+            "timestamp": time.time(),
+            "start": start_wall,
+        }
+        _calls().append(record)
+        try:
+            record_metrics(record)
+        except OSError:
+            pass
+
+
+def profiled(name=None):
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def calls():
+    frame = pd.DataFrame(_calls(), columns=["function", "depth", "wall (s)", "cpu (s)", "peak memory (MB)", "start"])
+    return frame.sort_values("start", kind="stable").drop(columns="start").reset_index(drop=True)
+
+
+def debug_panel():
+    # Call at the end of a page: shows this rerun's calls in the sidebar when
+    # enabled, then starts collecting afresh for the next rerun.
+    if ENABLED and st.sidebar.checkbox("Show timing panel", value=False, key="profiling_panel"):
+        with st.sidebar.expander("Timings of this rerun", expanded=True):
+            frame = calls()
+            frame["function"] = ["  " * depth + function for depth, function in zip(frame["depth"], frame["function"])]
+            st.dataframe(frame.drop(columns="depth").round(3), hide_index=True)
+    _calls().clear()
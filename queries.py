@@ -0,0 +1,397 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+import artifacts
+import cache
+import profiling
+import snapshot
+import stats
+import store
+
+
+CONC_PATH = store.DATASETS["annual_conc_by_monitor"]
+AQI_PATH = store.DATASETS["annual_aqi_by_county"]
+
+# Data queries, figures and model fits behind the pages. Each takes the loaded
+# frame as `_df` plus the dataset `version`, so results are cached per version
+# in the shared cache.QueryCache and the artifacts are only read on a miss.
+
+
+def select_trend_series(yearly_series, parameter, measurement_type, year_range, state, county):
+    series = artifacts.select_series(yearly_series, state, county, "State Name", "County Name")
+    series = series[
+        (series["Parameter Name"] == parameter)
+        & (series["Sample Duration"] == measurement_type)
+        & (series["Year"] >= year_range[0])
+        & (series["Year"] <= year_range[1])
+    ]
+    return series.sort_values("Year")[["Year"] + list(artifacts.CONC_SERIES_AGGREGATION)].reset_index(drop=True)
+
+
+def select_aqi_trend_series(yearly_series, year_range, state, county):
+    series = artifacts.select_series(yearly_series, state, county, "State", "County")
+    series = series[(series["Year"] >= year_range[0]) & (series["Year"] <= year_range[1])]
+    return series.sort_values("Year")[["Year"] + list(artifacts.AQI_SERIES_AGGREGATION)].reset_index(drop=True)
+
+
+def select_state_year(state_year, year, columns, parameter=None):
+    selected = state_year["Year"] == year
+    if parameter is not None:
+        selected &= state_year["Parameter Name"] == parameter
+    return state_year.loc[selected, columns]
+
+
+def select_comparison_series(yearly_series, durations, states, counties, year_range):
+    # The yearly series of every selected parameter (at its sample duration in
+    # `durations`) in every selected state and (state, county) pair, national
+    # when neither is given. The (geography, Year) aggregates are grouped
+    # already, so each level is one filter and join against all the selections
+    # together, whose cost hardly depends on how many there are.
+    measurements = pd.DataFrame(list(durations.items()), columns=["Parameter Name", "Sample Duration"])
+    levels = []
+    if states:
+        levels.append(("state", pd.DataFrame({"State Name": list(states)})))
+    if counties:
+        levels.append(("county", pd.DataFrame(list(counties), columns=["State Name", "County Name"])))
+    if not levels:
+        levels.append(("national", None))
+    parts = []
+    for level, geographies in levels:
+        selections = measurements if geographies is None else measurements.merge(geographies, how="cross")
+        series = yearly_series[level]
+        # Narrowed with a cheap isin per key first, so the join only hashes the rows it keeps.
+        selected = (series["Year"] >= year_range[0]) & (series["Year"] <= year_range[1])
+        for column in selections.columns:
+            selected &= series[column].isin(selections[column].unique())
+        series = series[selected].merge(selections, on=list(selections.columns))
+        if level == "national":
+            geography = pd.Series("USA", index=series.index)
+        elif level == "state":
+            geography = series["State Name"].astype(str)
+        else:
+            geography = series["County Name"].astype(str) + ", " + series["State Name"].astype(str)
+        parts.append(series.assign(Geography=geography))
+    series = pd.concat(parts, ignore_index=True).sort_values(["Parameter Name", "Geography", "Year"])
+    return series[["Geography", "Parameter Name", "Year"] + list(artifacts.CONC_SERIES_AGGREGATION)].reset_index(
+        drop=True
+    )
+
+
+@profiling.profiled("queries.trend_series")
+@cache.cached("queries")
+def trend_series(_df, parameter, measurement_type, year_range, state, county, version):
+    yearly_series = artifacts.get_artifact(_df, CONC_PATH, "yearly_series", version)
+    return select_trend_series(yearly_series, parameter, measurement_type, year_range, state, county)
+
+
+@profiling.profiled("queries.aqi_trend_series")
+@cache.cached("queries")
+def aqi_trend_series(_df_aqi, year_range, state, county, version):
+    yearly_series = artifacts.get_artifact(_df_aqi, AQI_PATH, "yearly_series", version)
+    return select_aqi_trend_series(yearly_series, year_range, state, county)
+
+
+def sample_duration(_df, parameter, version):
+    # The duration the pages plot by default: hourly when the parameter has it.
+    durations = artifacts.get_artifact(_df, CONC_PATH, "catalog", version)["sample_durations"].get(parameter, set())
+    if not durations:
+        raise ValueError(f"no data for parameter {parameter!r}")
+    return "1 HOUR" if "1 HOUR" in durations else sorted(durations)[0]
+
+
+@profiling.profiled("queries.comparison_series")
+@cache.cached("queries")
+def comparison_series(_df, parameters, states, counties, year_range, version):
+    durations = {parameter: sample_duration(_df, parameter, version) for parameter in parameters}
+    yearly_series = artifacts.get_artifact(_df, CONC_PATH, "yearly_series", version)
+    return select_comparison_series(yearly_series, durations, states, counties, year_range)
+
+
+@cache.cached("queries")
+def concentration_by_state(_df, parameter, year, version):
+    state_year = artifacts.get_artifact(_df, CONC_PATH, "state_year", version)
+    return select_state_year(state_year, year, ["State Name", "Arithmetic Mean"], parameter).reset_index(drop=True)
+
+
+@cache.cached("queries")
+def aqi_by_state(_df_aqi, column, year, version):
+    state_year = artifacts.get_artifact(_df_aqi, AQI_PATH, "state_year", version)
+    return select_state_year(state_year, year, ["State", column]).reset_index(drop=True)
+
+
+@cache.cached("queries")
+def concentration_by_state_year(_df, parameter, version):
+    # Every year at once: a State x Year pivot of the values the choropleth maps.
+    state_year = artifacts.get_artifact(_df, CONC_PATH, "state_year", version)
+    rows = state_year[state_year["Parameter Name"] == parameter]
+    return rows.pivot(index="State Name", columns="Year", values="Arithmetic Mean").sort_index(axis=1)
+
+
+@cache.cached("queries")
+def aqi_by_state_year(_df_aqi, column, version):
+    state_year = artifacts.get_artifact(_df_aqi, AQI_PATH, "state_year", version)
+    return state_year.pivot(index="State", columns="Year", values=column).sort_index(axis=1)
+
+
+def change_table(pivot, year_a, year_b):
+    # Per-state values in `year_a` and `year_b`, their change, and the OLS trend
+    # slope over the years in between, for every state at once from the pivot.
+    years = pivot.loc[:, (pivot.columns >= year_a) & (pivot.columns <= year_b)]
+    trends = stats.trend_slopes(years)
+    before = pivot[year_a] if year_a in pivot.columns else np.nan
+    after = pivot[year_b] if year_b in pivot.columns else np.nan
+    table = pd.DataFrame({str(year_a): before, str(year_b): after}, index=pivot.index)
+    table["Change"] = table[str(year_b)] - table[str(year_a)]
+    table["Change (%)"] = table["Change"] / table[str(year_a)].where(table[str(year_a)] != 0) * 100
+    table["Slope (per year)"] = trends["slope"]
+    table["Years with data"] = trends["count"]
+    return table.reset_index()
+
+
+@cache.cached("queries")
+def concentration_change(_df, parameter, year_a, year_b, version):
+    return change_table(concentration_by_state_year(_df, parameter, version), year_a, year_b)
+
+
+@cache.cached("queries")
+def aqi_change(_df_aqi, column, year_a, year_b, version):
+    return change_table(aqi_by_state_year(_df_aqi, column, version), year_a, year_b)
+
+
+def change_choropleth(table, geojson, measure, title, mapbox_layout):
+    # Diverging colours centred on no change, so falls and rises read apart.
+    fig = px.choropleth_mapbox(
+        table,
+        geojson=geojson,
+        locations=table.columns[0],
+        featureidkey="properties.shapeName",
+        color=measure,
+        color_continuous_scale="RdBu_r",
+        color_continuous_midpoint=0,
+        hover_data=list(table.columns[1:]),
+    )
+    fig.update_layout(title=title, title_font=dict(size=20), margin=dict(b=10), mapbox=mapbox_layout)
+    return fig
+
+
+def animated_choropleth(pivot, geojson, colorscale, title, mapbox_layout, year):
+    # One frame per year for scrubbing in the browser. The geometry is sent once
+    # with the base trace; frames only carry each year's states and values, and
+    # the colour range is fixed over all years so frames compare.
+    def year_trace(frame_year):
+        values = pivot[frame_year].dropna()
+        return go.Choroplethmapbox(locations=values.index, z=values.to_numpy())
+
+    zmin, zmax = np.nanmin(pivot.to_numpy()), np.nanmax(pivot.to_numpy())
+    years = list(pivot.columns)
+    year = year if year in years else years[-1]
+    fig = go.Figure(year_trace(year))
+    fig.update_traces(
+        geojson=geojson,
+        featureidkey="properties.shapeName",
+        colorscale=colorscale,
+        zmin=zmin,
+        zmax=zmax,
+        marker_line_width=0.5,
+        hovertemplate="%{location}: %{z}<extra></extra>",
+    )
+    fig.frames = [go.Frame(data=[year_trace(frame_year)], traces=[0], name=str(frame_year)) for frame_year in years]
+    animation = dict(mode="immediate", frame=dict(duration=400, redraw=True), transition=dict(duration=0))
+    fig.update_layout(
+        title=title,
+        title_font=dict(size=20),
+        margin=dict(b=10),
+        mapbox=mapbox_layout,
+        sliders=[
+            dict(
+                active=years.index(year),
+                currentvalue=dict(prefix="Year: "),
+                pad=dict(t=30),
+                steps=[
+                    dict(label=str(frame_year), method="animate", args=[[str(frame_year)], animation])
+                    for frame_year in years
+                ],
+            )
+        ],
+        updatemenus=[
+            dict(
+                type="buttons",
+                direction="left",
+                x=0,
+                y=0,
+                xanchor="right",
+                yanchor="top",
+                pad=dict(t=30, r=10),
+                buttons=[
+                    dict(label="Play", method="animate", args=[None, {**animation, "fromcurrent": True}]),
+                    dict(label="Pause", method="animate", args=[[None], animation]),
+                ],
+            )
+        ],
+    )
+    return fig
+
+
+@profiling.profiled("queries.concentration_choropleth_animation")
+@cache.cached("figures")
+def concentration_choropleth_animation(_df, _geojson, parameter, year, mapbox_layout, version):
+    pivot = concentration_by_state_year(_df, parameter, version)
+    return animated_choropleth(pivot, _geojson, "reds", f"Concentration of {parameter}", mapbox_layout, year)
+
+
+@profiling.profiled("queries.aqi_choropleth_animation")
+@cache.cached("figures")
+def aqi_choropleth_animation(_df_aqi, _geojson, column, year, mapbox_layout, version):
+    return animated_choropleth(
+        aqi_by_state_year(_df_aqi, column, version), _geojson, "Reds", column, mapbox_layout, year
+    )
+
+
+@profiling.profiled("queries.concentration_choropleth")
+@cache.cached("figures")
+def concentration_choropleth(_df, _geojson, parameter, year, mapbox_layout, version):
+    col = "Arithmetic Mean"
+    fig = px.choropleth_mapbox(
+        concentration_by_state(_df, parameter, year, version),
+        geojson=_geojson,
+        locations="State Name",
+        featureidkey="properties.shapeName",
+        color=col,
+        color_continuous_scale="reds",
+    )
+    fig.update_layout(
+        title=f"Concentration of {parameter} - {year}",
+        title_font=dict(size=20),
+        margin=dict(b=10),
+        mapbox=mapbox_layout,
+    )
+    return fig
+
+
+@profiling.profiled("queries.aqi_choropleth")
+@cache.cached("figures")
+def aqi_choropleth(_df_aqi, _geojson, column, year, mapbox_layout, version):
+    fig = px.choropleth_mapbox(
+        aqi_by_state(_df_aqi, column, year, version),
+        geojson=_geojson,
+        locations="State",
+        featureidkey="properties.shapeName",
+        color=column,
+        color_continuous_scale="Reds",
+    )
+    fig.update_layout(title=f"{column} - {year}", title_font=dict(size=20), mapbox=mapbox_layout)
+    return fig
+
+
+def forecast_frame(series, column):
+    # The `ds`/`y` frame the forecasters take, one point per year dated December 31st.
+    frame = series[["Year", column]].rename(columns={"Year": "ds", column: "y"})
+    frame["ds"] = pd.to_datetime(frame["ds"].astype(str) + "-12-31")
+    return frame
+
+
+@profiling.profiled("queries.prophet_forecast")
+@cache.cached("models")
+def prophet_forecast(training_data, pred_year):
+    # Imported here so pages that never forecast don't pay for loading Prophet.
+    from prophet import Prophet
+
+    model = Prophet(changepoint_prior_scale=0.1)
+    model.fit(training_data)
+
+    # Create a DataFrame with future dates for prediction
+    future = model.make_future_dataframe(periods=pred_year, freq="Y")
+    forecast = model.predict(future).tail(pred_year)
+
+    # Ensure predicted values do not go below zero
+    forecast["yhat"] = forecast["yhat"].clip(lower=0)
+    forecast["yhat_lower"] = forecast["yhat_lower"].clip(lower=0)
+    forecast["yhat_upper"] = forecast["yhat_upper"].clip(lower=0)
+    return forecast
+
+
+@profiling.profiled("queries.arima_forecast")
+@cache.cached("models")
+def arima_forecast(training_data, pred_year):
+    from statsmodels.tsa.arima.model import ARIMA
+
+    order = (1, 1, 1)  # You may need to choose appropriate values for the order parameter
+    results = ARIMA(training_data["y"], order=order).fit()
+
+    forecast_arima = results.get_forecast(steps=pred_year)
+    forecast_mean = forecast_arima.predicted_mean.values
+    forecast_std = forecast_arima.se_mean.values  # Standard error
+
+    # Ensure predicted values do not go below zero
+    forecast_mean = np.maximum(forecast_mean, 0)
+    confidence_interval_multiplier = 1.0  # Adjust this multiplier for the desired uncertainty band size
+    forecast_upper = np.maximum(forecast_mean + confidence_interval_multiplier * forecast_std, 0)
+    forecast_lower = np.maximum(forecast_mean - confidence_interval_multiplier * forecast_std, 0)
+
+    future_dates = pd.date_range(start=training_data["ds"].max(), periods=pred_year + 1, freq="Y")[1:]
+    return pd.DataFrame(
+        {"ds": future_dates, "yhat": forecast_mean, "yhat_upper": forecast_upper, "yhat_lower": forecast_lower}
+    )
+
+
+@profiling.profiled("queries.fit_aqi_model")
+@cache.cached("models")
+def fit_aqi_model(_df_aqi, model_type, feature_names, test_size, version):
+    # Fitted models also go into the warm-start snapshot, so the same selection
+    # is not refit after a restart.
+    key = f"model:{model_type}:{','.join(feature_names)}:{test_size}:{version}"
+    fitted = snapshot.recall(key)
+    if fitted is not None:
+        return fitted
+
+    return snapshot.remember(key, train_aqi_model(_df_aqi, model_type, feature_names, test_size))
+
+
+def train_aqi_model(df_aqi, model_type, feature_names, test_size):
+    from sklearn.model_selection import train_test_split
+
+    col_to_pred = "Median AQI"
+    df_temp_aqi = df_aqi[feature_names + ["Year"] + [col_to_pred]]
+
+    feature_columns = df_temp_aqi.drop(col_to_pred, axis=1)
+    target_column = df_temp_aqi[col_to_pred]
+    X_train, X_test, y_train, y_test = train_test_split(
+        feature_columns, target_column, test_size=test_size, random_state=42
+    )
+
+    if model_type == "Linear Regressor":
+        from sklearn.linear_model import LinearRegression
+
+        model = LinearRegression()
+
+    elif model_type == "Lasso Regressor":
+        from sklearn.linear_model import Lasso
+
+        # You can specify the alpha parameter for L1 regularization
+        alpha = 1.0  # You may adjust the value
+        model = Lasso(alpha=alpha)
+
+    elif model_type == "XGBoost Regressor":
+        from xgboost import XGBRegressor
+
+        # You can specify hyperparameters based on your requirements
+        model = XGBRegressor()
+
+    elif model_type == "Ridge Regressor":
+        from sklearn.linear_model import Ridge
+
+        # You can specify the alpha parameter for L2 regularization
+        alpha = 1.0  # You may adjust the value
+        model = Ridge(alpha=alpha)
+
+    elif model_type == "Support Vector Regressor":
+        from sklearn.svm import SVR
+
+        # You can specify hyperparameters based on your requirements
+        model = SVR()
+
+    model.fit(X_train, y_train)
+    predictions = model.predict(X_test)
+    return model, predictions, y_test
@@ -0,0 +1,132 @@
+import json
+
+import numpy as np
+import streamlit as st
+
+import store
+import utils
+
+
+# Region sets monitors can be filtered by: (GeoJSON file, property holding the
+# region name). Air basins, metro areas and the like are added here.
+REGION_FILES = {"States": (store.GEOJSON_PATH, "shapeName")}
+# Upper bound on points x edges evaluated at once, to keep memory bounded.
+BLOCK_SIZE = 4_000_000
+
+
+def _polygon_rings(geometry):
+    if geometry["type"] == "Polygon":
+        return geometry["coordinates"]
+    if geometry["type"] == "MultiPolygon":
+        return [ring for polygon in geometry["coordinates"] for ring in polygon]
+    raise ValueError(f"unsupported geometry type {geometry['type']}")
+
+
+class RegionIndex:
+    def __init__(self, geojson, name_key="shapeName"):
+        self.names = []
+        self.bounds = []
+        self.edges = []
+        for feature in geojson["features"]:
+            if not feature.get("geometry"):
+                continue
+            rings = [np.asarray(ring, dtype=np.float64)[:, :2] for ring in _polygon_rings(feature["geometry"])]
+            # Edges of every ring (outer boundaries and holes) of the feature; the
+            # even-odd crossing rule then handles holes and multi-part regions alike.
+            start = np.concatenate([ring[:-1] for ring in rings])
+            end = np.concatenate([ring[1:] for ring in rings])
+            all_points = np.concatenate(rings)
+            self.names.append(feature["properties"][name_key])
+            self.bounds.append((*all_points.min(axis=0), *all_points.max(axis=0)))
+            self.edges.append(self._banded_edges(start, end))
+        self.bounds = np.array(self.bounds)
+
+    def _banded_edges(self, start, end):
+        # Split the feature into horizontal latitude bands and keep, per band, the
+        # edges whose latitude span touches it (CSR layout), so a point is only
+        # tested against edges that can actually cross its horizontal ray.
+        y_min = np.minimum(start[:, 1], end[:, 1])
+        y_max = np.maximum(start[:, 1], end[:, 1])
+        n_bands = int(np.clip(np.sqrt(len(start)), 1, 1024))
+        y0 = y_min.min()
+        height = max((y_max.max() - y0) / n_bands, 1e-12)
+        first = np.clip(((y_min - y0) / height).astype(np.int64), 0, n_bands - 1)
+        last = np.clip(((y_max - y0) / height).astype(np.int64), 0, n_bands - 1)
+        spans = last - first + 1
+        edge_ids = np.repeat(np.arange(len(start)), spans)
+        band_ids = np.repeat(first, spans) + np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        order = np.argsort(band_ids, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(band_ids, minlength=n_bands))])
+        return {
+            "edges": (start[:, 0], start[:, 1], end[:, 0], end[:, 1]),
+            "y0": y0,
+            "height": height,
+            "n_bands": n_bands,
+            "offsets": offsets,
+            "members": edge_ids[order],
+        }
+
+    def _crossings_odd(self, edges, lons, lats):
+        x1, y1, x2, y2 = edges
+        inside = np.zeros(len(lons), dtype=bool)
+        step = max(1, BLOCK_SIZE // max(len(x1), 1))
+        for i in range(0, len(lons), step):
+            px = lons[i : i + step, None]
+            py = lats[i : i + step, None]
+            straddles = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing_x = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+            crossings = np.count_nonzero(straddles & (px < crossing_x), axis=1)
+            inside[i : i + step] = crossings % 2 == 1
+        return inside
+
+    def _contains(self, banded, lons, lats):
+        inside = np.zeros(len(lons), dtype=bool)
+        bands = np.clip(((lats - banded["y0"]) / banded["height"]).astype(np.int64), 0, banded["n_bands"] - 1)
+        order = np.argsort(bands, kind="stable")
+        boundaries = np.flatnonzero(np.diff(bands[order])) + 1
+        for group in np.split(order, boundaries):
+            band = bands[group[0]]
+            members = banded["members"][banded["offsets"][band] : banded["offsets"][band + 1]]
+            if members.size:
+                edges = tuple(coords[members] for coords in banded["edges"])
+                inside[group] = self._crossings_odd(edges, lons[group], lats[group])
+        return inside
+
+    def locate(self, lats, lons):
+        # Region name per point (None outside every region); the first matching region wins.
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(len(lats), None, dtype=object)
+        unassigned = np.ones(len(lats), dtype=bool)
+        for name, (min_lon, min_lat, max_lon, max_lat), banded in zip(self.names, self.bounds, self.edges):
+            candidates = np.flatnonzero(
+                unassigned & (lons >= min_lon) & (lons <= max_lon) & (lats >= min_lat) & (lats <= max_lat)
+            )
+            if candidates.size == 0:
+                continue
+            hits = candidates[self._contains(banded, lons[candidates], lats[candidates])]
+            result[hits] = name
+            unassigned[hits] = False
+        return result
+
+
+@st.cache_resource
+def load_region_index(geojson_path, name_key="shapeName"):
+    with open(geojson_path, "r") as geojson_file:
+        return RegionIndex(json.load(geojson_file), name_key)
+
+
+@st.cache_data
+def assign_monitors_to_regions(_df, geojson_path, name_key, version):
+    # One row per monitor site with the region it falls in, e.g.
+    # assign_monitors_to_regions(df, "geojson/USA_state.geojson", "shapeName", version).
+    sites = _df.groupby(utils.site_columns, sort=True)[utils.site_attributes].first().reset_index()
+    region_index = load_region_index(geojson_path, name_key)
+    sites["Region"] = region_index.locate(sites["Latitude"].to_numpy(), sites["Longitude"].to_numpy())
+    return sites
+
+
+def attach_regions(df, sites):
+    # Broadcast per-site regions back onto measurement rows.
+    return df.merge(sites[utils.site_columns + ["Region"]], on=utils.site_columns, how="left")
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+def stratified_sample(df, by, max_rows, seed=42):
+    # Keep roughly `max_rows` rows while taking the same fraction from every
+    # stratum, with at least one row from each so small states/years survive.
+    if max_rows is None or len(df) <= max_rows:
+        return df
+    fraction = max_rows / len(df)
+    shuffled = df.sample(frac=1, random_state=seed)
+    grouped = shuffled.groupby(by, sort=False, dropna=False)
+    position = grouped.cumcount().to_numpy()
+    quota = np.maximum(1, np.round(grouped[shuffled.columns[0]].transform("size").to_numpy() * fraction))
+    return shuffled[position < quota].sort_index()
+
+
+def lttb(x, y, n_out):
+    # Indices of the `n_out` points Largest-Triangle-Three-Buckets keeps of the
+    # line y(x), with x sorted: the first and last point, and from each bucket in
+    # between the point spanning the largest triangle with the point kept before
+    # it and the mean of the next bucket. Missing y values are never picked.
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    x = (x.astype("int64") if x.dtype.kind == "M" else x).astype(float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(y)
+    # Prefix sums for the bucket means, skipping missing values.
+    x_sums = np.concatenate([[0.0], np.cumsum(np.where(finite, x, 0.0))])
+    y_sums = np.concatenate([[0.0], np.cumsum(np.where(finite, y, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(finite)])
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = end, edges[bucket + 2]
+        else:
+            next_start, next_end = n - 1, n
+        count = max(counts[next_end] - counts[next_start], 1)
+        mean_x = (x_sums[next_end] - x_sums[next_start]) / count
+        mean_y = (y_sums[next_end] - y_sums[next_start]) / count
+        a_x, a_y = x[kept[bucket]], y[kept[bucket]]
+        area = np.abs((a_x - mean_x) * (y[start:end] - a_y) - (a_x - x[start:end]) * (mean_y - a_y))
+        kept[bucket + 1] = start + np.argmax(np.where(np.isfinite(area), area, -1.0))
+    return kept
@@ -0,0 +1,158 @@
+import argparse
+import time
+
+import numpy as np
+import streamlit as st
+
+import store
+
+
+KEYS = ["State", "County"]
+TRAJECTORIES = ["Median AQI", "Max AQI"]
+POLLUTANT_DAYS = ["Days CO", "Days NO2", "Days Ozone", "Days PM2.5", "Days PM10"]
+# Counties with fewer observed years are left out rather than mostly filled in.
+MIN_YEARS = 5
+# Sakoe-Chiba band of the DTW rerank, in years, and how many cosine matches it reranks.
+DTW_WINDOW = 2
+DTW_CANDIDATES = 50
+
+
+class CountyIndex:
+    # One normalized feature vector per county: its yearly Median and Max AQI
+    # (gaps interpolated, ends carried) as z-scores against all counties that
+    # year, plus its share of days by main pollutant. Each block is weighted
+    # equally and rows are unit length, so cosine similarity is a dot product.
+    def __init__(self, df_aqi, min_years=MIN_YEARS):
+        observed = df_aqi.groupby(KEYS, sort=True)["Year"].nunique()
+        counties = observed.index[observed >= min_years]
+        rows = df_aqi.set_index(KEYS).loc[counties].reset_index()
+        self.counties = counties.to_frame(index=False)
+        self.years = np.sort(rows["Year"].unique())
+
+        trajectories = []
+        for column in TRAJECTORIES:
+            yearly = rows.pivot_table(index=KEYS, columns="Year", values=column, aggfunc="mean")
+            yearly = yearly.reindex(index=counties, columns=self.years)
+            yearly = yearly.interpolate(axis=1, limit_area="inside").ffill(axis=1).bfill(axis=1)
+            z = (yearly - yearly.mean()) / yearly.std(ddof=0).replace(0, 1)
+            trajectories.append(z.to_numpy())
+        blocks = list(trajectories)
+        days = rows.groupby(KEYS, sort=True)[POLLUTANT_DAYS].sum().reindex(counties)
+        mix = days.div(days.sum(axis=1).replace(0, 1), axis=0)
+        blocks.append(((mix - mix.mean()) / mix.std(ddof=0).replace(0, 1)).to_numpy())
+
+        # (counties, years, trajectories) for the DTW rerank.
+        self.trajectories = np.stack(trajectories, axis=2)
+        vectors = np.hstack([block / np.sqrt(block.shape[1]) for block in blocks])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = (vectors / np.where(norms > 0, norms, 1)).astype(np.float32)
+        self.positions = {tuple(key): position for position, key in enumerate(self.counties.itertuples(index=False))}
+
+    def __len__(self):
+        return len(self.counties)
+
+    def position(self, state, county):
+        try:
+            return self.positions[(state, county)]
+        except KeyError:
+            raise KeyError(f"{county}, {state} has fewer than {MIN_YEARS} years of AQI data") from None
+
+    def _top_k(self, scores, k, exclude):
+        # Indices of the k highest scores per row, best first, skipping the query county itself.
+        scores = scores.copy()
+        scores[np.arange(len(exclude)), exclude] = -np.inf
+        k = min(k, scores.shape[1] - 1)
+        if k <= 0:
+            return np.empty((len(scores), 0), dtype=int)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+    def dtw(self, position, candidates, window=DTW_WINDOW):
+        # Banded dynamic time warping distance from one county to many at once:
+        # the recurrence runs over the years, vectorized over the candidates.
+        query, others = self.trajectories[position], self.trajectories[candidates]
+        n = len(self.years)
+        cost = np.full((len(candidates), n + 1, n + 1), np.inf)
+        cost[:, 0, 0] = 0
+        for i in range(1, n + 1):
+            for j in range(max(1, i - window), min(n, i + window) + 1):
+                step = np.linalg.norm(others[:, j - 1] - query[i - 1], axis=1)
+                cost[:, i, j] = step + np.minimum(
+                    np.minimum(cost[:, i - 1, j], cost[:, i, j - 1]), cost[:, i - 1, j - 1]
+                )
+        return cost[:, n, n]
+
+    def similar(self, state, county, k=10, method="cosine", candidates=DTW_CANDIDATES):
+        position = self.position(state, county)
+        scores = self.vectors[position : position + 1] @ self.vectors.T
+        if method == "cosine":
+            top = self._top_k(scores, k, [position])[0]
+            return self.counties.iloc[top].assign(Similarity=scores[0, top]).reset_index(drop=True)
+        # DTW-lite: rerank the best cosine matches by how well their yearly
+        # trajectories align when shifted by up to `DTW_WINDOW` years.
+        shortlist = self._top_k(scores, max(k, candidates), [position])[0]
+        distances = self.dtw(position, shortlist)
+        order = np.argsort(distances, kind="stable")[:k]
+        top = shortlist[order]
+        return (
+            self.counties.iloc[top]
+            .assign(**{"DTW distance": distances[order], "Similarity": scores[0, top]})
+            .reset_index(drop=True)
+        )
+
+    def similar_batch(self, k=10, chunk=1024):
+        # The k most similar counties of every county by cosine similarity, one
+        # matrix product per chunk of counties: (positions, similarities), both (n, k).
+        positions, similarities = [], []
+        for start in range(0, len(self), chunk):
+            rows = np.arange(start, min(start + chunk, len(self)))
+            scores = self.vectors[rows] @ self.vectors.T
+            top = self._top_k(scores, k, rows)
+            positions.append(top)
+            similarities.append(np.take_along_axis(scores, top, axis=1))
+        return np.vstack(positions), np.vstack(similarities)
+
+    def similar_batch_frame(self, k=10):
+        # Long-format table of the batch results, one row per (county, match).
+        positions, similarities = self.similar_batch(k)
+        result = self.counties.iloc[np.repeat(np.arange(len(self)), positions.shape[1])].reset_index(drop=True)
+        result["Rank"] = np.tile(np.arange(1, positions.shape[1] + 1), len(self))
+        matches = self.counties.iloc[positions.ravel()].reset_index(drop=True)
+        result["Similar State"], result["Similar County"] = matches["State"], matches["County"]
+        result["Similarity"] = similarities.ravel()
+        return result
+
+
+@st.cache_resource
+def get_county_index(_df_aqi, version):
+    return CountyIndex(_df_aqi)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the counties with the most similar AQI histories")
+    parser.add_argument("--k", type=int, default=10, help="matches per county")
+    parser.add_argument("--county", nargs=2, metavar=("STATE", "COUNTY"), help="one county instead of all of them")
+    parser.add_argument("--method", choices=["cosine", "dtw"], default="cosine", help="for --county")
+    parser.add_argument("--output", help="write the all-counties table as CSV")
+    args = parser.parse_args()
+
+    df_aqi = store.load_dataset("annual_aqi_by_county")
+    start = time.perf_counter()
+    index = CountyIndex(df_aqi)
+    print(f"indexed {len(index)} counties x {index.vectors.shape[1]} features in {time.perf_counter() - start:.3f} s")
+    start = time.perf_counter()
+    if args.county:
+        result = index.similar(*args.county, k=args.k, method=args.method)
+    else:
+        result = index.similar_batch_frame(args.k)
+    print(f"queried in {time.perf_counter() - start:.3f} s")
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"written to {args.output}")
+    else:
+        print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
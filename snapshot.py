@@ -0,0 +1,296 @@
+import argparse
+import atexit
+import datetime
+import functools
+import hashlib
+import json
+import os
+import pickle
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import cache
+import store
+
+
+SNAPSHOT_PATH = os.path.join(store.DERIVED_DIR, "warm_start.snapshot")
+FORMAT = 2
+MAGIC = b"AIRVIZ-SNAPSHOT\n"
+ALIGNMENT = 64
+# Warm objects kept per process (and written to the next snapshot); oldest are dropped first.
+MAX_OBJECTS = 256
+ENABLED = os.environ.get("AIRVIZ_SNAPSHOT", "1") != "0"
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    # Hashes of the modules whose objects are remembered: artifacts, statistics
+    # and correlation accumulators, catalogs and fitted models. Imported here
+    # since they import this module.
+    import artifacts
+    import correlation
+    import queries
+    import stats
+
+    return {module.__name__: store.module_sha256(module) for module in [artifacts, stats, correlation, queries]}
+
+
+def snapshot_version():
+    # Identity of everything a snapshot is built from; a snapshot taken before a
+    # deploy that changed any dataset, the GeoJSON, the code of the pickled
+    # objects or the pandas/numpy they need is simply ignored.
+    sources = {name: store.dataset_version(path) for name, path in store.DATASETS.items()}
+    geojson_stat = os.stat(store.GEOJSON_PATH)
+    sources["geojson"] = f"{geojson_stat.st_mtime_ns}-{geojson_stat.st_size}"
+    libraries = {"pandas": pd.__version__, "numpy": np.__version__}
+    payload = {"format": FORMAT, "sources": sources, "code": code_version(), "libraries": libraries}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _encode_column(series):
+    # Numeric, boolean and datetime columns are stored as raw buffers; everything
+    # else (strings) as int32 codes into a pickled array of categories, which
+    # for category columns are their own codes and categories.
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufcmM":
+        values = series.to_numpy()
+        return {"kind": "array", "dtype": values.dtype.str}, [values]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, categories = series.cat.codes.to_numpy(), series.cat.categories
+        meta = {"kind": "categorical", "dtype": "category", "ordered": bool(series.cat.ordered)}
+    else:
+        codes, categories = pd.factorize(series, use_na_sentinel=True)
+        meta = {"kind": "categorical", "dtype": str(series.dtype)}
+    return meta, [codes.astype(np.int32), np.frombuffer(pickle.dumps(categories, pickle.HIGHEST_PROTOCOL), np.uint8)]
+
+
+def write_snapshot(frames, objects, path=SNAPSHOT_PATH, version=None):
+    # Layout: magic, header length, JSON header, then every buffer aligned to
+    # ALIGNMENT bytes so numeric columns can be viewed in place after np.memmap.
+    header = {
+        "format": FORMAT,
+        "version": version or snapshot_version(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "frames": {},
+        "objects": {},
+    }
+    buffers = []
+    for name, frame in frames.items():
+        columns = []
+        for column in frame.columns:
+            meta, column_buffers = _encode_column(frame[column])
+            columns.append(
+                dict(meta, name=column, buffers=list(range(len(buffers), len(buffers) + len(column_buffers))))
+            )
+            buffers.extend(column_buffers)
+        header["frames"][name] = {"rows": len(frame), "columns": columns}
+    for name, value in objects.items():
+        header["objects"][name] = {"buffers": [len(buffers)]}
+        buffers.append(np.frombuffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), np.uint8))
+
+    # Buffer offsets are relative to the (aligned) end of the header, so the
+    # header never has to encode its own length.
+    extents = []
+    offset = 0
+    for buffer in buffers:
+        extents.append([offset, buffer.nbytes])
+        offset = _aligned(offset + buffer.nbytes)
+    header["extents"] = extents
+    header_bytes = json.dumps(header).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+        for buffer, (offset, nbytes) in zip(buffers, extents):
+            snapshot_file.seek(data_start + offset)
+            snapshot_file.write(np.ascontiguousarray(buffer).view(np.uint8).tobytes())
+    os.replace(temp_path, path)
+    return header
+
+
+class Snapshot:
+    def __init__(self, path=SNAPSHOT_PATH):
+        with open(path, "rb") as snapshot_file:
+            if snapshot_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an AirViz snapshot")
+            (header_length,) = struct.unpack("<Q", snapshot_file.read(8))
+            self.header = json.loads(snapshot_file.read(header_length))
+        self.data_start = _aligned(len(MAGIC) + 8 + header_length)
+        self.path = path
+        self.version = self.header["version"]
+        self.data = np.memmap(path, dtype=np.uint8, mode="r").view(np.ndarray)
+
+    def _buffer(self, index):
+        offset, nbytes = self.header["extents"][index]
+        start = self.data_start + offset
+        return self.data[start : start + nbytes]
+
+    @property
+    def frames(self):
+        return list(self.header["frames"])
+
+    @property
+    def objects(self):
+        return list(self.header["objects"])
+
+    def frame(self, name):
+        # Numeric columns are zero-copy views of the memory-mapped file; string
+        # columns are decoded from their codes back to their original dtype.
+        meta = self.header["frames"][name]
+        columns = {}
+        for column in meta["columns"]:
+            if column["kind"] == "array":
+                columns[column["name"]] = self._buffer(column["buffers"][0]).view(np.dtype(column["dtype"]))
+            else:
+                codes = self._buffer(column["buffers"][0]).view(np.int32)
+                categories = pickle.loads(self._buffer(column["buffers"][1]))
+                if column["dtype"] == "category":
+                    columns[column["name"]] = pd.Categorical.from_codes(
+                        codes, categories=categories, ordered=column["ordered"]
+                    )
+                else:
+                    # As a Series of the saved dtype: the frame constructor would
+                    # otherwise infer a string dtype for object columns.
+                    values = categories.array.take(codes, allow_fill=True)
+                    columns[column["name"]] = pd.Series(values, dtype=column["dtype"], copy=False)
+        return pd.DataFrame(columns, index=pd.RangeIndex(meta["rows"]), copy=False)
+
+    def object(self, name):
+        return pickle.loads(self._buffer(self.header["objects"][name]["buffers"][0]))
+
+
+@cache.resource
+def get_snapshot(path, version):
+    return Snapshot(path)
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    # None when snapshots are disabled, missing, or taken from different data.
+    if not ENABLED or not os.path.exists(path):
+        return None
+    snapshot = get_snapshot(path, store.dataset_version(path))
+    return snapshot if snapshot.version == snapshot_version() else None
+
+
+@cache.resource
+def warm_state():
+    # Process-wide registry of what this server has loaded or computed, so a
+    # snapshot written at shutdown contains everything the sessions warmed up.
+    return {"frames": {}, "objects": {}}
+
+
+def remember_frame(name, version, frame):
+    warm_state()["frames"][name] = (version, frame)
+    return frame
+
+
+def load_frame(name, version):
+    snapshot = load_snapshot()
+    if snapshot is None or name not in snapshot.frames:
+        return None
+    return remember_frame(name, version, snapshot.frame(name))
+
+
+def remember(key, value):
+    objects = warm_state()["objects"]
+    objects.pop(key, None)
+    objects[key] = value
+    while len(objects) > MAX_OBJECTS:
+        objects.pop(next(iter(objects)))
+    return value
+
+
+def recall(key):
+    objects = warm_state()["objects"]
+    if key in objects:
+        return objects[key]
+    snapshot = load_snapshot()
+    if snapshot is None or key not in snapshot.objects:
+        return None
+    return remember(key, snapshot.object(key))
+
+
+def collect():
+    # Loaded datasets, the GeoJSON, every precomputed artifact for the current
+    # dataset versions and code, and whatever else the running app has warmed up.
+    import artifacts
+
+    state = warm_state()
+    frames = {}
+    objects = {}
+    for name, path in store.DATASETS.items():
+        version = store.dataset_version(path)
+        warm_version, frame = state["frames"].get(name, (None, None))
+        frames[name] = frame if warm_version == version else store.load_dataset(name)
+        for artifact_name in store.artifact_names(f"{name}_"):
+            artifact = store.load_artifact(artifact_name, version, artifacts.code_version())
+            if artifact is not None:
+                objects[artifact_key(artifact_name, version)] = artifact
+    if geojson_key() not in state["objects"]:
+        with open(store.GEOJSON_PATH, "r") as geojson_file:
+            objects[geojson_key()] = json.load(geojson_file)
+    objects.update(state["objects"])
+    return frames, objects
+
+
+def artifact_key(artifact_name, version):
+    return f"artifact:{artifact_name}:{version}"
+
+
+def geojson_key(path=store.GEOJSON_PATH):
+    return f"geojson:{path}"
+
+
+def save_snapshot(path=SNAPSHOT_PATH):
+    frames, objects = collect()
+    return write_snapshot(frames, objects, path)
+
+
+def _save_on_exit():
+    try:
+        save_snapshot()
+    except Exception as error:
+        print(f"Could not write the warm-start snapshot: {error}")
+
+
+@st.cache_resource
+def install_shutdown_hook():
+    # Once per server process: write the snapshot when the server shuts down.
+    if ENABLED:
+        atexit.register(_save_on_exit)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write or inspect the warm-start snapshot")
+    parser.add_argument("command", choices=["save", "info"])
+    parser.add_argument("--path", default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+    if args.command == "save":
+        start = time.perf_counter()
+        header = save_snapshot(args.path)
+        print(
+            f"{len(header['frames'])} frames and {len(header['objects'])} objects -> {args.path} "
+            f"({os.path.getsize(args.path) / 2**20:.1f} MB in {time.perf_counter() - start:.2f} s)"
+        )
+        return
+    snapshot = Snapshot(args.path)
+    state = "current" if snapshot.version == snapshot_version() else "stale"
+    print(f"{args.path}: format {snapshot.header['format']}, created {snapshot.header['created']}, {state}")
+    for name, meta in snapshot.header["frames"].items():
+        print(f"  frame  {name} ({meta['rows']:,} rows x {len(meta['columns'])} columns)")
+    for name in snapshot.objects:
+        print(f"  object {name}")
+
+
+if __name__ == "__main__":
+    main()
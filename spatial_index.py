@@ -0,0 +1,70 @@
+import numpy as np
+import streamlit as st
+from sklearn.neighbors import BallTree
+
+import utils
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class SiteIndex:
+    def __init__(self, df):
+        self.sites = df.groupby(utils.site_columns, sort=True)[utils.site_attributes].first().reset_index()
+        self.tree = BallTree(np.radians(self.sites[["Latitude", "Longitude"]].to_numpy()), metric="haversine")
+
+    def __len__(self):
+        return len(self.sites)
+
+    def _points(self, lats, lons):
+        return np.radians(np.column_stack([np.atleast_1d(lats), np.atleast_1d(lons)]).astype(np.float64))
+
+    def nearest_batch(self, lats, lons, k=5):
+        # For thousands of query points at once: (distances_km, site positions), both shaped (n_points, k).
+        k = min(k, len(self))
+        if k == 0:
+            shape = (len(np.atleast_1d(lats)), 0)
+            return np.empty(shape), np.empty(shape, dtype=int)
+        distances, positions = self.tree.query(self._points(lats, lons), k=k)
+        return distances * EARTH_RADIUS_KM, positions
+
+    def within_batch(self, lats, lons, radius_km):
+        # One array of site positions (and distances) per query point, nearest first.
+        positions, distances = self.tree.query_radius(
+            self._points(lats, lons), r=radius_km / EARTH_RADIUS_KM, return_distance=True, sort_results=True
+        )
+        return [d * EARTH_RADIUS_KM for d in distances], positions
+
+    def nearest(self, lat, lon, k=5):
+        distances, positions = self.nearest_batch(lat, lon, k)
+        return self.sites.iloc[positions[0]].assign(**{"Distance (km)": distances[0]})
+
+    def within(self, lat, lon, radius_km):
+        distances, positions = self.within_batch(lat, lon, radius_km)
+        return self.sites.iloc[positions[0]].assign(**{"Distance (km)": distances[0]})
+
+
+def build_site_indexes(df):
+    # One index per (parameter, year): the set of monitors actually reporting.
+    return {key: SiteIndex(group) for key, group in df.groupby(["Parameter Name", "Year"], sort=False)}
+
+
+@st.cache_resource
+def get_site_index(_df, parameter, year, version):
+    filtered_df = _df[(_df["Parameter Name"] == parameter) & (_df["Year"] == year)]
+    return SiteIndex(filtered_df) if not filtered_df.empty else None
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def nearest_sites_frame(index, lats, lons, k=5):
+    # Long-format table of batch results, one row per (query point, neighbour).
+    distances, positions = index.nearest_batch(lats, lons, k)
+    result = index.sites.iloc[positions.ravel()].reset_index(drop=True)
+    result.insert(0, "Query", np.repeat(np.arange(positions.shape[0]), positions.shape[1]))
+    result["Distance (km)"] = distances.ravel()
+    return result
@@ -0,0 +1,236 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+
+DESCRIBE_PERCENTILES = [0.25, 0.5, 0.75]
+
+
+class QuantileSketch:
+    # Exact value counts while the column has few distinct values (days, AQI,
+    # years), then a DDSketch-style log-bucketed sketch: every quantile estimate
+    # is within `relative_accuracy` of the true value. Merging is adding counts.
+    def __init__(self, relative_accuracy=0.01, max_exact=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_exact = max_exact
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.exact = {}
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def bucket_keys(self, values):
+        return np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+
+    def bucket_value(self, key):
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def _add_counts(self, store, keys, counts):
+        for key, count in zip(np.asarray(keys).tolist(), np.asarray(counts).tolist()):
+            store[key] = store.get(key, 0) + count
+
+    def _add_to_buckets(self, values, counts=None):
+        # Totals per bucket are summed in numpy first (keys span a few thousand
+        # at most), so only the occupied buckets go through the dicts.
+        positive = values > 0
+        negative = values < 0
+        for buckets, selected, sign in ((self.positive, positive, 1), (self.negative, negative, -1)):
+            if selected.any():
+                keys = self.bucket_keys(sign * values[selected])
+                offset = keys.min()
+                totals = np.bincount(keys - offset, weights=None if counts is None else counts[selected])
+                occupied = np.flatnonzero(totals)
+                self._add_counts(buckets, occupied + offset, totals[occupied].astype(np.int64))
+        zero = ~positive & ~negative
+        self.zero_count += int(zero.sum() if counts is None else counts[zero].sum())
+
+    def _flush_exact(self):
+        values = np.fromiter(self.exact.keys(), dtype=np.float64, count=len(self.exact))
+        counts = np.fromiter(self.exact.values(), dtype=np.int64, count=len(self.exact))
+        self.exact = None
+        self._add_to_buckets(values, counts)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        if self.exact is not None and len(np.unique(values[: 4 * self.max_exact])) > self.max_exact:
+            # Plainly continuous: a sample shows it without sorting every value.
+            self._flush_exact()
+        if self.exact is None:
+            self._add_to_buckets(values)
+        else:
+            unique_values, counts = np.unique(values, return_counts=True)
+            distinct = len(self.exact) + len(unique_values)
+            if distinct > self.max_exact and len(unique_values) <= self.max_exact:
+                distinct = len(self.exact.keys() | set(unique_values.tolist()))
+            if distinct > self.max_exact:
+                self._flush_exact()
+                self._add_to_buckets(unique_values, counts)
+            else:
+                self._add_counts(self.exact, unique_values, counts)
+        self.count += int(values.size)
+        return self
+
+    def add_bucket_counts(self, keys, counts, negative=False):
+        if self.exact is not None:
+            self._flush_exact()
+        self._add_counts(self.negative if negative else self.positive, keys, counts)
+        self.count += int(np.sum(counts))
+        return self
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("cannot merge sketches with different relative accuracy")
+        if self.exact is not None and other.exact is not None:
+            self._add_counts(self.exact, list(other.exact.keys()), list(other.exact.values()))
+            if len(self.exact) > self.max_exact:
+                self._flush_exact()
+        else:
+            if self.exact is not None:
+                self._flush_exact()
+            if other.exact is not None:
+                values = np.fromiter(other.exact.keys(), dtype=np.float64, count=len(other.exact))
+                counts = np.fromiter(other.exact.values(), dtype=np.int64, count=len(other.exact))
+                self._add_to_buckets(values, counts)
+            else:
+                self._add_counts(self.positive, list(other.positive.keys()), list(other.positive.values()))
+                self._add_counts(self.negative, list(other.negative.keys()), list(other.negative.values()))
+                self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def quantiles(self, qs):
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+        ranks = np.asarray(qs, dtype=np.float64) * (self.count - 1)
+        if self.exact is not None:
+            # Linear interpolation between neighbouring ranks, like pandas.
+            values = np.array(sorted(self.exact))
+            cumulative = np.cumsum([self.exact[v] for v in values])
+            lower = values[np.searchsorted(cumulative, np.floor(ranks), side="right")]
+            upper = values[np.searchsorted(cumulative, np.ceil(ranks), side="right")]
+            return lower + (upper - lower) * (ranks - np.floor(ranks))
+        # Lay the buckets out in ascending value order: most negative first.
+        neg_keys = sorted(self.negative, reverse=True)
+        pos_keys = sorted(self.positive)
+        values = np.array([-self.bucket_value(k) for k in neg_keys] + [0.0] + [self.bucket_value(k) for k in pos_keys])
+        counts = np.array(
+            [self.negative[k] for k in neg_keys] + [self.zero_count] + [self.positive[k] for k in pos_keys]
+        )
+        return values[np.searchsorted(np.cumsum(counts), ranks, side="right")]
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+
+class ColumnSummary:
+    def __init__(self, relative_accuracy=0.01):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def _combine(self, count, mean, m2, minimum, maximum):
+        # Chan et al. parallel update of (count, mean, M2).
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        mean = values.mean()
+        self._combine(values.size, mean, float(((values - mean) ** 2).sum()), values.min(), values.max())
+        self.sketch.update(values)
+        return self
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def describe(self, percentiles=DESCRIBE_PERCENTILES):
+        empty = self.count == 0
+        stats = {
+            "count": float(self.count),
+            "mean": np.nan if empty else self.mean,
+            "std": self.std,
+            "min": np.nan if empty else self.min,
+        }
+        for q, value in zip(percentiles, self.sketch.quantiles(percentiles)):
+            # Sketch buckets are approximate; never report outside the exact range.
+            stats[f"{q * 100:g}%"] = value if empty else float(np.clip(value, self.min, self.max))
+        stats["max"] = np.nan if empty else self.max
+        return pd.Series(stats)
+
+
+class FrameSummary:
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.columns = {}
+
+    def update(self, df):
+        for column in df.select_dtypes(include=np.number).columns:
+            if column not in self.columns:
+                self.columns[column] = ColumnSummary(self.relative_accuracy)
+            self.columns[column].update(df[column].to_numpy())
+        return self
+
+    def merge(self, other):
+        for column, summary in other.columns.items():
+            if column not in self.columns:
+                self.columns[column] = ColumnSummary(self.relative_accuracy)
+            self.columns[column].merge(summary)
+        return self
+
+    def describe(self, percentiles=DESCRIBE_PERCENTILES):
+        return pd.DataFrame({column: summary.describe(percentiles) for column, summary in self.columns.items()})
+
+
+def summarize_frame(df, relative_accuracy=0.01):
+    return FrameSummary(relative_accuracy).update(df)
+
+
+def summarize_chunks(chunks, relative_accuracy=0.01):
+    # `chunks` is any iterable of DataFrames, e.g. pd.read_csv(..., chunksize=...)
+    # or one frame per partition, so the full dataset never has to fit in memory.
+    summary = FrameSummary(relative_accuracy)
+    for chunk in chunks:
+        summary.update(chunk)
+    return summary
+
+
+def trend_slopes(table):
+    # Least-squares slope of every row of `table` against its numeric column
+    # labels (years), skipping missing values: one masked computation for all
+    # rows. Rows with fewer than two values get NaN.
+    x = table.columns.to_numpy(dtype=float)
+    y = table.to_numpy(dtype=float)
+    present = np.isfinite(y)
+    counts = present.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = np.where(present, x, 0.0).sum(axis=1) / counts
+        y_mean = np.where(present, y, 0.0).sum(axis=1) / counts
+        dx = np.where(present, x - x_mean[:, None], 0.0)
+        dy = np.where(present, y - y_mean[:, None], 0.0)
+        slopes = (dx * dy).sum(axis=1) / (dx**2).sum(axis=1)
+    return pd.DataFrame({"slope": slopes, "count": counts}, index=table.index)
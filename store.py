@@ -0,0 +1,162 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+REFINED_DIR = "dataset/refined"
+DERIVED_DIR = "dataset/derived"
+MANIFEST_PATH = os.path.join(REFINED_DIR, "manifest.json")
+ARTIFACT_DIR = os.path.join(DERIVED_DIR, "artifacts")
+GEOJSON_PATH = "geojson/USA_state.geojson"
+
+DATASETS = {
+    "annual_conc_by_monitor": os.path.join(REFINED_DIR, "annual_conc_by_monitor.parquet"),
+    "annual_aqi_by_county": os.path.join(REFINED_DIR, "annual_aqi_by_county.csv"),
+}
+
+
+def read_file(filepath):
+    if "parquet" in filepath:
+        return pd.read_parquet(filepath)
+    elif "csv" in filepath:
+        return pd.read_csv(filepath)
+    else:
+        raise Exception("file format not supported")
+
+
+def write_file(df, filepath):
+    if "parquet" in filepath:
+        df.to_parquet(filepath, index=False)
+    elif "csv" in filepath:
+        df.to_csv(filepath, index=False)
+    else:
+        raise Exception("file format not supported")
+
+
+def read_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {"datasets": {}}
+    with open(MANIFEST_PATH, "r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def write_manifest(manifest):
+    # Write-then-rename so a running app never sees a half-written manifest.
+    temp_path = MANIFEST_PATH + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temp_path, MANIFEST_PATH)
+
+
+def dataset_name(filepath):
+    for name, path in DATASETS.items():
+        if os.path.normpath(path) == os.path.normpath(filepath):
+            return name
+    return None
+
+
+def dataset_revision(name):
+    return read_manifest()["datasets"].get(name, {}).get("revision", 0)
+
+
+def dataset_version(filepath):
+    # Base file identity plus the ingest revision of the dataset it belongs to.
+    stat = os.stat(filepath)
+    name = dataset_name(filepath)
+    revision = dataset_revision(name) if name else 0
+    return f"{stat.st_mtime_ns}-{stat.st_size}-{revision}"
+
+
+def partition_dir(name):
+    return os.path.join(REFINED_DIR, name)
+
+
+def partition_path(name, year):
+    extension = os.path.splitext(DATASETS[name])[1]
+    return os.path.join(partition_dir(name), f"year={year}{extension}")
+
+
+def partition_paths(filepath):
+    # Year partitions appended by `python ingest.py`, oldest first.
+    name = dataset_name(filepath)
+    partitions = read_manifest()["datasets"].get(name, {}).get("partitions", {})
+    return [partitions[year]["path"] for year in sorted(partitions)]
+
+
+def read_with_partitions(filepath):
+    partitions = partition_paths(filepath)
+    data = read_file(filepath)
+    if partitions:
+        data = pd.concat([data] + [read_file(path) for path in partitions], ignore_index=True)
+    return data
+
+
+def load_dataset(name):
+    return read_with_partitions(DATASETS[name])
+
+
+def file_columns(filepath):
+    if "parquet" in filepath:
+        return pq.read_schema(filepath).names
+    return pd.read_csv(filepath, nrows=0).columns.tolist()
+
+
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def module_sha256(module):
+    return file_sha256(inspect.getsourcefile(module))
+
+
+def modules_sha256(modules):
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(module_sha256(module).encode())
+    return digest.hexdigest()
+
+
+def artifact_path(name):
+    return os.path.join(ARTIFACT_DIR, f"{name}.pkl")
+
+
+def artifact_names(prefix=""):
+    if not os.path.isdir(ARTIFACT_DIR):
+        return []
+    names = (os.path.splitext(filename)[0] for filename in os.listdir(ARTIFACT_DIR) if filename.endswith(".pkl"))
+    return sorted(name for name in names if name.startswith(prefix))
+
+
+def save_artifact(name, value, version, code=None):
+    # `code` identifies the code that built the value, e.g. a modules_sha256.
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    temp_path = artifact_path(name) + ".tmp"
+    with open(temp_path, "wb") as artifact_file:
+        pickle.dump({"version": version, "code": code, "value": value}, artifact_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, artifact_path(name))
+
+
+def load_artifact(name, version=None, code=None):
+    # None when missing, unreadable (pickled by other pandas/numpy versions), or
+    # built for a different dataset version or by different code than asked for.
+    if not os.path.exists(artifact_path(name)):
+        return None
+    try:
+        with open(artifact_path(name), "rb") as artifact_file:
+            artifact = pickle.load(artifact_file)
+    except (pickle.UnpicklingError, ImportError, AttributeError, TypeError):
+        return None
+    if version is not None and artifact["version"] != version:
+        return None
+    if code is not None and artifact.get("code") != code:
+        return None
+    return artifact["value"]
@@ -0,0 +1,296 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import store
+
+
+CONC = "annual_conc_by_monitor"
+AQI = "annual_aqi_by_county"
+OUTPUT_DIR = "dataset/synthetic"
+YEARS = (1980, 2022)
+# Continental US, where the generated state centres are placed.
+LATITUDES, LONGITUDES = (25.0, 49.0), (-124.0, -67.0)
+
+# Per parameter: EPA parameter code, units, the share of sites measuring it, the
+# sample durations reported for it, the pollutant standard (None for
+# meteorology), and the distribution of its annual means: lognormal around
+# `mean`, changing by `trend` (a fraction) per year, or for meteorology (a
+# `spread` is given) normal around `mean`, changing by `trend` units per year.
+PARAMETER_FIELDS = ["code", "units", "share", "durations", "standard", "mean", "spread", "trend"]
+PPM, PPB = "Parts per million", "Parts per billion"
+UG_STP, UG_LC = "Micrograms/cubic meter (25 C)", "Micrograms/cubic meter (LC)"
+HOURLY, DAILY = ["1 HOUR"], ["24 HOUR"]
+PARAMETERS = {
+    name: dict(zip(PARAMETER_FIELDS, fields))
+    for name, *fields in [
+        ("Carbon monoxide", 42101, PPM, 0.2, HOURLY + ["8-HR RUN AVG END HOUR"], "CO 8-hour 1971", 0.9, 0, -0.04),
+        ("Sulfur dioxide", 42401, PPB, 0.2, HOURLY + ["3-HR BLK AVG", "24-HR BLK AVG"], "SO2 1-hour 2010", 6, 0, -0.05),
+        ("Nitrogen dioxide (NO2)", 42602, PPB, 0.2, HOURLY, "NO2 Annual 1971", 15, 0, -0.02),
+        ("Ozone", 44201, PPM, 0.55, HOURLY + ["8-HR RUN AVG BEGIN HOUR"], "Ozone 8-hour 2015", 0.03, 0, 0.002),
+        ("PM10 Total 0-10um STP", 81102, UG_STP, 0.35, DAILY + HOURLY, "PM10 24-hour 2006", 24, 0, -0.015),
+        ("PM10-2.5 - Local Conditions", 86101, UG_LC, 0.08, DAILY, None, 10, 0, -0.01),
+        ("PM2.5 - Local Conditions", 88101, UG_LC, 0.45, DAILY + HOURLY, "PM25 Annual 2012", 11, 0, -0.025),
+        ("Acceptable PM2.5 AQI & Speciation Mass", 88502, UG_LC, 0.2, DAILY + HOURLY, None, 10, 0, -0.02),
+        ("Lead (TSP) STP", 14129, UG_STP, 0.08, DAILY, "Lead 3-Month 2009", 0.3, 0, -0.08),
+        ("Barometric pressure", 64101, "Millibars", 0.12, HOURLY, None, 985, 20, 0.0),
+        ("Relative Humidity ", 62201, "Percent relative humidity", 0.15, HOURLY, None, 65, 12, 0.0),
+        ("Dew Point", 62103, "Degrees Fahrenheit", 0.08, HOURLY, None, 42, 10, 0.02),
+        ("Outdoor Temperature", 62101, "Degrees Fahrenheit", 0.2, HOURLY, None, 58, 9, 0.04),
+        ("Wind Direction - Resultant", 61104, "Degrees Compass", 0.2, HOURLY, None, 200, 60, 0.0),
+        ("Wind Speed - Resultant", 61103, "Knots", 0.2, HOURLY, None, 5, 2, 0.0),
+    ]
+}
+PERCENTILES = {"99th Percentile": 2.326, "98th Percentile": 2.054, "95th Percentile": 1.645}
+PERCENTILES.update({"90th Percentile": 1.282, "75th Percentile": 0.674, "50th Percentile": 0.0})
+PERCENTILES["10th Percentile"] = -1.282
+SAMPLES_PER_YEAR = {"1 HOUR": 8760, "24 HOUR": 122}
+METHODS = ["INSTRUMENTAL", "HI-VOL SSI", "FEDERAL REFERENCE METHOD", "ULTRAVIOLET", "CHEMILUMINESCENCE"]
+
+CONC_SCHEMA = pa.schema(
+    [("State Code", pa.int64()), ("County Code", pa.int64()), ("Site Num", pa.int64())]
+    + [("Parameter Code", pa.int64()), ("Latitude", pa.float64()), ("Longitude", pa.float64())]
+    + [("Parameter Name", pa.string()), ("Sample Duration", pa.string()), ("Pollutant Standard", pa.string())]
+    + [("Method Name", pa.string()), ("Year", pa.int64()), ("Units of Measure", pa.string())]
+    + [("Observation Count", pa.int64()), ("Observation Percent", pa.float64())]
+    + [(column, pa.float64()) for column in ["Arithmetic Mean", "Arithmetic Standard Dev", "1st Max Value"]]
+    + [(column, pa.float64()) for column in PERCENTILES]
+    + [("State Name", pa.string()), ("County Name", pa.string())]
+)
+AQI_CATEGORIES = [
+    "Good Days",
+    "Moderate Days",
+    "Unhealthy for Sensitive Groups Days",
+    "Unhealthy Days",
+    "Very Unhealthy Days",
+    "Hazardous Days",
+]
+AQI_POLLUTANTS = {"Days CO": 0.04, "Days NO2": 0.04, "Days Ozone": 0.55, "Days PM2.5": 0.3, "Days PM10": 0.07}
+AQI_SCHEMA = pa.schema(
+    [("State", pa.string()), ("County", pa.string()), ("Year", pa.int64()), ("Days with AQI", pa.int64())]
+    + [(column, pa.int64()) for column in AQI_CATEGORIES]
+    + [("Max AQI", pa.int64()), ("90th Percentile AQI", pa.int64()), ("Median AQI", pa.int64())]
+    + [(column, pa.int64()) for column in AQI_POLLUTANTS]
+)
+
+
+def counties(rng):
+    # The real State/County pairs from the bundled AQI data when it is there, so
+    # state and county cardinalities match the app's; made-up ones otherwise.
+    path = store.DATASETS[AQI]
+    if os.path.exists(path):
+        pairs = pd.read_csv(path, usecols=["State", "County"]).drop_duplicates()
+    else:
+        n_counties = rng.integers(5, 60, size=52)
+        pairs = pd.DataFrame(
+            [(f"State {s + 1:02d}", f"County {c + 1:03d}") for s in range(52) for c in range(n_counties[s])],
+            columns=["State", "County"],
+        )
+    pairs = pairs.sort_values(["State", "County"], ignore_index=True)
+    pairs["State Code"] = pairs["State"].astype("category").cat.codes.astype(np.int64) + 1
+    pairs["County Code"] = pairs.groupby("State").cumcount().astype(np.int64) * 2 + 1
+    # States get a centre in the continental US and counties scatter around it,
+    # so sites cluster spatially the way real monitors do.
+    centres = rng.uniform(
+        [LATITUDES[0], LONGITUDES[0]], [LATITUDES[1], LONGITUDES[1]], size=(pairs["State Code"].max(), 2)
+    )
+    offsets = rng.normal(0.0, [1.2, 1.8], size=(len(pairs), 2))
+    pairs["Latitude"] = centres[pairs["State Code"] - 1, 0] + offsets[:, 0]
+    pairs["Longitude"] = centres[pairs["State Code"] - 1, 1] + offsets[:, 1]
+    # Some counties are far busier than others.
+    pairs["weight"] = rng.pareto(1.5, size=len(pairs)) + 0.1
+    pairs["weight"] /= pairs["weight"].sum()
+    return pairs
+
+
+def expected_rows_per_site(years=YEARS, mean_active_years=18):
+    active = min(mean_active_years, years[1] - years[0] + 1)
+    return active * sum(spec["share"] * len(spec["durations"]) for spec in PARAMETERS.values())
+
+
+def _active_years(rng, n, years=YEARS, mean_active_years=18):
+    # Each site reports from a start year for a geometric number of years, with
+    # occasional gaps, like monitors being commissioned and retired.
+    n_years = years[1] - years[0] + 1
+    start = rng.integers(years[0] - mean_active_years // 2, years[1] + 1, size=n)
+    length = rng.geometric(1 / mean_active_years, size=n)
+    year = np.arange(years[0], years[1] + 1)
+    active = (year >= start[:, None]) & (year < (start + length)[:, None])
+    return active & (rng.random((n, n_years)) > 0.05)
+
+
+def conc_batch(rng, pairs, site_ids, years=YEARS):
+    n = len(site_ids)
+    county = rng.choice(len(pairs), size=n, p=pairs["weight"].to_numpy())
+    latitude = pairs["Latitude"].to_numpy()[county] + rng.normal(0.0, 0.15, size=n)
+    longitude = pairs["Longitude"].to_numpy()[county] + rng.normal(0.0, 0.15, size=n)
+    active = _active_years(rng, n, years)
+    year = np.arange(years[0], years[1] + 1)
+    frames = []
+    for parameter, spec in PARAMETERS.items():
+        measures = rng.random(n) < spec["share"]
+        site_level = rng.normal(0.0, 0.35, size=n)
+        method = rng.choice(METHODS, size=n).astype(object)
+        method[rng.random(n) < 0.03] = None
+        for duration in spec["durations"]:
+            site, year_index = np.nonzero(active & measures[:, None])
+            if not len(site):
+                continue
+            rows = len(site)
+            elapsed = year[year_index] - years[0]
+            noise = rng.normal(0.0, 0.1, size=rows)
+            if not spec["spread"]:
+                log_mean = np.log(spec["mean"]) + site_level[site] + elapsed * np.log1p(spec["trend"]) + noise
+                mean = np.exp(log_mean)
+                cv = rng.uniform(0.4, 0.9, size=rows)
+                sigma = np.sqrt(np.log1p(cv**2))
+                percentiles = {column: mean * np.exp(z * sigma - sigma**2 / 2) for column, z in PERCENTILES.items()}
+                std_dev = mean * cv
+            else:
+                mean = spec["mean"] + spec["spread"] * (site_level[site] + noise) + elapsed * spec["trend"]
+                std_dev = spec["spread"] * rng.uniform(0.5, 1.5, size=rows)
+                percentiles = {column: mean + z * std_dev for column, z in PERCENTILES.items()}
+            observation_percent = np.clip(rng.beta(8, 1, size=rows) * 100, 1, 100).round()
+            samples = SAMPLES_PER_YEAR.get(duration, 2920 if "8-HR" in duration else 365)
+            frame = {
+                "State Code": pairs["State Code"].to_numpy()[county][site],
+                "County Code": pairs["County Code"].to_numpy()[county][site],
+                "Site Num": site_ids[site],
+                "Parameter Code": np.full(rows, spec["code"]),
+                "Latitude": latitude[site].round(6),
+                "Longitude": longitude[site].round(6),
+                "Parameter Name": np.full(rows, parameter, dtype=object),
+                "Sample Duration": np.full(rows, duration, dtype=object),
+                "Pollutant Standard": np.full(rows, spec["standard"], dtype=object),
+                "Method Name": method[site],
+                "Year": year[year_index],
+                "Units of Measure": np.full(rows, spec["units"], dtype=object),
+                "Observation Count": np.maximum((samples * observation_percent / 100).astype(np.int64), 1),
+                "Observation Percent": observation_percent,
+                "Arithmetic Mean": mean,
+                "Arithmetic Standard Dev": std_dev,
+                "1st Max Value": percentiles["99th Percentile"] * rng.uniform(1.1, 1.8, size=rows),
+                **percentiles,
+                "State Name": pairs["State"].to_numpy()[county][site],
+                "County Name": pairs["County"].to_numpy()[county][site],
+            }
+            # Short records often lack the distribution statistics.
+            sparse = (observation_percent < 50) & (rng.random(rows) < 0.5)
+            for column in ["Arithmetic Standard Dev"] + list(PERCENTILES):
+                frame[column] = np.where(sparse, np.nan, frame[column])
+            frames.append(pd.DataFrame(frame))
+    if not frames:
+        return pd.DataFrame({field.name: pd.Series(dtype=object) for field in CONC_SCHEMA})
+    return pd.concat(frames, ignore_index=True)
+
+
+def aqi_batch(rng, pairs, years=YEARS, trend=-0.012):
+    # One row per county and year from simulated daily AQI values, so the
+    # category counts, percentiles and per-pollutant days are consistent.
+    n = len(pairs)
+    year = np.arange(years[0], years[1] + 1)
+    county, year_index = np.nonzero(rng.random((n, len(year))) < 0.84)
+    rows = len(county)
+    days = np.where(rng.random(rows) < 0.7, 365, rng.integers(20, 365, size=rows))
+    county_level = rng.lognormal(np.log(38.0), 0.3, size=n)
+    median = county_level[county] * (1 + trend) ** (year[year_index] - years[0])
+    season = 1 + 0.3 * np.sin(np.arange(366) * 2 * np.pi / 366)
+    daily = np.rint(median[:, None] * season * rng.lognormal(0.0, 0.45, size=(rows, 366)))
+    daily[np.arange(366) >= days[:, None]] = np.nan
+    frame = {
+        "State": pairs["State"].to_numpy()[county],
+        "County": pairs["County"].to_numpy()[county],
+        "Year": year[year_index],
+        "Days with AQI": days,
+    }
+    bounds = [0, 51, 101, 151, 201, 301, np.inf]
+    for category, low, high in zip(AQI_CATEGORIES, bounds[:-1], bounds[1:]):
+        frame[category] = ((daily >= low) & (daily < high)).sum(axis=1)
+    frame["Max AQI"] = np.nanmax(daily, axis=1)
+    frame["90th Percentile AQI"] = np.nanpercentile(daily, 90, axis=1)
+    frame["Median AQI"] = np.nanmedian(daily, axis=1)
+    pollutant_share = rng.dirichlet(np.array(list(AQI_POLLUTANTS.values())) * 20, size=n)[county]
+    pollutant_days = rng.multinomial(days, pollutant_share)
+    for index, column in enumerate(AQI_POLLUTANTS):
+        frame[column] = pollutant_days[:, index]
+    return pd.DataFrame(frame).astype({column: np.int64 for column in AQI_SCHEMA.names[2:]})
+
+
+def _write(frames, path, schema):
+    # One row group per frame; only the frame being written is ever in memory.
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    n_rows = 0
+    with pq.ParquetWriter(path, schema, compression="snappy") as writer:
+        for frame in frames:
+            writer.write_table(pa.Table.from_pandas(frame[schema.names], schema=schema, preserve_index=False))
+            n_rows += len(frame)
+    return n_rows
+
+
+def generate_conc(path, n_rows, batch_rows=1_000_000, seed=0):
+    rng = np.random.default_rng(seed)
+    pairs = counties(rng)
+    sites_per_batch = max(1, int(batch_rows / expected_rows_per_site()))
+
+    def batches():
+        remaining, next_site = n_rows, 1
+        while remaining > 0:
+            batch = conc_batch(rng, pairs, np.arange(next_site, next_site + sites_per_batch))
+            next_site += sites_per_batch
+            batch = batch.iloc[:remaining]
+            remaining -= len(batch)
+            yield batch
+
+    return _write(batches(), path, CONC_SCHEMA)
+
+
+def generate_aqi(path, n_rows, seed=0):
+    # Beyond the real number of counties, copies of them are added as new
+    # counties of the same states ("Jefferson 2", ...).
+    rng = np.random.default_rng(seed)
+    pairs = counties(rng)
+    rows_per_copy = len(pairs) * (YEARS[1] - YEARS[0] + 1) * 0.84
+
+    def batches():
+        remaining, copy = n_rows, 1
+        while remaining > 0:
+            batch_pairs = pairs if copy == 1 else pairs.assign(County=pairs["County"] + f" {copy}")
+            if remaining < rows_per_copy:
+                batch_pairs = batch_pairs.iloc[: max(1, int(remaining / rows_per_copy * len(pairs)) + 1)]
+            batch = aqi_batch(rng, batch_pairs).iloc[:remaining]
+            remaining -= len(batch)
+            copy += 1
+            yield batch
+
+    return _write(batches(), path, AQI_SCHEMA)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write EPA-shaped synthetic annual_conc_by_monitor and annual_aqi_by_county Parquet files"
+    )
+    parser.add_argument("--conc-rows", type=float, default=2e6, help="rows of monitor data, e.g. 1e8")
+    parser.add_argument("--aqi-rows", type=float, default=4e4, help="rows of county data")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--batch-rows", type=int, default=1_000_000, help="approximate rows per row group")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, generate in (
+        (CONC, lambda path: generate_conc(path, int(args.conc_rows), args.batch_rows, args.seed)),
+        (AQI, lambda path: generate_aqi(path, int(args.aqi_rows), args.seed)),
+    ):
+        start = time.perf_counter()
+        path = os.path.join(args.output_dir, f"{name}.parquet")
+        n_rows = generate(path)
+        size_mb = os.path.getsize(path) / 2**20
+        print(f"{path}: {n_rows:,} rows, {size_mb:,.1f} MB in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
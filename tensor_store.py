@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+
+METRICS = {
+    "Arithmetic Mean": "mean",
+    "Arithmetic Standard Dev": "mean",
+    "1st Max Value": "max",
+}
+DEFAULT_PATH = "dataset/derived/tensor_store"
+
+
+def preferred_sample_durations(df):
+    # Same rule the Forecast page uses: hourly data where it exists, otherwise
+    # the most common duration, so every (site, parameter, year) cell is comparable.
+    durations = {}
+    for parameter, counts in df.groupby("Parameter Name")["Sample Duration"].value_counts().groupby(level=0):
+        available = counts.index.get_level_values(1)
+        durations[parameter] = "1 HOUR" if "1 HOUR" in available else available[0]
+    return durations
+
+
+def _metric_filename(metric):
+    return metric.lower().replace(" ", "_") + ".npy"
+
+
+def build_tensor_store(df, path=DEFAULT_PATH, parameters=None, sample_durations=None):
+    parameters = list(parameters or utils.params)
+    df = df[df["Parameter Name"].isin(parameters)]
+    sample_durations = sample_durations or preferred_sample_durations(df)
+    df = df[df["Sample Duration"].to_numpy() == df["Parameter Name"].map(sample_durations).to_numpy()]
+
+    sites = df.groupby(utils.site_columns, sort=True)[utils.site_attributes].first().reset_index()
+    years = np.arange(int(df["Year"].min()), int(df["Year"].max()) + 1)
+    site_codes = pd.MultiIndex.from_frame(sites[utils.site_columns]).get_indexer(
+        pd.MultiIndex.from_frame(df[utils.site_columns])
+    )
+
+    grouped = (
+        df.assign(_site=site_codes, _parameter=pd.Categorical(df["Parameter Name"], categories=parameters).codes)
+        .groupby(["_site", "_parameter", "Year"], sort=False)
+        .agg(METRICS)
+        .reset_index()
+    )
+    site_index = grouped["_site"].to_numpy()
+    parameter_index = grouped["_parameter"].to_numpy()
+    year_index = grouped["Year"].to_numpy() - years[0]
+
+    os.makedirs(path, exist_ok=True)
+    shape = (len(sites), len(parameters), len(years))
+    for metric in METRICS:
+        array = np.lib.format.open_memmap(
+            os.path.join(path, _metric_filename(metric)), mode="w+", dtype=np.float32, shape=shape
+        )
+        array[:] = np.nan
+        array[site_index, parameter_index, year_index] = grouped[metric].to_numpy(dtype=np.float32)
+        array.flush()
+        del array
+
+    index = {
+        "parameters": parameters,
+        "years": years.tolist(),
+        "metrics": {metric: _metric_filename(metric) for metric in METRICS},
+        "sample_durations": sample_durations,
+        "sites": sites.to_dict(orient="list"),
+    }
+    with open(os.path.join(path, "index.json"), "w") as index_file:
+        json.dump(index, index_file)
+    return TensorStore(path)
+
+
+class TensorStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as index_file:
+            index = json.load(index_file)
+        self.parameters = index["parameters"]
+        self.years = np.array(index["years"])
+        self.sample_durations = index["sample_durations"]
+        self.sites = pd.DataFrame(index["sites"])
+        # Memory-mapped: opening is O(1) and only the slices touched are paged in.
+        self.arrays = {
+            metric: np.load(os.path.join(path, filename), mmap_mode="r")
+            for metric, filename in index["metrics"].items()
+        }
+        self.parameter_index = {parameter: i for i, parameter in enumerate(self.parameters)}
+        self.site_index = {
+            tuple(key): i for i, key in enumerate(self.sites[utils.site_columns].itertuples(index=False))
+        }
+        self.state_index = {state: group.to_numpy() for state, group in self.sites.groupby("State Name").groups.items()}
+        self.county_index = {
+            key: group.to_numpy() for key, group in self.sites.groupby(["State Name", "County Name"]).groups.items()
+        }
+
+    def year_position(self, year):
+        return int(year) - int(self.years[0])
+
+    def sites_in(self, state=None, county=None):
+        if state is None or state == "All":
+            return np.arange(len(self.sites))
+        if county is None or county == "All":
+            return self.state_index.get(state, np.array([], dtype=int))
+        return self.county_index.get((state, county), np.array([], dtype=int))
+
+    def series(self, metric, site, parameter):
+        # One monitor's full yearly series; `site` is a position or a utils.site_columns tuple.
+        if isinstance(site, tuple):
+            site = self.site_index[site]
+        return self.arrays[metric][site, self.parameter_index[parameter], :]
+
+    def cross_section(self, metric, parameter, year):
+        # Every monitor's value for one parameter and year.
+        return self.arrays[metric][:, self.parameter_index[parameter], self.year_position(year)]
+
+    def parameter_slab(self, metric, parameter, state=None, county=None):
+        # Sites x years for one parameter, optionally restricted to a state/county.
+        return self.arrays[metric][self.sites_in(state, county), self.parameter_index[parameter], :]
+
+    def regional_series(self, parameter, state=None, county=None):
+        # Yearly Mean/Std/Max over the selected sites, the aggregation the Trends page plots.
+        result = {"Year": self.years}
+        for metric, how in METRICS.items():
+            slab = self.parameter_slab(metric, parameter, state, county)
+            with np.errstate(all="ignore"):
+                present = ~np.isnan(slab)
+                if how == "max":
+                    result[metric] = np.where(
+                        present.any(axis=0), np.nanmax(np.where(present, slab, -np.inf), axis=0), np.nan
+                    )
+                else:
+                    result[metric] = np.nansum(slab, axis=0) / present.sum(axis=0)
+        return pd.DataFrame(result).dropna(subset=list(METRICS), how="all").reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the memory-mapped site x parameter x year tensor store")
+    parser.add_argument("--input", default="dataset/refined/annual_conc_by_monitor.parquet")
+    parser.add_argument("--output", default=DEFAULT_PATH)
+    args = parser.parse_args()
+    store = build_tensor_store(utils.load_data(args.input), args.output)
+    print(f"{len(store.sites)} sites x {len(store.parameters)} parameters x {len(store.years)} years -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
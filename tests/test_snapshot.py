@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import snapshot
+
+
+def round_trip(frame, tmp_path):
+    path = str(tmp_path / "test.snapshot")
+    snapshot.write_snapshot({"frame": frame}, {}, path, version="test")
+    return snapshot.Snapshot(path).frame("frame")
+
+
+def test_numeric_and_datetime_columns(tmp_path):
+    frame = pd.DataFrame(
+        {
+            "Year": np.array([2001, 2002, 2003], dtype=np.int64),
+            "Arithmetic Mean": [0.5, np.nan, 1.25],
+            "Exceedance": [True, False, True],
+            "Date": pd.to_datetime(["2001-01-01", "2002-06-30", "2003-12-31"]),
+        }
+    )
+    pd.testing.assert_frame_equal(round_trip(frame, tmp_path), frame)
+
+
+def test_object_column_with_none(tmp_path):
+    frame = pd.DataFrame({"County Name": pd.Series(["Los Angeles", None, "Kern", "Los Angeles"], dtype=object)})
+    restored = round_trip(frame, tmp_path)
+    assert restored["County Name"].dtype == object
+    assert restored["County Name"].tolist()[::2] == ["Los Angeles", "Kern"]
+    assert restored["County Name"].isna().tolist() == [False, True, False, False]
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_category_columns(tmp_path, ordered):
+    values = pd.Categorical(["b", "a", "b", None, "c"], categories=["c", "b", "a"], ordered=ordered)
+    frame = pd.DataFrame({"Parameter Name": values})
+    restored = round_trip(frame, tmp_path)
+    pd.testing.assert_frame_equal(restored, frame)
+    assert restored["Parameter Name"].cat.categories.tolist() == ["c", "b", "a"]
+    assert restored["Parameter Name"].cat.ordered == ordered
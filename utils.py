@@ -1,24 +1,51 @@
+import json
+
 import streamlit as st
-import pandas as pd
+import profiling
+import snapshot
+import store
 
 
-@st.cache_data
+@profiling.profiled()
 def load_data(filepath):
-    if "parquet" in filepath:
-        data = pd.read_parquet(filepath)
-    elif "csv" in filepath:
-        data = pd.read_csv(filepath)
-    else:
-        raise Exception("file format not supported")
+    return _load_data(filepath, dataset_version(filepath))
+
+
+@st.cache_data
+def _load_data(filepath, version):
+    # From the warm-start snapshot when one matches the current data, otherwise
+    # the base file plus any year partitions appended by `python ingest.py`.
+    name = store.dataset_name(filepath)
+    data = snapshot.load_frame(name, version) if name else None
+    if data is None:
+        data = store.read_with_partitions(filepath)
+        if name:
+            snapshot.remember_frame(name, version, data)
     return data
 
 
+def load_geojson(path=store.GEOJSON_PATH):
+    geojson = snapshot.recall(snapshot.geojson_key(path))
+    if geojson is None:
+        with open(path, "r") as geojson_file:
+            geojson = snapshot.remember(snapshot.geojson_key(path), json.load(geojson_file))
+    return geojson
+
+
+def dataset_version(filepath):
+    # Changes whenever the file is replaced or a year is ingested, so caches keyed on it never serve stale results.
+    return store.dataset_version(filepath)
+
+
 mapbox_layout = {
     "style": "carto-positron",
     "center": {"lat": 38.0902, "lon": -95.7129},
     "zoom": 2.6,
 }
 
+site_columns = ["State Code", "County Code", "Site Num"]
+site_attributes = ["State Name", "County Name", "Latitude", "Longitude"]
+
 
 params = [
     "Carbon monoxide",
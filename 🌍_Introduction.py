@@ -4,13 +4,21 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
 import json
+import os
 import plotly.graph_objects as go
 import hiplot as hip
 import utils
+import profiling
+import loader
+import cache
+import snapshot
+import api
 from streamlit_extras.app_logo import add_logo
 
 add_logo("airviz_image.png", height=30)
 utils.add_navigation()
+# Start loading the datasets and GeoJSON in the background while the page renders.
+startup = loader.start()
 
 st.set_option("deprecation.showPyplotGlobalUse", False)
 
@@ -143,14 +151,20 @@ if selected_param:
         st.markdown(table_content)
 
 
-st.session_state.df = utils.load_data("dataset/refined/annual_conc_by_monitor.parquet")
-st.session_state.df_aqi = utils.load_data("dataset/refined/annual_aqi_by_county.csv")
-
-with open("geojson/USA_state.geojson", "r") as geojson_file:
-    st.session_state.geojson_data = json.load(geojson_file)
+for name in loader.RESOURCES:
+    st.session_state[name] = startup.get(name)
+snapshot.install_shutdown_hook()
+if "AIRVIZ_API_PORT" in os.environ:
+    # Serve the HTTP API from this process, sharing its data and caches.
+    api.serve_in_background()
+with st.sidebar.expander("Startup load times"):
+    st.dataframe(startup.timings().round(3))
+with st.sidebar.expander("Query cache"):
+    st.dataframe(cache.get_cache().stats())
 
 st.session_state.mapbox_layout = {
     "style": "carto-positron",
     "center": {"lat": 38.0902, "lon": -95.7129},
     "zoom": 2.6,
 }
+profiling.debug_panel()